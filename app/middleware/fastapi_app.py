@@ -1,16 +1,42 @@
+import asyncio
+import contextvars
+import datetime
+import functools
+import itertools
+import json
+import math
 import os
-import requests
-import pandas as pd
-import yfinance as yf
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from config import ROOT_DIR
-import src.extract
-import src.extract.extract
-import src.transforms.aggregate
-import src.transforms.add_attribute
+from config import (
+    ROOT_DIR,
+    DB_WORKERS,
+    QUOTE_WORKERS,
+    PROFILE_DIR,
+    PROFILE_SLOW_MS,
+    PRICE_STORE_DIR,
+    RESPONSE_CACHE_MAXSIZE,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL,
+    TRANSACTION_STREAMS,
+)
+from src import database, extract, instrument, transform
+from src.pool import get_pool
+from src.positions import PositionEngine
+from src.price_cache import default_cache
+from src.valuation import GROUPS as VALUATION_GROUPS, ValuationEngine
+from app.middleware.response_cache import DataVersion, ResponseCache
+from app.middleware import streaming
 
 
 class inputData(BaseModel):
@@ -20,9 +46,255 @@ class inputData(BaseModel):
 templates = Jinja2Templates(directory="templates")
 db_file = os.path.join(ROOT_DIR, "app", "backend", "database.db")
 
+# Columns the holdings are grouped by for each attribute of the /overview request
+OVERVIEW_GROUPS = {
+    "isinId": ["isin", "isin_name"],
+    "accountId": ["isin", "account_name"],
+    "brokerId": ["isin", "broker_name"],
+}
+
 
 app = FastAPI(title="MyApp", description="Real Time Stock Price Tracker")
 
+response_cache = ResponseCache(
+    maxsize=RESPONSE_CACHE_MAXSIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL
+)
+
+# Bounded thread pools running the blocking sqlite3 and price provider calls,
+# so the event loop keeps serving the other clients meanwhile
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+quote_executor = ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix="quote")
+
+# Largest page of the paginated transaction listing
+MAX_PAGE_SIZE = 100_000
+
+# Slots of the transaction listings being streamed: a slow client keeps its
+# pooled connection for the whole stream, so the streams can't take them all
+stream_slots = asyncio.Semaphore(TRANSACTION_STREAMS)
+
+# Responses being computed, shared by the concurrent requests asking for the same one
+_in_flight = {}
+
+# Profiles of the slow requests, when a profile directory is configured
+profiler = instrument.SlowRequestProfiler(PROFILE_DIR, PROFILE_SLOW_MS / 1000) if PROFILE_DIR else None
+
+# Statistics of the caches and of the connection pool, exported by /metrics
+instrument.register_collector("price_cache", lambda: default_cache().stats())
+instrument.register_collector("response_cache", lambda: response_cache.stats())
+instrument.register_collector("pipeline_memo", lambda: _pipeline_memo_stats())
+instrument.register_collector("db_pool", lambda: get_pool(db_file).stats())
+
+
+_engine_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _position_engine() -> PositionEngine:
+    return PositionEngine(db_file)
+
+
+def position_engine() -> PositionEngine:
+    """Return the position engine of the database (created, and the database migrated, on first use)."""
+    # Concurrent first requests must not migrate the database twice
+    with _engine_lock:
+        return _position_engine()
+
+
+@functools.lru_cache(maxsize=None)
+def _valuation_engine() -> ValuationEngine:
+    # The price store imports pandas: only when the valuation is first asked
+    from src.price_provider import YFinanceProvider
+    from src.price_store import PriceStore
+
+    return ValuationEngine(db_file, PriceStore(PRICE_STORE_DIR, YFinanceProvider()))
+
+
+def valuation_engine() -> ValuationEngine:
+    """Return the valuation engine of the database (created, and the database migrated, on first use)."""
+    with _engine_lock:
+        return _valuation_engine()
+
+
+@functools.lru_cache(maxsize=None)
+def _migrated(path: str) -> str:
+    database.migrate(path)
+    return path
+
+
+def migrated_db_file() -> str:
+    """Return the database path, the database being migrated to the current schema on first use."""
+    with _engine_lock:
+        return _migrated(db_file)
+
+
+def _pipeline_memo_stats() -> dict:
+    """Return the statistics of the pipeline memo, without importing src.pipeline (and pandas) for them."""
+    pipeline = sys.modules.get("src.pipeline")
+    return pipeline.default_memo.stats() if pipeline is not None else {}
+
+
+@functools.lru_cache(maxsize=None)
+def data_version() -> DataVersion:
+    """Return the data version tracker of the database (created on first use)."""
+    return DataVersion(db_file)
+
+
+async def run_in(executor: ThreadPoolExecutor, function, *args):
+    """Run a blocking function in a thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    # Run it in a copy of the current context, so its spans are added to the request ones
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, function, *args))
+
+
+async def iterate_in(executor: ThreadPoolExecutor, iterator):
+    """Iterate a blocking iterator in a thread pool, one item at a time."""
+    iterator = iter(iterator)
+    done = object()
+    try:
+        while True:
+            item = await run_in(executor, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        # Client gone or stream finished: release the database cursor in the pool thread
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_in(executor, close)
+
+
+async def open_stream(executor: ThreadPoolExecutor, batches, encode, slots: asyncio.Semaphore) -> tuple:
+    """
+    Take one of the `slots` and read the first batch of a blocking iterator, before any response is sent.
+
+    A database error is raised here, so it becomes an error response rather
+    than a stream cut after the headers were sent.
+
+    Returns:
+        (chunks, release): the async iterator of the encoded batches, which holds
+        the slot until it ends, and the release of the slot (done once, also to call
+        after the response in case the chunks were never iterated).
+    """
+    await slots.acquire()
+    held = [True]
+
+    def release():
+        if held[0]:
+            held[0] = False
+            slots.release()
+
+    batches = iter(batches)
+    try:
+        first = await run_in(executor, next, batches, None)
+    except BaseException:
+        release()
+        close = getattr(batches, "close", None)
+        if close is not None:
+            await run_in(executor, close)
+        raise
+
+    async def chunks():
+        try:
+            head = [] if first is None else [first]
+            async for chunk in iterate_in(executor, encode(itertools.chain(head, batches))):
+                yield chunk
+        finally:
+            close = getattr(batches, "close", None)
+            if close is not None:
+                await run_in(executor, close)
+            release()
+
+    return chunks(), release
+
+
+async def single_flight(key, compute):
+    """Await `compute()`, or the same computation already started by a concurrent request for `key`."""
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(compute())
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # A cancelled client must not cancel the computation awaited by the others
+    return await asyncio.shield(future)
+
+
+def _holdings(attribute: str) -> dict:
+    """Apply the new transactions to the positions and return the holdings grouped by attribute."""
+    engine = position_engine()
+    engine.update()
+    return transform.group_by(OVERVIEW_GROUPS[attribute], engine.holdings())
+
+
+def _last_prices() -> dict:
+    """Return the last price of every ISIN of the database."""
+    return transform.add_last_price({"isin": extract.list_isins(db_file)})
+
+
+def _overview_body(holdings: dict, prices: dict) -> bytes:
+    """Merge the holdings with their last prices and serialize the result."""
+    result = transform.add_cumulative_return(transform.merge_dictionary(holdings, prices))
+    return json.dumps(jsonable_encoder(_json_safe(result))).encode()
+
+
+def _valuation(by: Optional[str]) -> dict:
+    """Value the new days and return the daily series of each account, broker or of the portfolio."""
+    engine = valuation_engine()
+    engine.update()
+    series = engine.series(by)
+    return {
+        "date": [str(date) for date in series["date"]],
+        "series": {
+            name: _json_safe({key: series[key][:, i].tolist() for key in ("value", "invested", "pnl")})
+            for i, name in enumerate(series["names"])
+        },
+    }
+
+
+def _json_safe(input_dict: dict) -> dict:
+    """Replace the NaN values (e.g. missing prices) by None, which JSON can represent."""
+    return {
+        key: [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+        for key, values in input_dict.items()
+    }
+
+
+def _route_path(request: Request) -> str:
+    """
+    Return the path template of the route which handled a request (e.g. "/items/{id}").
+
+    Metrics are labelled with it rather than with the request path, so that
+    unknown paths and path parameters don't create new series.
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Time the request, add its spans to a Server-Timing header and profile it if it is slow."""
+    start = time.perf_counter()
+    with instrument.collect_spans() as spans:
+        if profiler is not None:
+            with profiler.profile(lambda: f"{request.method} {_route_path(request)}"):
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+    seconds = time.perf_counter() - start
+
+    if instrument.is_enabled():
+        instrument.count(
+            "http_requests", method=request.method, path=_route_path(request), status=response.status_code
+        )
+        response.headers["Server-Timing"] = instrument.server_timing(spans, seconds)
+    return response
+
+
+@app.get("/metrics")
+def metrics():
+    """Spans, counters and cache statistics in the Prometheus text format."""
+    return PlainTextResponse(instrument.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 def read_root():
@@ -31,19 +303,92 @@ def read_root():
 
 
 @app.post("/overview")
-async def overview(request: inputData):
+async def overview(request: inputData, if_none_match: str = Header(None)):
     attribute = request.attribute
+    if attribute not in OVERVIEW_GROUPS:
+        raise HTTPException(status_code=400, detail=f"attribute must be one of {list(OVERVIEW_GROUPS)}")
 
-    dict_attribute = src.extract.extract.by_attribute(db_file, attribute)
-    df_attribute = pd.DataFrame(dict_attribute)
-    groupby_attribute = src.transforms.aggregate.sum_by_attribute(
-        attribute[:-2], df_attribute
-    )
-    result = src.transforms.add_attribute.last_price(
-        attribute[:-2], groupby_attribute
+    # Same attribute, same data and same prices: serve the cached response
+    # (PRAGMA data_version is read from memory, it doesn't need a thread)
+    key = ("overview", attribute, data_version().current(), default_cache().epoch)
+    entry = response_cache.get(key)
+    if entry is None:
+
+        async def compute():
+            # The positions and the prices are independent: get them concurrently
+            holdings, prices = await asyncio.gather(
+                run_in(db_executor, _holdings, attribute),
+                run_in(quote_executor, _last_prices),
+            )
+            body = await run_in(db_executor, _overview_body, holdings, prices)
+            return response_cache.put(key, body)
+
+        entry = await single_flight(key, compute)
+
+    return response_cache.response(entry, if_none_match)
+
+
+@app.get("/valuation")
+async def valuation(by: Optional[str] = Query(None, description="account_name, broker_name or none for the total")):
+    """Daily value, invested capital and P&L of the portfolio, by account or broker."""
+    if by is not None and by not in VALUATION_GROUPS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {list(VALUATION_GROUPS)}")
+    return await single_flight(("valuation", by), lambda: run_in(db_executor, _valuation, by))
+
+
+@app.get("/transactions")
+async def transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|arrow)$"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    isin: Optional[List[str]] = Query(None),
+    account: Optional[List[str]] = Query(None),
+    after: Optional[str] = Query(None, description="cursor 'YYYY-MM-DD:id' of the X-Next-Cursor header"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    Stream the transactions ordered by date and id, as NDJSON or as an Arrow IPC stream.
+
+    Rows are encoded batch by batch straight from the database cursor, so the
+    time to first byte and the memory used don't depend on the history size.
+    At most TRANSACTION_STREAMS listings are streamed at a time, the next ones
+    wait for one of them to end.
+    With `limit`, the X-Next-Cursor header gives the `after` value of the next
+    page (no header on the last page).
+    """
+    try:
+        position = streaming.parse_cursor(after) if after else None
+        for value in (start_date, end_date, position[0] if position else None):
+            if value is not None:
+                datetime.date.fromisoformat(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401  optional dependency of the Arrow format
+        except ImportError:
+            raise HTTPException(status_code=501, detail="The arrow format requires pyarrow")
+
+    filters = {"start_date": start_date, "end_date": end_date, "isins": isin, "accounts": account, "after": position}
+    headers = {}
+    encode, media_type = (
+        (streaming.arrow_chunks, streaming.ARROW_MEDIA_TYPE)
+        if format == "arrow"
+        else (streaming.ndjson_chunks, streaming.NDJSON_MEDIA_TYPE)
     )
+    try:
+        path = await run_in(db_executor, migrated_db_file)
+        if limit is not None:
+            next_position = await run_in(db_executor, functools.partial(extract.next_cursor, path, limit, **filters))
+            if next_position is not None:
+                headers["X-Next-Cursor"] = streaming.format_cursor(next_position)
 
-    return result
+        batches = extract.iter_transactions(path, limit=limit, **filters)
+        chunks, release = await open_stream(db_executor, batches, encode, stream_slots)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    return StreamingResponse(chunks, media_type=media_type, headers=headers, background=BackgroundTask(release))
 
 
 # @app.post("/get_stock_data")
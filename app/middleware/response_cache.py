@@ -0,0 +1,150 @@
+"""This module contains a bounded cache of serialized API responses with ETag support"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from fastapi import Response
+
+
+class DataVersion:
+    """
+    Cheap "has the database changed?" check based on SQLite PRAGMA data_version.
+
+    PRAGMA data_version changes whenever another connection commits a change
+    to the database file (from this process or any other one), and costs no
+    I/O. The connection used to read it is kept open and never writes, so
+    every commit is seen.
+
+    Args:
+        db_file (str): Path of the SQLite database.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        """Return the current data version of the database."""
+        with self._lock:
+            if self._conn is None:
+                uri = Path(self.db_file).resolve().as_uri() + "?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedResponse:
+    """Serialized body of a response, its ETag and its creation time."""
+
+    __slots__ = ("body", "etag", "media_type", "created_at")
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.media_type = media_type
+        self.created_at = time.monotonic()
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses, bounded in number of entries and in bytes.
+
+    Keys must include everything the response depends on (request parameters,
+    data version, price epoch...), so an entry never has to be invalidated:
+    changed data means a new key, and the old entries are evicted as the
+    least recently used ones. Entries older than `ttl` seconds are dropped
+    anyway, so data that no key tracks (e.g. prices expiring upstream) is
+    refreshed eventually.
+
+    Args:
+        maxsize (int): Maximum number of responses kept.
+        max_bytes (int): Maximum total size of the response bodies kept.
+        ttl (float): Number of seconds a response can be served (None: no limit).
+    """
+
+    def __init__(self, maxsize: int = 256, max_bytes: int = 16 * 1024 * 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key) -> CachedResponse:
+        """Return the cached response of a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry.created_at > self.ttl:
+                self._discard(key)
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(self, key, body: bytes, media_type: str = "application/json") -> CachedResponse:
+        """Cache a serialized response body (if it fits) and return its entry."""
+        entry = CachedResponse(body, media_type)
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+        return entry
+
+    def response(self, entry: CachedResponse, if_none_match: str = None) -> Response:
+        """Return the response of an entry: 304 Not Modified if the client already has it."""
+        headers = {"ETag": entry.etag}
+        if etag_matches(if_none_match, entry.etag):
+            with self._lock:
+                self._counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Return the cache statistics.
+
+        Returns:
+            dict: hits, misses, not_modified, evictions, expired, size (entries) and bytes.
+        """
+        with self._lock:
+            return {**self._counters, "size": len(self._entries), "bytes": self._bytes}
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Return whether an If-None-Match header value matches an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
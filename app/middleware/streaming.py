@@ -0,0 +1,60 @@
+"""This module contains the encoders of the streamed transaction listings (NDJSON and Arrow IPC)"""
+
+import io
+import json
+from src.extract import TRANSACTION_KEYS
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Type of each column of the listing (see extract.TRANSACTION_KEYS)
+TRANSACTION_TYPES = {key: "string" for key in TRANSACTION_KEYS}
+TRANSACTION_TYPES.update({"id": "int64", "quantity": "float64", "unit_price": "float64", "total_price": "float64"})
+
+
+def format_cursor(position: tuple) -> str:
+    """Encode a (transaction_date, id) position as a pagination cursor 'YYYY-MM-DD:id'."""
+    return f"{position[0]}:{position[1]}"
+
+
+def parse_cursor(cursor: str) -> tuple:
+    """Decode a pagination cursor 'YYYY-MM-DD:id', raising ValueError if it is malformed."""
+    transaction_date, _, transaction_id = cursor.rpartition(":")
+    if not transaction_date:
+        raise ValueError(f"Invalid cursor {cursor!r}, expected 'YYYY-MM-DD:id'")
+    return transaction_date, int(transaction_id)
+
+
+def ndjson_chunks(batches):
+    """Encode batches of listing rows as NDJSON, one bytes chunk per batch."""
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(TRANSACTION_KEYS, row))) + "\n" for row in rows).encode()
+
+
+def arrow_chunks(batches):
+    """
+    Encode batches of listing rows as an Arrow IPC stream, one bytes chunk per batch.
+
+    The schema is sent first (even for an empty listing), then one record
+    batch per batch of rows, then the end-of-stream marker.
+    """
+    import pyarrow as pa  # optional dependency, only needed for this format
+
+    schema = pa.schema([(key, getattr(pa, TRANSACTION_TYPES[key])()) for key in TRANSACTION_KEYS])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def flush() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield flush()
+    for rows in batches:
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        yield flush()
+    writer.close()
+    yield flush()
@@ -0,0 +1,95 @@
+"""Benchmark of the transaction containers: dict of lists vs dictionary-encoded CompactTransactions
+
+Measures the memory per transaction of each container (tracemalloc, after
+the extraction) and the speed of transform.group_by and of a filter on each.
+
+Usage: python -m benchmarks.bench_compact [--rows 1000000]
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import transactions_database
+from src import extract, transform
+
+
+GROUPS = [["isin", "account_name"], ["isin", "isin_name"], ["broker_name"]]
+
+
+def retained_memory(function) -> tuple:
+    """Return (result, memory in bytes still allocated by `function` once it returned)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def dict_filter(transactions: dict, account: str) -> dict:
+    """Keep the transactions of an account, on a dictionary of lists."""
+    rows = [i for i, name in enumerate(transactions["account_name"]) if name == account]
+    return {key: [values[i] for i in rows] for key, values in transactions.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_file = transactions_database(os.path.join(tempfile.gettempdir(), f"bench_compact_{args.rows}.db"), args.rows)
+
+    # Extraction time, before the containers below take their memory
+    results = {
+        "dict of lists (all_attribute)": measure(extract.all_attribute, db_file, repeat=args.repeat),
+        "DataFrame (all_attribute_columns)": measure(
+            extract.all_attribute_columns, db_file, "pandas", repeat=args.repeat
+        ),
+        "CompactTransactions": measure(extract.all_attribute_columns, db_file, "compact", repeat=args.repeat),
+    }
+    print_results(f"extraction, {args.rows} transactions", results, baseline="dict of lists (all_attribute)")
+
+    # Memory per transaction of each container
+    transactions, dict_bytes = retained_memory(lambda: extract.all_attribute(db_file))
+    _, frame_bytes = retained_memory(lambda: extract.all_attribute_columns(db_file, "pandas"))
+    compact, compact_bytes = retained_memory(lambda: extract.all_attribute_columns(db_file, "compact"))
+    rows = len(compact)
+
+    print(f"memory per transaction, {rows} transactions")
+    for name, size in (
+        ("dict of lists (all_attribute)", dict_bytes),
+        ("DataFrame (all_attribute_columns)", frame_bytes),
+        ("CompactTransactions", compact_bytes),
+    ):
+        print(f"    {name:<40} {size / rows:>10.1f} B  {size / 2**20:>10.1f} MiB")
+    print(f"    {'CompactTransactions.nbytes':<40} {compact.nbytes / rows:>10.1f} B")
+    print()
+
+    # The compact container gives the same groups
+    for attributes in GROUPS:
+        expected = transform.group_by(attributes, transactions)
+        result = transform.group_by(attributes, compact)
+        assert result[attributes[0]] == expected[attributes[0]], f"group_by {attributes} differs"
+
+    for attributes in GROUPS:
+        results = {
+            "dict of lists": measure(transform.group_by, attributes, transactions, repeat=args.repeat),
+            "compact": measure(transform.group_by, attributes, compact, repeat=args.repeat),
+        }
+        print_results(f"group_by {attributes}, {rows} transactions", results, baseline="dict of lists")
+
+    results = {
+        "dict of lists": measure(dict_filter, transactions, "PEA", repeat=args.repeat),
+        "compact": measure(compact.where, "account_name", ["PEA"], repeat=args.repeat),
+    }
+    print_results(f"filter account_name == 'PEA', {rows} transactions", results, baseline="dict of lists")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark of the dict and columnar extract readers
+
+Usage: python -m benchmarks.bench_extract [--rows 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+import pandas as pd
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import transactions_database
+from src import extract
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_file = transactions_database(
+        os.path.join(tempfile.gettempdir(), f"bench_extract_{args.rows}.db"), args.rows
+    )
+
+    results = {
+        "all_attribute -> DataFrame": measure(
+            lambda: pd.DataFrame(extract.all_attribute(db_file)), repeat=args.repeat
+        ),
+        "all_attribute (dict)": measure(extract.all_attribute, db_file, repeat=args.repeat),
+        "all_attribute_columns (pandas)": measure(
+            extract.all_attribute_columns, db_file, "pandas", repeat=args.repeat
+        ),
+        "all_attribute_columns (numpy)": measure(
+            extract.all_attribute_columns, db_file, "numpy", repeat=args.repeat
+        ),
+    }
+    print_results(f"extract, {args.rows} transactions", results, baseline="all_attribute -> DataFrame")
+
+
+if __name__ == "__main__":
+    main()
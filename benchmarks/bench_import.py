@@ -0,0 +1,119 @@
+"""Startup benchmark: import time of the entry modules, measured with `python -X importtime`
+
+Each module is imported in a fresh interpreter (best of --repeat runs) and
+compared with its budget. The run fails (exit code 1) when a module exceeds
+its budget, or when it imports a heavy dependency which must only be loaded
+on first use (pandas, yfinance, requests...).
+
+Usage: python -m benchmarks.bench_import [--repeat 5] [--tolerance 1.0] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import time budget (milliseconds) of each entry module
+BUDGETS = {
+    "config": 100,
+    "src.instrument": 50,
+    "src.extract": 250,
+    "src.transform": 250,
+    "src.database": 250,
+    "src.positions": 250,
+    "src.metric.compute_return": 250,
+    "src.metric.compute_risk_adjusted_return": 250,
+    "app.middleware.fastapi_app": 1000,
+}
+
+# Dependencies the entry modules must not import (they are imported on first use)
+LAZY_MODULES = ("pandas", "yfinance", "requests", "pyarrow", "streamlit")
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: {imported module: cumulative import time in microseconds}
+    """
+    env = {**os.environ, "ROOT_DIR": os.environ.get("ROOT_DIR", ROOT)}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines: "import time: <self us> | <cumulative us> | <indented module name>",
+    # each module listed after the modules it imports (indented one more level)
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative)))
+
+    # Keep the module and its imports, not the interpreter startup (site...)
+    end = max(i for i, (_, name, _) in enumerate(entries) if name == module)
+    depth = entries[end][0]
+    start = end
+    while start > 0 and entries[start - 1][0] > depth:
+        start -= 1
+    return {name: cumulative for _, name, cumulative in entries[start : end + 1]}
+
+
+def measure_module(module: str, repeat: int) -> tuple:
+    """Return (best import time in milliseconds, imported modules of the best run)."""
+    best = None
+    for _ in range(repeat):
+        times = import_times(module)
+        if best is None or times[module] < best[module]:
+            best = times
+    return best[module] / 1000, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module, the best one is kept")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="multiplier of the budgets (e.g. 1.5 on slow CI)")
+    parser.add_argument("--top", type=int, default=0, help="also print the N slowest imports of each module")
+    parser.add_argument("--filter", default=None, help="only measure the modules containing this string")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<45} {'import':>10} {'budget':>10}")
+    for module, budget in BUDGETS.items():
+        if args.filter and args.filter not in module:
+            continue
+
+        milliseconds, times = measure_module(module, args.repeat)
+        budget *= args.tolerance
+        heavy = [name for name in LAZY_MODULES if name in times]
+        status = "ok" if milliseconds <= budget and not heavy else "FAIL"
+        print(f"{module:<45} {milliseconds:>8.1f}ms {budget:>8.0f}ms  {status}")
+
+        if milliseconds > budget:
+            failures.append(f"{module} imports in {milliseconds:.1f}ms, budget {budget:.0f}ms")
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)} at load time")
+
+        if args.top:
+            slowest = sorted(((t, name) for name, t in times.items() if name != module), reverse=True)
+            for cumulative, name in slowest[: args.top]:
+                print(f"    {name:<41} {cumulative / 1000:>8.1f}ms")
+
+    if failures:
+        print("\nImport time regressions:")
+        for failure in failures:
+            print(f"    {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark of the /overview flow: dict-of-lists transforms vs the lazy DataFrame pipeline
+
+Usage: python -m benchmarks.bench_pipeline [--rows 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+import tracemalloc
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import price_provider, transactions_database
+from src import extract, transform
+from src.pipeline import Pipeline, StageMemo
+from src.price_cache import PriceCache
+
+
+ATTRIBUTES = ["isin", "account_name"]
+
+
+def dict_flow(db_file: str, cache: PriceCache) -> dict:
+    """The /overview flow with the dict-of-lists functions of src.transform."""
+    transactions = extract.all_attribute(db_file)
+    isins = transform.remove_duplicate(transform.keep_attribute(transactions, ["isin"]))
+    prices = transform.add_last_price(isins, cache)
+    grouped = transform.group_by(ATTRIBUTES, transactions)
+    return transform.add_cumulative_return(transform.merge_dictionary(grouped, prices))
+
+
+def overview_pipeline(db_file: str, cache: PriceCache) -> Pipeline:
+    """The /overview flow as a lazy pipeline."""
+    transactions = Pipeline.from_database(db_file)
+    prices = transactions.keep(["isin"]).unique().with_last_price(cache)
+    return transactions.group_by(ATTRIBUTES).merge(prices).with_cumulative_return()
+
+
+def peak_memory(function) -> float:
+    """Return the peak memory (MiB) allocated while calling `function`."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_file = transactions_database(
+        os.path.join(tempfile.gettempdir(), f"bench_pipeline_{args.rows}.db"), args.rows
+    )
+    cache = PriceCache(price_provider())
+    pipeline = overview_pipeline(db_file, cache)
+
+    # Warm the price cache, so its epoch is stable and every variant gets cached prices
+    dict_flow(db_file, cache)
+    memo = StageMemo()
+    pipeline.run(memo)
+
+    results = {
+        "transform (dict of lists)": measure(dict_flow, db_file, cache, repeat=args.repeat),
+        "pipeline (cold)": measure(lambda: pipeline.run(StageMemo()), repeat=args.repeat),
+        "pipeline (cold) + to_dict": measure(lambda: pipeline.to_dict(StageMemo()), repeat=args.repeat),
+        "pipeline (memoized)": measure(pipeline.run, memo, repeat=args.repeat),
+    }
+    print_results(f"/overview flow, {args.rows} transactions", results, baseline="transform (dict of lists)")
+
+    print("peak memory")
+    print(f"    {'transform (dict of lists)':<40} {peak_memory(lambda: dict_flow(db_file, cache)):>10.1f} MiB")
+    print(f"    {'pipeline (cold)':<40} {peak_memory(lambda: pipeline.run(StageMemo())):>10.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark of serial, concurrent and batched quote fetching against a slow fake provider
+
+Usage: python -m benchmarks.bench_quotes [--symbols 200] [--latency 0.05]
+"""
+
+import argparse
+from benchmarks.harness import measure, print_results
+from src.price_provider import FakeProvider
+from src.quote_fetcher import QuoteFetcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per provider call")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i:05d}" for i in range(args.symbols)]
+    prices = {symbol: 100.0 + i for i, symbol in enumerate(symbols)}
+    # One unknown symbol, to check that it doesn't fail the others
+    symbols.append("UNKNOWN")
+
+    single = FakeProvider(prices, latency=args.latency)
+    batched = FakeProvider(prices, latency=args.latency, supports_batch=True)
+
+    def serial():
+        for symbol in symbols:
+            try:
+                single.last_price(symbol)
+            except LookupError:
+                pass
+
+    results = {
+        "serial": measure(serial, repeat=args.repeat),
+        f"thread pool ({args.workers} workers)": measure(
+            QuoteFetcher(single, max_workers=args.workers).fetch, symbols, repeat=args.repeat
+        ),
+        f"thread pool, rate limit {args.workers * 5}/s": measure(
+            QuoteFetcher(single, max_workers=args.workers, rate=args.workers * 5).fetch, symbols, repeat=args.repeat
+        ),
+        "batched (100 symbols per call)": measure(
+            QuoteFetcher(batched, max_workers=args.workers).fetch, symbols, repeat=args.repeat
+        ),
+    }
+    print_results(
+        f"quotes, {len(symbols)} symbols, {args.latency * 1000:.0f} ms per provider call", results, baseline="serial"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Benchmark of the batched XIRR and TWR engine (src.metric.compute_position_return, src.returns)
+
+A synthetic book of positions with dated BUYs and SELLs is solved at once
+by xirr_array, and position by position by a scalar Newton's method with a
+bisection fallback (the reference, extrapolated from a sample). The XIRR of
+both are compared, and the diagnostics of the solver are printed. Then
+position_returns is timed on a synthetic transaction database, the first
+call reading the cash flows and the next ones using them from memory.
+
+Usage: python -m benchmarks.bench_returns [--positions 10000] [--flows 50] [--rows 100000]
+"""
+
+import argparse
+import collections
+import os
+import tempfile
+from datetime import date
+import numpy as np
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import ISINS, position_cash_flows, transactions_database
+from src import returns
+from src.metric.compute_position_return import twr_array, xirr_array
+
+
+# Day of the valuation of the synthetic book (its cash flows are between day 0 and 3650)
+END_DAY = 3_650
+
+
+def scalar_xirr(amounts: np.ndarray, days: np.ndarray, tolerance: float = 1e-10, max_iterations: int = 100) -> float:
+    """XIRR of one position: Newton's method from 10%, then bisection between -99.99% and 10000% if it fails."""
+    years = (days - days.min()) / 365
+    amounts = amounts / np.abs(amounts).sum()
+
+    def npv(rate):
+        return float(amounts @ (1 + rate) ** -years)
+
+    rate = 0.1
+    for _ in range(max_iterations):
+        factors = (1 + rate) ** -years
+        value = float(amounts @ factors)
+        if abs(value) <= tolerance:
+            return rate
+        rate -= value / float(-(years * amounts) @ factors / (1 + rate))
+        if not rate > -1:
+            break
+
+    low, high = -0.9999, 100.0
+    if npv(low) * npv(high) > 0:
+        return float("nan")
+    for _ in range(200):
+        rate = (low + high) / 2
+        if abs(npv(rate)) <= tolerance:
+            break
+        if npv(rate) * npv(low) > 0:
+            low = rate
+        else:
+            high = rate
+    return rate
+
+
+def per_position(amounts: np.ndarray, days: np.ndarray, positions: np.ndarray, n_positions: int) -> np.ndarray:
+    """XIRR of every position, one at a time (the reference)."""
+    bounds = np.searchsorted(positions, np.arange(n_positions + 1))
+    return np.array(
+        [scalar_xirr(amounts[start:stop], days[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, default=10_000)
+    parser.add_argument("--flows", type=int, default=50, help="BUYs and SELLs per position")
+    parser.add_argument("--sample", type=int, default=500, help="positions solved by the per-position loop")
+    parser.add_argument("--rows", type=int, default=100_000, help="transactions of the database")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    flows = position_cash_flows(args.positions, args.flows)
+    size = args.positions
+
+    # Cash flows of the XIRR: the transactions, then the value of each position at the end
+    market_value = flows["holding"].reshape(size, -1)[:, -1] * flows["end_price"]
+    amounts = np.concatenate([flows["amount"], market_value])
+    days = np.concatenate([flows["day"], np.full(size, END_DAY, dtype=np.float64)])
+    positions = np.concatenate([flows["position"], np.arange(size)])
+    order = np.argsort(positions, kind="stable")
+    amounts, days, positions = amounts[order], days[order], positions[order]
+
+    print(f"{size} positions x {args.flows} cash flows")
+    sample = min(args.sample, size)
+    in_sample = positions < sample
+    reference = measure(
+        per_position, amounts[in_sample], days[in_sample], positions[in_sample], sample, repeat=1
+    )
+    scale = size / sample
+    results = {
+        "per-position loop (extrapolated)": {"best": reference["best"] * scale, "mean": reference["mean"] * scale},
+        "xirr_array": measure(xirr_array, amounts, days, positions, size, repeat=args.repeat),
+        "twr_array": measure(
+            twr_array, flows["price"], flows["holding"], flows["position"], flows["end_price"], size,
+            repeat=args.repeat,
+        ),
+    }
+    print_results("returns of the whole book", results, baseline="per-position loop (extrapolated)")
+
+    # Same XIRR as the reference, and diagnostics of the solver
+    result = xirr_array(amounts, days, positions, size)
+    expected = per_position(amounts[in_sample], days[in_sample], positions[in_sample], sample)
+    rates = np.ma.filled(result["rate"], np.nan)[:sample]
+    both = np.isfinite(expected) & np.isfinite(rates)
+    print(f"max XIRR difference with the reference: {np.max(np.abs(rates[both] - expected[both]), initial=0):.2e} "
+          f"({np.count_nonzero(both)} of {sample} positions solved by both)")
+    print(f"status: {dict(collections.Counter(result['status'].tolist()))}")
+    print(f"bracketed: {int(result['bracketed'].sum())}, iterations: mean {result['iterations'].mean():.1f}, "
+          f"max {result['iterations'].max()}, max residual {np.nanmax(result['residual']):.1e}")
+    print()
+
+    db_file = transactions_database(os.path.join(tempfile.gettempdir(), f"bench_returns_{args.rows}.db"), args.rows)
+    prices = {isin: 100.0 + i for i, isin in enumerate(ISINS)}
+
+    def first_call():
+        returns._cash_flows.clear()
+        returns.position_returns(db_file, prices, date(2025, 1, 1))
+
+    results = {
+        "position_returns, cash flows read": measure(first_call, repeat=args.repeat),
+        "position_returns, cash flows in memory": measure(
+            returns.position_returns, db_file, prices, date(2025, 1, 1), repeat=args.repeat
+        ),
+    }
+    print_results(f"position_returns, {args.rows} transactions", results, baseline="position_returns, cash flows read")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Benchmark of the batched risk metrics engine against per-security calls
+
+Usage: python -m benchmarks.bench_risk_metrics [--securities 500] [--benchmarks 3] [--points 1000]
+"""
+
+import argparse
+import numpy as np
+from benchmarks.harness import measure, print_results
+from src.metric import compute_risk_adjusted_return
+from src.metric.compute_risk_matrix import risk_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--securities", type=int, default=500)
+    parser.add_argument("--benchmarks", type=int, default=3)
+    parser.add_argument("--points", type=int, default=1_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    securities = rng.normal(5, 10, (args.points, args.securities))
+    benchmarks = rng.normal(5, 10, (args.points, args.benchmarks))
+    risk_free_rate = rng.normal(2, 1, args.points)
+
+    def per_call_loop():
+        for i in range(args.securities):
+            security = securities[:, i].tolist()
+            for j in range(args.benchmarks):
+                benchmark = benchmarks[:, j].tolist()
+                compute_risk_adjusted_return.beta(security, benchmark)
+                compute_risk_adjusted_return.sharpe_ratio(security, benchmark)
+                compute_risk_adjusted_return.treynor_ratio(security, benchmark)
+                compute_risk_adjusted_return.jensen_alpha(security, benchmark, risk_free_rate.tolist())
+
+    results = {
+        "per-call loop (4 functions)": measure(per_call_loop, repeat=1),
+        "risk_metrics (batched)": measure(risk_metrics, securities, benchmarks, risk_free_rate, repeat=5),
+    }
+    print_results(
+        f"risk metrics, {args.securities} securities x {args.benchmarks} benchmarks x {args.points} points",
+        results,
+        baseline="per-call loop (4 functions)",
+    )
+
+
+if __name__ == "__main__":
+    main()
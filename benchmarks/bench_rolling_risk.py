@@ -0,0 +1,55 @@
+"""Benchmark of the O(1) rolling risk metrics against recomputing the window at every tick
+
+Both give the same metrics at every tick (see tests/test_rolling_risk.py).
+
+Usage: python -m benchmarks.bench_rolling_risk [--securities 100] [--points 5000] [--window 1000]
+"""
+
+import argparse
+import numpy as np
+from benchmarks.harness import measure, print_results
+from src.metric.compute_risk_matrix import risk_metrics
+from src.metric.compute_rolling_risk import RollingRiskMetrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--securities", type=int, default=100)
+    parser.add_argument("--points", type=int, default=5_000)
+    parser.add_argument("--window", type=int, default=1_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    securities = rng.normal(5, 10, (args.points, args.securities))
+    benchmark = rng.normal(5, 10, args.points)
+    risk_free_rate = rng.normal(2, 1, args.points)
+    metric_names = ["beta", "sharpe_ratio", "treynor_ratio", "jensen_alpha"]
+
+    def recompute():
+        last = None
+        # Start at the 3rd tick: beta needs at least 2 variations
+        for t in range(2, args.points):
+            first = max(0, t - args.window + 1)
+            last = risk_metrics(securities[first:t + 1], benchmark[first:t + 1], risk_free_rate[first:t + 1])
+        return {name: last[name][:, 0] for name in metric_names}
+
+    def rolling():
+        calculator = RollingRiskMetrics(args.window, args.securities)
+        for t in range(args.points):
+            calculator.update(securities[t], benchmark[t], risk_free_rate[t])
+            calculator.metrics()
+        return calculator.metrics()
+
+    results = {
+        "recompute window at every tick": measure(recompute, repeat=1),
+        "RollingRiskMetrics.update": measure(rolling, repeat=1),
+    }
+    print_results(
+        f"rolling risk metrics, {args.securities} securities, {args.points} ticks, window {args.window}",
+        results,
+        baseline="recompute window at every tick",
+    )
+
+
+if __name__ == "__main__":
+    main()
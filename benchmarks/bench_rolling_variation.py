@@ -0,0 +1,56 @@
+"""Benchmark of the vectorized rolling_variation against a pandas rolling apply
+
+Usage: python -m benchmarks.bench_rolling_variation [--series 10000] [--points 5000]
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from benchmarks.harness import measure, print_results
+from src.compute_function import rolling_variation
+
+
+def pandas_rolling_variation(values: np.ndarray, window_size: int) -> np.ndarray:
+    """Previous implementation: a Python lambda called for every window."""
+    return (
+        pd.DataFrame(values)
+        .rolling(window=window_size)
+        .apply(lambda x: (x[-1] - x[0]) / x[0], raw=True)
+        .to_numpy()[window_size - 1:]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--series", type=int, default=10_000)
+    parser.add_argument("--points", type=int, default=5_000)
+    parser.add_argument("--window", type=int, default=2)
+    parser.add_argument("--baseline-series", type=int, default=20,
+                        help="series used to time the pandas rolling apply (extrapolated)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (args.points, args.series)), axis=0))
+
+    # The rolling apply is far too slow for the full matrix: time a few series and extrapolate
+    sample = prices[:, :args.baseline_series]
+    baseline = measure(pandas_rolling_variation, sample, args.window, repeat=1)
+    scale = args.series / args.baseline_series
+    baseline = {key: value * scale for key, value in baseline.items() if key != "timings"}
+
+    assert np.allclose(
+        pandas_rolling_variation(sample, args.window), rolling_variation(sample, args.window), equal_nan=True
+    )
+
+    results = {
+        "pandas rolling apply (extrapolated)": baseline,
+        "rolling_variation (vectorized)": measure(rolling_variation, prices, args.window, repeat=3),
+    }
+    print_results(f"rolling_variation, {args.series} series x {args.points} points", results,
+                  baseline="pandas rolling apply (extrapolated)")
+    values = args.series * args.points
+    print(f"    vectorized throughput: {values / results['rolling_variation (vectorized)']['best'] / 1e6:,.0f} M values/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Scaling benchmark of the universe screener (src.screener) from 1 to N processes
+
+The synthetic universe (random walk prices) is screened against one benchmark
+with an increasing number of worker processes, from shared memory and from a
+memory-mapped .npy file. A per-security loop over the src.metric functions,
+on a sample of the universe, gives the single-threaded reference.
+
+Usage: python -m benchmarks.bench_screener [--securities 4000] [--days 2520] [--workers 1,2,4,8]
+"""
+
+import argparse
+import os
+import tempfile
+import numpy as np
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import price_histories
+from src.compute_function import rolling_variation
+from src.metric import compute_risk_adjusted_return
+from src.screener import screen
+
+
+def per_security(prices, benchmark):
+    """Screen securities one by one with the per-security functions (the reference)."""
+    benchmark_returns = rolling_variation(benchmark.tolist(), 2)
+    risk_free_rate = [0.0] * len(benchmark_returns)
+    for i in range(prices.shape[1]):
+        security_returns = rolling_variation(prices[:, i].tolist(), 2)
+        compute_risk_adjusted_return.beta(security_returns, benchmark_returns)
+        compute_risk_adjusted_return.sharpe_ratio(security_returns, benchmark_returns)
+        compute_risk_adjusted_return.treynor_ratio(security_returns, benchmark_returns)
+        compute_risk_adjusted_return.jensen_alpha(security_returns, benchmark_returns, risk_free_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--securities", type=int, default=4_000)
+    parser.add_argument("--days", type=int, default=2_520)
+    parser.add_argument("--workers", default=None, help="comma separated worker counts (default: 1, 2, 4... CPUs)")
+    parser.add_argument("--sample", type=int, default=200, help="securities screened by the per-security loop")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(count) for count in args.workers.split(",")]
+    else:
+        counts = sorted({min(2**i, cpus) for i in range(cpus.bit_length() + 1)})
+
+    universe = price_histories(args.securities + 1, args.days)
+    benchmark, prices = universe[:, 0], universe[:, 1:]
+    npy_file = os.path.join(tempfile.gettempdir(), f"bench_screener_{args.securities}_{args.days}.npy")
+    if not os.path.exists(npy_file):
+        np.save(npy_file, prices)
+
+    print(f"{cpus} CPU(s), {args.securities} securities x {args.days} days ({prices.nbytes / 2**20:.0f} MiB)")
+
+    sample = measure(per_security, prices[:, : args.sample], benchmark, repeat=1)
+    scale = args.securities / args.sample
+    results = {"per-security loop (extrapolated)": {"best": sample["best"] * scale, "mean": sample["mean"] * scale}}
+    # 1 worker computes in the calling process, more start a process pool
+    for workers in counts:
+        results[f"screen, {workers} worker(s), shared memory"] = measure(
+            screen, prices, benchmark, workers=workers, repeat=args.repeat
+        )
+    for workers in counts:
+        results[f"screen, {workers} worker(s), .npy memory map"] = measure(
+            screen, npy_file, benchmark, workers=workers, repeat=args.repeat
+        )
+    print_results("screening", results, baseline="per-security loop (extrapolated)")
+
+    # Speedup and efficiency against the first worker count
+    reference = results[f"screen, {counts[0]} worker(s), shared memory"]["best"]
+    print(f"scaling (shared memory, against {counts[0]} worker(s))")
+    for workers in counts:
+        speedup = reference / results[f"screen, {workers} worker(s), shared memory"]["best"]
+        efficiency = speedup * counts[0] / workers
+        print(f"    {workers:>3} worker(s)  speedup x{speedup:>5.2f}  efficiency {efficiency:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
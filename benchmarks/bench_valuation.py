@@ -0,0 +1,91 @@
+"""Benchmark of the daily portfolio valuation (src.valuation) against a loop over the dates
+
+The loop values each date like the dashboard would without the engine: it
+keeps the transactions up to the date, groups them with transform.group_by
+and values the quantities at the close prices of the date (timed on a sample
+of dates, then extrapolated). The engine values every date in one pass, and
+then extends the series by one new day.
+
+Usage: python -m benchmarks.bench_valuation [--rows 100000] [--sample 20]
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import numpy as np
+from benchmarks.harness import measure, print_results
+from benchmarks.synthetic import ISINS, price_provider, transactions_database
+from src import extract, transform
+from src.price_store import PriceStore
+from src.valuation import ValuationEngine
+
+
+def value_on(transactions: dict, date: str, prices: dict) -> dict:
+    """Value of each account on a date, from the transactions dated up to it (the reference)."""
+    rows = [i for i, value in enumerate(transactions["transaction_date"]) if value[:10] <= date]
+    selected = {key: [values[i] for i in rows] for key, values in transactions.items()}
+    holdings = transform.group_by(["isin", "account_name"], selected)
+    result = {}
+    for isin, account, quantity in zip(holdings["isin"], holdings["account_name"], holdings["quantity"]):
+        result[account] = result.get(account, 0.0) + quantity * prices[isin]
+    return result
+
+
+def value_loop(transactions: dict, dates: np.ndarray, close: np.ndarray):
+    """Value every date of `dates` one by one."""
+    for i, date in enumerate(dates):
+        value_on(transactions, str(date), dict(zip(ISINS, close[i])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=20, help="dates valued by the loop")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_file = transactions_database(os.path.join(tempfile.gettempdir(), f"bench_valuation_{args.rows}.db"), args.rows)
+    store = PriceStore(os.path.join(tempfile.gettempdir(), "bench_valuation_prices"), price_provider())
+    transactions = extract.all_attribute(db_file)
+    first = min(transactions["transaction_date"])[:10]
+    end = datetime.date.today() - datetime.timedelta(days=2)
+
+    # Prices stored beforehand: only the valuation is timed
+    dates, close = store.matrix(ISINS, first, end, fill="ffill")
+    print(f"{len(transactions['isin'])} transactions, {len(dates)} trading days")
+
+    sample = np.linspace(0, len(dates) - 1, min(args.sample, len(dates))).astype(int)
+    loop = measure(value_loop, transactions, dates[sample], close[sample], repeat=1)
+    scale = len(dates) / len(sample)
+
+    def up_to(day: datetime.date) -> ValuationEngine:
+        engine = ValuationEngine(db_file, store)
+        engine.update(day)
+        return engine
+
+    results = {
+        "loop over the dates (extrapolated)": {"best": loop["best"] * scale, "mean": loop["mean"] * scale},
+        "ValuationEngine, whole history": measure(lambda: up_to(end), repeat=args.repeat),
+        "ValuationEngine, one new day": measure(
+            lambda engine: engine.update(end), setup=lambda: up_to(end - datetime.timedelta(days=1)),
+            repeat=args.repeat,
+        ),
+    }
+    print_results("daily valuation by account", results, baseline="loop over the dates (extrapolated)")
+
+    # Same values as the loop on the sampled dates
+    series = ValuationEngine(db_file, store)
+    series.update(end)
+    result = series.series("account_name")
+    rows = np.searchsorted(result["date"], dates[sample])
+    error = 0.0
+    for row, i in zip(rows, sample):
+        expected = value_on(transactions, str(dates[i]), dict(zip(ISINS, close[i])))
+        for j, name in enumerate(result["names"]):
+            error = max(error, abs(result["value"][row, j] - expected[name]) / abs(expected[name]))
+    print(f"max relative difference with the loop: {error:.1e}")
+
+
+if __name__ == "__main__":
+    main()
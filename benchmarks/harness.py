@@ -0,0 +1,35 @@
+"""Timing helpers shared by the benchmarks"""
+
+import statistics
+import time
+
+
+def measure(function, *args, repeat: int = 3, setup=None, **kwargs) -> dict:
+    """
+    Call `function(*args, **kwargs)` `repeat` times and return its timings.
+
+    If `setup` is given, it is called (untimed) before each call and its result
+    is passed as the first argument, e.g. to give a fresh copy of an input that
+    `function` modifies in place.
+
+    Returns:
+        dict: best, mean and all timings in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        call_args = (setup(),) + args if setup is not None else args
+        start = time.perf_counter()
+        function(*call_args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    return {"best": min(timings), "mean": statistics.mean(timings), "timings": timings}
+
+
+def print_results(title: str, results: dict, baseline: str = None):
+    """Print the best timing of each benchmark and its speedup over `baseline`."""
+    print(title)
+    for name, result in results.items():
+        line = f"    {name:<40} {result['best'] * 1000:>10.1f} ms"
+        if baseline is not None and baseline in results:
+            line += f"  x{results[baseline]['best'] / result['best']:.1f}"
+        print(line)
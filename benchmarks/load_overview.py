@@ -0,0 +1,124 @@
+"""Load test of the /overview endpoint with concurrent clients and a stub price provider
+
+The app is called in process through httpx's ASGI transport (no network, no
+server to start). While the clients hammer /overview, a probe measures the
+latency of GET /, which stays low only if /overview never blocks the event loop.
+
+Usage:
+    python -m benchmarks.load_overview --clients 100 --requests 20 --rows 100k
+    python -m benchmarks.load_overview --no-cache --latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from benchmarks import synthetic
+
+os.environ.setdefault("ROOT_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import app.middleware.fastapi_app as fastapi_app  # noqa: E402
+from src.price_cache import PriceCache, set_default_cache  # noqa: E402
+
+
+ATTRIBUTES = ["isinId", "accountId", "brokerId"]
+
+
+async def client(http: httpx.AsyncClient, index: int, requests: int, latencies: list, statuses: dict):
+    """Send `requests` /overview requests one after the other, revalidating with the last ETag of each attribute."""
+    etags = {}
+    for i in range(requests):
+        attribute = ATTRIBUTES[(index + i) % len(ATTRIBUTES)]
+        headers = {"If-None-Match": etags[attribute]} if attribute in etags else {}
+        start = time.perf_counter()
+        response = await http.post("/overview", json={"attribute": attribute}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        etags[attribute] = response.headers.get("etag")
+
+
+async def probe(http: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    """Measure the latency of GET / until `stop` is set."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await http.get("/")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(clients: int, requests: int) -> dict:
+    transport = httpx.ASGITransport(app=fastapi_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        # First request: migrates the database and builds the positions once
+        start = time.perf_counter()
+        await http.post("/overview", json={"attribute": ATTRIBUTES[0]})
+        warmup = time.perf_counter() - start
+
+        latencies, probe_latencies, statuses = [], [], {}
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(http, stop, probe_latencies))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http, i, requests, latencies, statuses) for i in range(clients)))
+        seconds = time.perf_counter() - start
+
+        stop.set()
+        await probe_task
+
+    return {
+        "warmup": warmup,
+        "latencies": latencies,
+        "probe": probe_latencies,
+        "statuses": statuses,
+        "seconds": seconds,
+    }
+
+
+def summary(name: str, latencies: list):
+    values = np.array(latencies) * 1000
+    print(
+        f"    {name:<10} n={len(values):<6} p50={np.percentile(values, 50):8.1f} ms  "
+        f"p99={np.percentile(values, 99):8.1f} ms  max={values.max():8.1f} ms  mean={statistics.mean(values):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--rows", default="100k", help=f"transactions, among {', '.join(synthetic.SIZES)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub provider call")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "benchmarks-data"))
+    args = parser.parse_args()
+
+    # Synthetic database and stub provider
+    os.makedirs(args.data_dir, exist_ok=True)
+    rows = synthetic.SIZES[args.rows]
+    fastapi_app.db_file = synthetic.transactions_database(
+        os.path.join(args.data_dir, f"overview_{rows}.db"), rows
+    )
+    # Prices expire immediately: every computed response asks the provider again
+    set_default_cache(PriceCache(synthetic.price_provider(args.latency), ttl=0, stale_ttl=0))
+    if args.no_cache:
+        fastapi_app.response_cache.maxsize = 0
+
+    result = asyncio.run(run(args.clients, args.requests))
+
+    print(
+        f"{args.clients} clients x {args.requests} requests on {rows} transactions "
+        f"(provider latency {args.latency * 1000:.0f} ms, response cache {'off' if args.no_cache else 'on'})"
+    )
+    print(f"    first request (migration and positions build) {result['warmup'] * 1000:.1f} ms")
+    summary("/overview", result["latencies"])
+    summary("GET /", result["probe"])
+    print(f"    {len(result['latencies']) / result['seconds']:.0f} requests/sec, statuses {result['statuses']}")
+    print(f"    response cache {fastapi_app.response_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
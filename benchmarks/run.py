@@ -0,0 +1,334 @@
+"""Benchmark suite of the ingestion, extraction, transform and metric entry points
+
+Runs fully offline on deterministic synthetic data (see benchmarks.synthetic)
+and a fake price provider. Results are written as JSON so two commits can be
+compared.
+
+Usage:
+    python -m benchmarks.run --sizes 1k,100k --output results.json
+    python -m benchmarks.run --sizes 1k,100k --compare results.json --fail-on-regression
+    python -m benchmarks.run --list
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from benchmarks import synthetic
+from benchmarks.harness import measure
+from src import database, extract, returns, transform
+from src.compact import CompactTransactions
+from src.compute_function import rolling_variation
+from src.metric.compute_return import annualized_return_array, cumulative_return_array
+from src.metric.compute_risk_matrix import risk_metrics
+from src.pipeline import Pipeline, StageMemo
+from src.positions import PositionEngine
+from src.price_cache import PriceCache
+
+
+# Registered benchmarks: (group, name, max_rows, function)
+CASES = []
+
+# Number of days of the synthetic price histories used by the metric benchmarks
+PRICE_DAYS = 2_500
+
+
+def case(group: str, max_rows: int = None):
+    """Register a benchmark function, skipped for datasets larger than `max_rows`."""
+    def register(function):
+        CASES.append((group, function.__name__, max_rows, function))
+        return function
+    return register
+
+
+class Dataset:
+    """Inputs of the benchmarks for one dataset size, built lazily and cached on disk."""
+
+    def __init__(self, rows: int, data_dir: str, seed: int = 0):
+        self.rows = rows
+        self.data_dir = data_dir
+        self.seed = seed
+        os.makedirs(data_dir, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f"{name}_{self.rows}_{self.seed}")
+
+    @functools.cached_property
+    def csv_file(self) -> str:
+        return synthetic.transactions_csv(self.path("transactions") + ".csv", self.rows, self.seed)
+
+    @functools.cached_property
+    def db_file(self) -> str:
+        return synthetic.transactions_database(self.path("transactions") + ".db", self.rows, self.seed)
+
+    @functools.cached_property
+    def transactions(self) -> dict:
+        return extract.all_attribute(self.db_file)
+
+    @functools.cached_property
+    def compact(self) -> CompactTransactions:
+        return extract.all_attribute_columns(self.db_file, "compact")
+
+    @functools.cached_property
+    def cache(self) -> PriceCache:
+        return PriceCache(synthetic.price_provider())
+
+    @functools.cached_property
+    def prices(self) -> np.ndarray:
+        # Same number of values as transactions: rows / PRICE_DAYS securities over PRICE_DAYS days
+        return synthetic.price_histories(max(self.rows // PRICE_DAYS, 2), PRICE_DAYS, self.seed)
+
+    def fresh_database(self) -> str:
+        """Return the path of an empty database file (for ingestion benchmarks)."""
+        path = self.path("ingestion") + ".db"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return path
+
+
+def _copy(input_dict: dict) -> dict:
+    return {key: list(values) for key, values in input_dict.items()}
+
+
+# Ingestion
+@case("ingestion", max_rows=100_000)
+def create_from_csv(data: Dataset, repeat: int) -> dict:
+    return measure(lambda db_file: database.create_from_csv(data.csv_file, db_file),
+                   repeat=repeat, setup=data.fresh_database)
+
+
+@case("ingestion")
+def bulk_create_from_csv(data: Dataset, repeat: int) -> dict:
+    return measure(lambda db_file: database.bulk_create_from_csv(data.csv_file, db_file),
+                   repeat=repeat, setup=data.fresh_database)
+
+
+@case("ingestion")
+def incremental_from_csv_reimport(data: Dataset, repeat: int) -> dict:
+    # Re-importing an unchanged export: every row is skipped
+    db_file = data.fresh_database()
+    database.incremental_from_csv(data.csv_file, db_file)
+    return measure(database.incremental_from_csv, data.csv_file, db_file, repeat=repeat)
+
+
+# Extraction
+@case("extraction")
+def all_attribute(data: Dataset, repeat: int) -> dict:
+    return measure(extract.all_attribute, data.db_file, repeat=repeat)
+
+
+@case("extraction")
+def all_attribute_columns(data: Dataset, repeat: int) -> dict:
+    return measure(extract.all_attribute_columns, data.db_file, "pandas", repeat=repeat)
+
+
+@case("extraction")
+def all_attribute_compact(data: Dataset, repeat: int) -> dict:
+    return measure(extract.all_attribute_columns, data.db_file, "compact", repeat=repeat)
+
+
+@case("extraction")
+def iter_batches_group_by(data: Dataset, repeat: int) -> dict:
+    return measure(
+        lambda: transform.group_by_batches(["isin", "account_name"], extract.iter_batches(data.db_file, 100_000)),
+        repeat=repeat,
+    )
+
+
+# Transform steps of the /overview flow
+@case("transform")
+def keep_attribute(data: Dataset, repeat: int) -> dict:
+    return measure(transform.keep_attribute, data.transactions, ["isin", "isin_name"], repeat=repeat)
+
+
+@case("transform")
+def remove_duplicate(data: Dataset, repeat: int) -> dict:
+    # remove_duplicate modifies its input: give it a fresh copy each time
+    keys = transform.keep_attribute(data.transactions, ["isin"])
+    return measure(transform.remove_duplicate, repeat=repeat, setup=lambda: _copy(keys))
+
+
+@case("transform")
+def add_last_price(data: Dataset, repeat: int) -> dict:
+    isins = transform.remove_duplicate(_copy(transform.keep_attribute(data.transactions, ["isin"])))
+    return measure(transform.add_last_price, data.cache, repeat=repeat, setup=lambda: _copy(isins))
+
+
+@case("transform")
+def group_by(data: Dataset, repeat: int) -> dict:
+    return measure(transform.group_by, ["isin", "account_name"], data.transactions, repeat=repeat)
+
+
+@case("transform")
+def group_by_compact(data: Dataset, repeat: int) -> dict:
+    return measure(transform.group_by, ["isin", "account_name"], data.compact, repeat=repeat)
+
+
+@case("transform")
+def merge_dictionary(data: Dataset, repeat: int) -> dict:
+    grouped = transform.group_by(["isin", "account_name"], data.transactions)
+    prices = transform.add_last_price({"isin": list(set(data.transactions["isin"]))}, data.cache)
+    return measure(transform.merge_dictionary, grouped, prices, repeat=repeat)
+
+
+@case("transform")
+def add_cumulative_return(data: Dataset, repeat: int) -> dict:
+    grouped = transform.group_by(["isin", "account_name"], data.transactions)
+    prices = transform.add_last_price({"isin": list(set(data.transactions["isin"]))}, data.cache)
+    merged = transform.merge_dictionary(grouped, prices)
+    return measure(transform.add_cumulative_return, merged, repeat=repeat)
+
+
+@case("transform")
+def pipeline_overview(data: Dataset, repeat: int) -> dict:
+    # The whole /overview flow as a lazy pipeline, without memoized stages
+    transactions = Pipeline.from_database(data.db_file)
+    prices = transactions.keep(["isin"]).unique().with_last_price(data.cache)
+    overview = transactions.group_by(["isin", "account_name"]).merge(prices).with_cumulative_return()
+    overview.run(StageMemo())
+    return measure(lambda: overview.to_dict(StageMemo()), repeat=repeat)
+
+
+@case("transform")
+def positions_rebuild(data: Dataset, repeat: int) -> dict:
+    return measure(PositionEngine(data.db_file, "fifo").update, rebuild=True, repeat=repeat)
+
+
+@case("transform")
+def positions_update(data: Dataset, repeat: int) -> dict:
+    # No new transaction: the cost of an /overview request once the positions are stored
+    engine = PositionEngine(data.db_file, "fifo")
+    engine.update()
+    return measure(engine.update, repeat=repeat)
+
+
+# Metrics
+@case("metrics")
+def rolling_variation_matrix(data: Dataset, repeat: int) -> dict:
+    return measure(rolling_variation, data.prices, 2, repeat=repeat)
+
+
+@case("metrics")
+def risk_metrics_matrix(data: Dataset, repeat: int) -> dict:
+    benchmarks = data.prices[:, :2]
+    risk_free_rate = np.full(len(data.prices), 0.0001)
+    return measure(risk_metrics, data.prices, benchmarks, risk_free_rate, repeat=repeat)
+
+
+@case("metrics")
+def annualized_return_matrix(data: Dataset, repeat: int) -> dict:
+    days_held = np.arange(1, len(data.prices) + 1)[:, None]
+    return measure(
+        lambda: annualized_return_array(days_held, cumulative_return_array(data.prices, data.prices[0])),
+        repeat=repeat,
+    )
+
+
+@case("metrics")
+def position_returns(data: Dataset, repeat: int) -> dict:
+    # Cash flows read once: the cost of computing the returns again with new prices
+    prices = {isin: 100.0 + i for i, isin in enumerate(synthetic.ISINS)}
+    returns.position_returns(data.db_file, prices)
+    return measure(returns.position_returns, data.db_file, prices, repeat=repeat)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline_file: str, threshold: float) -> list:
+    """Print the ratio of each timing to the baseline and return the regressions."""
+    with open(baseline_file, encoding="utf-8") as file:
+        baseline = {(r["name"], r["size"]): r for r in json.load(file)["results"]}
+
+    regressions = []
+    print(f"\nComparison with {baseline_file} (ratio = current / baseline, best timings)")
+    for result in results:
+        previous = baseline.get((result["name"], result["size"]))
+        if previous is None:
+            continue
+        ratio = result["best"] / previous["best"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print(f"    {result['size']:>6} {result['group']:<11} {result['name']:<32} x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma separated, among {', '.join(synthetic.SIZES)}")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose group or name contains this")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "benchmarks-data"),
+                        help="where the synthetic datasets are cached")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare the results with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown ratio reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for group, name, max_rows, _ in CASES:
+            print(f"{group:<11} {name}" + (f" (up to {max_rows} rows)" if max_rows else ""))
+        return
+
+    results = []
+    for size in args.sizes.split(","):
+        data = Dataset(synthetic.SIZES[size], args.data_dir, args.seed)
+        for group, name, max_rows, function in CASES:
+            if args.filter not in group and args.filter not in name:
+                continue
+            if max_rows is not None and data.rows > max_rows:
+                continue
+            timing = function(data, args.repeat)
+            result = {
+                "group": group,
+                "name": name,
+                "size": size,
+                "rows": data.rows,
+                "best": timing["best"],
+                "mean": timing["mean"],
+                "rows_per_sec": data.rows / timing["best"] if timing["best"] else None,
+            }
+            results.append(result)
+            print(f"{size:>6} {group:<11} {name:<32} {timing['best'] * 1000:>10.3f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "commit": _git_commit(),
+                    "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Deterministic synthetic data used by the benchmarks"""
+
+import os
+import numpy as np
+import pandas as pd
+from src import database
+from src.price_provider import FakeProvider
+
+
+# Dataset sizes (number of transactions) selectable by name
+SIZES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+# ISIN codes of the fixed isin table created by src.database
+ISINS = [
+    "LU0131510165",
+    "LU1964632324",
+    "LU1832174962",
+    "LU1832175001",
+    "US0846707026",
+    "US5705351048",
+]
+
+# Transactions are generated and written by chunks of this many rows, to bound memory
+CHUNK_ROWS = 1_000_000
+
+
+def transactions(rows: int, seed: int = 0, start_id: int = 1) -> pd.DataFrame:
+    """
+    Generate `rows` synthetic transactions with the columns of transaction.csv.
+
+    The values reference the fixed rows of the isin, broker, account and order
+    tables created by src.database, so the output can be loaded as is.
+
+    Args:
+        rows (int): Number of transactions.
+        seed (int): Seed of the random generator (same seed, same data).
+        start_id (int): Id of the first transaction.
+
+    Returns:
+        pd.DataFrame: The transactions, sorted by date.
+    """
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(np.datetime64("2015-01-01", "D").astype(int),
+                                np.datetime64("2024-12-31", "D").astype(int), rows))
+
+    return pd.DataFrame({
+        "id": np.arange(start_id, start_id + rows),
+        "isinId": rng.integers(1, 7, rows),
+        "brokerId": rng.integers(1, 3, rows),
+        "accountId": rng.integers(1, 4, rows),
+        "transaction_date": days.astype("datetime64[D]").astype(str),
+        "orderId": np.where(rng.random(rows) < 0.8, 1, 2),
+        "quantity": rng.integers(1, 50, rows).astype(float),
+        "unit_price": np.round(rng.lognormal(np.log(100), 0.5, rows), 2),
+    })
+
+
+def transactions_csv(path: str, rows: int, seed: int = 0) -> str:
+    """
+    Write `rows` synthetic transactions to the CSV file `path` (if missing) and return the path.
+
+    Rows are generated and written by chunks of CHUNK_ROWS, so even the 10M
+    rows dataset never needs more than one chunk in memory.
+    """
+    if not os.path.exists(path):
+        with open(f"{path}.tmp", "w", encoding="utf-8", newline="") as file:
+            for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+                df = transactions(min(CHUNK_ROWS, rows - start), seed=seed + chunk, start_id=start + 1)
+                df.to_csv(file, index=False, header=chunk == 0)
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+def transactions_database(path: str, rows: int, seed: int = 0) -> str:
+    """Build the SQLite database `path` (if missing) with `rows` synthetic transactions and return the path."""
+    if not os.path.exists(path):
+        csv_file = transactions_csv(f"{path}.csv", rows, seed)
+        database.bulk_create_from_csv(csv_file, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        os.remove(csv_file)
+    return path
+
+
+def price_histories(n_securities: int, n_days: int, seed: int = 0) -> np.ndarray:
+    """
+    Generate daily prices of `n_securities` securities over `n_days` days.
+
+    Returns:
+        np.ndarray: Prices (random walks starting at 100), shape (n_days, n_securities).
+    """
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, (n_days, n_securities)), axis=0))
+
+
+def position_cash_flows(n_positions: int, n_flows: int, seed: int = 0) -> dict:
+    """
+    Generate the cash flows of `n_positions` positions with `n_flows` BUYs or SELLs each, over 10 years.
+
+    Every position buys at random dates and prices (random walks), and sells
+    a part of its holding one time out of five.
+
+    Returns:
+        dict: Arrays sorted by position then day, in the form of src.returns.cash_flows
+              (position, day, amount, price, holding), and end_price (one per position).
+    """
+    rng = np.random.default_rng(seed)
+    days = np.sort(rng.integers(0, 3_650, (n_positions, n_flows)), axis=1)
+    gaps = np.diff(days, axis=1, prepend=0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0.0003 * gaps, 0.012 * np.sqrt(gaps)), axis=1))
+    end_price = prices[:, -1] * np.exp(rng.normal(0.0, 0.05, n_positions))
+
+    # Quantity of each flow: a BUY, or a SELL of a part of the holding
+    quantities = np.empty((n_positions, n_flows))
+    holding = np.zeros(n_positions)
+    for i in range(n_flows):
+        sell = (rng.random(n_positions) < 0.2) & (holding > 0)
+        sold = np.floor(holding * rng.uniform(0.1, 0.9, n_positions))
+        quantity = np.where(sell, -sold, rng.integers(1, 100, n_positions))
+        holding += quantity
+        quantities[:, i] = quantity
+
+    return {
+        "position": np.repeat(np.arange(n_positions), n_flows),
+        "day": days.ravel().astype(np.float64),
+        "amount": (-quantities * prices).ravel(),
+        "price": prices.ravel(),
+        "holding": np.cumsum(quantities, axis=1).ravel(),
+        "end_price": end_price,
+    }
+
+
+def price_provider(latency: float = 0.0) -> FakeProvider:
+    """Return an offline provider with a price for every ISIN of the synthetic transactions."""
+    return FakeProvider({isin: 100.0 + i for i, isin in enumerate(ISINS)}, latency=latency, supports_batch=True)
@@ -10,3 +10,27 @@ load_dotenv()
 # Access environment variables
 ROOT_DIR = os.getenv("ROOT_DIR")
 DB_FILE = os.getenv("DB_FILE")
+
+# Local store of daily prices (see src.price_store)
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(ROOT_DIR or ".", "data", "prices"))
+
+# SQLite file persisting the last prices of the default price cache (see src.price_cache)
+PRICE_CACHE_DB = os.getenv("PRICE_CACHE_DB", os.path.join(ROOT_DIR or ".", "data", "price_cache.db"))
+
+# Cache of the /overview responses (see app.middleware.response_cache)
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "256"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+
+# Threads running the blocking database and price provider work of the FastAPI app
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+QUOTE_WORKERS = int(os.getenv("QUOTE_WORKERS", "4"))
+
+# Transaction listings streamed at the same time: each one holds a pooled
+# database connection until it ends, the next ones wait for a free slot
+TRANSACTION_STREAMS = int(os.getenv("TRANSACTION_STREAMS", "2"))
+
+# Instrumentation of the FastAPI app (see src.instrument): profiles of the
+# requests slower than PROFILE_SLOW_MS milliseconds are written to PROFILE_DIR
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
@@ -1,7 +1,9 @@
+import datetime
 from src.metric import compute_risk_adjusted_return
 from src.metric import compute_return
-import yfinance as yf
-from config import ROOT_DIR
+from src.price_provider import YFinanceProvider
+from src.price_store import PriceStore
+from config import ROOT_DIR, PRICE_STORE_DIR
 
 
 print(ROOT_DIR)
@@ -36,12 +38,13 @@ nb_years = 10
 a = compute_return.required_annualized_return(current_price, required_price, nb_years)
 # print(a)
 
-df = yf.download(["TSLA", "PEP"], period="5y", interval="1mo")
+# Daily prices are read from the local store, only missing days are downloaded
+store = PriceStore(PRICE_STORE_DIR, YFinanceProvider())
+today = datetime.date.today()
 
-close = df.Close
+dates, close = store.matrix(["TSLA", "PEP"], today - datetime.timedelta(days=5 * 365), today)
 # print(close)
 
 
-tsla = yf.Ticker("TSLA")
-history = tsla.history(start="2024-06-01")
-print(history.Open[1])
+history = store.history("TSLA", "2024-06-01", today)
+print(history.open.iloc[1])
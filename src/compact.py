@@ -0,0 +1,340 @@
+"""This module contains a compact, dictionary-encoded container of transactions"""
+
+import math
+import sys
+from typing import TYPE_CHECKING
+import numpy as np
+from src.positions import EPSILON
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Keys of all_attribute stored as codes into a table of distinct values,
+# grouped by dimension: the keys of a dimension share the same codes
+DIMENSIONS = {
+    "date": ["transaction_date"],
+    "isin": ["isin", "isin_name", "isin_type"],
+    "broker": ["broker_name", "broker_country"],
+    "account": ["account_number", "account_name"],
+    "order": ["order_type"],
+}
+
+# Keys of all_attribute stored as float arrays
+MEASURES = ["quantity", "unit_price"]
+
+# Keys computed from the measures when read
+COMPUTED = ["total_price"]
+
+# Largest number of possible groups (product of the distinct values of the attributes)
+# numbered in an int64 by CompactTransactions.group_by
+MAX_GROUP_NUMBER = 2**62
+
+
+def cost_prices(quantity, total_price, bought_quantity, bought_total) -> np.ndarray:
+    """
+    Return the cost price of groups of transactions from their net sums and the sums of their BUYs.
+
+    It is the average price of the transactions in the direction of the
+    position (the BUY price of a long position, the SELL price of a short one),
+    so the sales don't skew it as the net total price / net quantity would,
+    and NaN for a closed position. For the average cost or FIFO cost basis of
+    the positions, see src.positions.
+    """
+    quantity, total_price = np.asarray(quantity, dtype=float), np.asarray(total_price, dtype=float)
+    bought_quantity, bought_total = np.asarray(bought_quantity, dtype=float), np.asarray(bought_total, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bought_price = bought_total / bought_quantity
+        sold_price = (bought_total - total_price) / (bought_quantity - quantity)
+    return np.where(quantity > EPSILON, bought_price, np.where(quantity < -EPSILON, sold_price, np.nan))
+
+
+def code_dtype(size: int) -> np.dtype:
+    """Return the smallest unsigned integer dtype able to index a table of `size` values."""
+    return np.min_scalar_type(max(size - 1, 0))
+
+
+def encode(values) -> tuple:
+    """
+    Dictionary-encode a sequence of hashable values.
+
+    Returns:
+        tuple: (codes, table) where `table[codes]` gives back the values, and
+               the table lists the distinct values in order of appearance.
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64)
+    table = np.empty(len(index), dtype=object)
+    table[:] = list(index)
+    return codes.astype(code_dtype(len(table))), table
+
+
+class CompactTransactions:
+    """
+    Transactions with their text columns dictionary-encoded.
+
+    The all_attribute result repeats the same few ISIN, broker, account and
+    order type strings on every row. Here each dimension (isin, broker...)
+    is held once as small tables of values, and every row only stores one
+    small integer code per dimension (uint8 for less than 256 values), next
+    to the float64 quantity and unit price: about 20 bytes per transaction
+    instead of hundreds for a dictionary of lists.
+
+    Filters and group-bys are computed on the tiny tables and applied to the
+    rows through the codes with NumPy, without decoding any string.
+    Containers returned by `select` and `where` share the tables (and the
+    arrays when possible) with the original one.
+
+    Args:
+        dimensions (dict): {dimension: (codes, {key: table of values})}, see DIMENSIONS.
+        measures (dict): {key: float array}, see MEASURES.
+        keys (list): Keys of the container, in column order (default: dimension keys, then measures).
+    """
+
+    def __init__(self, dimensions: dict, measures: dict, keys: list = None):
+        self._dimensions = {}
+        for name, (codes, tables) in dimensions.items():
+            size = max((len(table) for table in tables.values()), default=0)
+            codes = np.asarray(codes)
+            self._dimensions[name] = (codes.astype(code_dtype(size), copy=False), tables)
+        self._measures = {key: np.asarray(values, dtype=np.float64) for key, values in measures.items()}
+
+        # Dimension of each key
+        self._key_dimension = {key: name for name, (_, tables) in self._dimensions.items() for key in tables}
+
+        if keys is None:
+            keys = list(self._key_dimension) + list(self._measures)
+            if all(key in self._measures for key in MEASURES):
+                keys += COMPUTED
+        self.keys = list(keys)
+
+    # Construction
+    @classmethod
+    def from_dict(cls, input_dict: dict) -> "CompactTransactions":
+        """Encode a dictionary of lists with the keys of all_attribute (or a subset of them)."""
+        dimensions = {}
+        for name, dimension_keys in DIMENSIONS.items():
+            present = [key for key in dimension_keys if key in input_dict]
+            if not present:
+                continue
+            # Encode the rows of the dimension as tuples, so its keys share their codes
+            codes, rows = encode(zip(*(input_dict[key] for key in present)))
+            tables = {}
+            for i, key in enumerate(present):
+                table = np.empty(len(rows), dtype=object)
+                table[:] = [row[i] for row in rows]
+                tables[key] = table
+            dimensions[name] = (codes, tables)
+
+        measures = {key: input_dict[key] for key in MEASURES if key in input_dict}
+        keys = [key for key in input_dict if key in measures or any(key in d for d in DIMENSIONS.values())]
+        keys += [key for key in COMPUTED if key in input_dict and key not in keys]
+        return cls(dimensions, measures, keys)
+
+    # Access
+    def __len__(self) -> int:
+        for codes, _ in self._dimensions.values():
+            return len(codes)
+        for values in self._measures.values():
+            return len(values)
+        return 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        """Return the decoded values of a key."""
+        if key not in self.keys:
+            raise KeyError(key)
+        if key in self._key_dimension:
+            codes, table = self.codes(key)
+            return table[codes]
+        if key == "total_price" and key not in self._measures:
+            return self._measures["quantity"] * self._measures["unit_price"]
+        return self._measures[key]
+
+    def codes(self, key: str) -> tuple:
+        """Return the (codes, table of values) of a dimension key."""
+        codes, tables = self._dimensions[self._key_dimension[key]]
+        return codes, tables[key]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the arrays and the tables of values (strings included), in bytes."""
+        total = sum(codes.nbytes for codes, _ in self._dimensions.values())
+        total += sum(values.nbytes for values in self._measures.values())
+        for _, tables in self._dimensions.values():
+            for table in tables.values():
+                total += table.nbytes + sum(sys.getsizeof(value) for value in table)
+        return total
+
+    # Filters
+    def select(self, keys: list) -> "CompactTransactions":
+        """Return the transactions with only the given keys (the arrays are shared, not copied)."""
+        keys = [key for key in keys if key in self.keys]
+        dimensions = {}
+        for name, (codes, tables) in self._dimensions.items():
+            kept = {key: table for key, table in tables.items() if key in keys}
+            if kept:
+                dimensions[name] = (codes, kept)
+        measures = dict(self._measures)
+        if not any(key in keys for key in COMPUTED):
+            measures = {key: values for key, values in measures.items() if key in keys}
+        return CompactTransactions(dimensions, measures, keys)
+
+    def take(self, rows) -> "CompactTransactions":
+        """Return the transactions selected by a boolean mask or an array of row positions."""
+        dimensions = {name: (codes[rows], tables) for name, (codes, tables) in self._dimensions.items()}
+        measures = {key: values[rows] for key, values in self._measures.items()}
+        return CompactTransactions(dimensions, measures, self.keys)
+
+    def mask(self, key: str, values) -> np.ndarray:
+        """Return the boolean mask of the transactions whose `key` is one of `values`."""
+        if key in self._measures or key in COMPUTED:
+            return np.isin(self[key], list(values))
+        codes, table = self.codes(key)
+        wanted = set(values)
+        # Test the few values of the table, then index the result by the codes
+        matches = np.fromiter((value in wanted for value in table), dtype=bool, count=len(table))
+        return matches[codes]
+
+    def where(self, key: str, values) -> "CompactTransactions":
+        """Return the transactions whose `key` is one of `values`."""
+        return self.take(self.mask(key, values))
+
+    def between(self, key: str, start=None, end=None) -> "CompactTransactions":
+        """Return the transactions whose `key` is between `start` and `end` (included), e.g. ISO dates."""
+        codes, table = self.codes(key)
+        matches = np.fromiter(
+            (
+                value is not None and (start is None or value >= start) and (end is None or value <= end)
+                for value in table
+            ),
+            dtype=bool,
+            count=len(table),
+        )
+        return self.take(matches[codes])
+
+    # Aggregations
+    def distinct(self, keys: list = None) -> dict:
+        """
+        Return the distinct values of each key (like transform.remove_duplicate).
+
+        Only the values of the table used by at least one transaction are kept.
+        """
+        result = {}
+        for key in self.keys if keys is None else keys:
+            if key in self._key_dimension:
+                codes, table = self.codes(key)
+                used = np.bincount(codes, minlength=len(table)) > 0
+                result[key] = list(dict.fromkeys(table[used].tolist()))
+            else:
+                result[key] = np.unique(self[key]).tolist()
+        return result
+
+    def group_by(self, attributes: list) -> dict:
+        """
+        Sum the quantity and total price by attributes, SELLs subtracted (same result as transform.group_by).
+
+        Every attribute is mapped to the rank of its value among the sorted
+        distinct values (computed on its table), the ranks are combined into
+        one group number per transaction, and the sums are computed with
+        np.bincount. Transactions with a None attribute are left out, like
+        pandas does with NaN group keys.
+
+        Returns:
+            dict: The attributes, quantity, cost_price and total_price of each group, sorted by attributes.
+        """
+        quantity = self._measures["quantity"]
+        total_price = self["total_price"]
+        bought_quantity, bought_total = quantity, total_price
+        if "order_type" in self._key_dimension:
+            codes, table = self.codes("order_type")
+            sign = np.where(table == "SELL", -1.0, 1.0)[codes]
+            bought_quantity, bought_total = np.where(sign > 0, quantity, 0.0), np.where(sign > 0, total_price, 0.0)
+            quantity, total_price = quantity * sign, total_price * sign
+
+        # Rank of each attribute value of the transactions
+        valid = np.ones(len(self), dtype=bool)
+        levels, all_ranks = [], []
+        for key in attributes:
+            level, ranks = self._ranks(key)
+            valid &= ranks >= 0
+            levels.append(level)
+            all_ranks.append(ranks)
+        weights = [values[valid] for values in (quantity, total_price, bought_quantity, bought_total)]
+        sizes = [max(len(level), 1) for level in levels]
+        size = math.prod(sizes)
+
+        if size <= MAX_GROUP_NUMBER:
+            # Group number of each transaction, combining the ranks
+            groups = np.zeros(np.count_nonzero(valid), dtype=np.int64)
+            for level_size, ranks in zip(sizes, all_ranks):
+                groups = groups * level_size + ranks[valid]
+            if size <= 4 * len(groups) + 1024:
+                # Few possible groups: sum directly into one slot per group number
+                counts = np.bincount(groups, minlength=size)
+                present = np.flatnonzero(counts)
+                sums = [np.bincount(groups, weights=values, minlength=size)[present] for values in weights]
+            else:
+                present, groups = np.unique(groups, return_inverse=True)
+                sums = [np.bincount(groups, weights=values, minlength=len(present)) for values in weights]
+
+            # Decode the group numbers back to the ranks of the attribute values
+            present_ranks = []
+            for level_size in reversed(sizes):
+                present, ranks = np.divmod(present, level_size)
+                present_ranks.insert(0, ranks)
+        else:
+            # Too many possible groups for an int64 group number: find the distinct rows of ranks
+            stacked = np.stack([ranks[valid] for ranks in all_ranks], axis=1)
+            present, groups = np.unique(stacked, axis=0, return_inverse=True)
+            groups = groups.reshape(-1)
+            sums = [np.bincount(groups, weights=values, minlength=len(present)) for values in weights]
+            present_ranks = list(present.T)
+
+        # Decode the ranks back to the attribute values
+        result = {}
+        for key, level, ranks in zip(attributes, levels, present_ranks):
+            values = np.empty(len(level), dtype=object)
+            values[:] = level
+            result[key] = values[ranks].tolist()
+
+        quantity, total_price = sums[0], sums[1]
+        result["quantity"] = quantity.tolist()
+        result["cost_price"] = cost_prices(*sums).tolist()
+        result["total_price"] = total_price.tolist()
+        return result
+
+    # Conversions
+    def to_dict(self) -> dict:
+        """Decode the transactions to a dictionary of lists, like extract.all_attribute."""
+        return {key: self[key].tolist() for key in self.keys}
+
+    def to_frame(self) -> "pd.DataFrame":
+        """Return the transactions as a DataFrame, the dimension keys as categorical columns (no decoding)."""
+        import pandas as pd
+
+        columns = {}
+        for key in self.keys:
+            if key in self._key_dimension:
+                level, ranks = self._ranks(key)
+                columns[key] = pd.Categorical.from_codes(ranks, categories=level)
+            else:
+                columns[key] = self[key]
+        return pd.DataFrame(columns)
+
+    def _ranks(self, key: str) -> tuple:
+        """
+        Return the sorted distinct values of a key and the rank of each transaction value among them.
+
+        The ranks are computed on the table of values and indexed by the codes
+        (-1 for None values).
+        """
+        if key in self._key_dimension:
+            codes, table = self.codes(key)
+        else:
+            table, codes = np.unique(self[key], return_inverse=True)
+        level = sorted({value for value in table.tolist() if value is not None})
+        rank_of = {value: rank for rank, value in enumerate(level)}
+        return level, np.array([rank_of.get(value, -1) for value in table.tolist()], dtype=np.int64)[codes]
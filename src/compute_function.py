@@ -1,20 +1,55 @@
 """Module containing functions for basic operation"""
 
-from typing import List
-import pandas as pd
+from typing import List, Union
+import numpy as np
 
 
-def rolling_variation(lst: List[float], window_size: int) -> List:
+def rolling_variation(
+    lst: Union[List[float], np.ndarray], window_size: int, zero_division: float = None
+) -> Union[List, np.ndarray]:
     """
-    Calculate rolling variations in a list.
+    Calculate rolling variations in a list, or in many series at once.
+
+    The variation of a window is (last - first) / first. It is computed for all
+    windows at once from two shifted views of the input (no Python call per
+    window), with the same results as a pandas rolling apply:
+    - a window containing a NaN gives NaN,
+    - a window starting at 0 gives inf, -inf or NaN (0 / 0) unless `zero_division`
+      is given, in which case that value is used instead.
 
     Args:
-    lst (List[float]): The input list of numerical elements.
+    lst (List[float] or np.ndarray): The input list of numerical elements, or a 2-D
+        array with one series per column (time along the first axis).
     window_size (int): The size of the rolling window.
+    zero_division (float): Value of the variations of windows starting at 0.
 
     Returns:
-    List[float]: A list containing the rolling variations.
+    List[float] or np.ndarray: The rolling variations (a list for a list input,
+        an array with len(lst) - window_size + 1 rows for an array input).
     """
-    series = pd.Series(lst)
-    rolling_variations = series.rolling(window=window_size).apply(lambda x: (x[-1] - x[0]) / x[0], raw=True)
-    return rolling_variations.tolist()[window_size - 1:]
+    if window_size < 1:
+        raise ValueError("window_size must be at least 1")
+
+    values = np.asarray(lst, dtype=np.float64)
+    n_variations = max(len(values) - window_size + 1, 0)
+
+    first = values[:n_variations]
+    last = values[window_size - 1:window_size - 1 + n_variations]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rolling_variations = (last - first) / first
+
+    # A NaN anywhere in a window (not only at its ends) makes the whole window NaN
+    if window_size > 2 and n_variations:
+        nan_count = np.cumsum(np.isnan(values), axis=0)
+        nan_count = np.concatenate([np.zeros_like(nan_count[:1]), nan_count])
+        has_nan = nan_count[window_size:] - nan_count[:n_variations] > 0
+    else:
+        has_nan = np.isnan(first) | np.isnan(last)
+    rolling_variations[has_nan] = np.nan
+
+    if zero_division is not None:
+        rolling_variations[(first == 0) & ~has_nan] = zero_division
+
+    if isinstance(lst, np.ndarray):
+        return rolling_variations
+    return rolling_variations.tolist()
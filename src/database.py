@@ -1,9 +1,95 @@
 """This module contains functions which realize CRUD operations"""
 
+import logging
 import sqlite3
-import pandas as pd
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+import numpy as np
+from src import instrument
 
+# pandas takes a few hundred milliseconds to import and is only needed to
+# load CSV files: the functions using it import it on first call
+if TYPE_CHECKING:
+    import pandas as pd
 
+
+logger = logging.getLogger(__name__)
+
+# Columns of the transaction CSV file, in insertion order
+TRANSACTION_COLUMNS = [
+    "id",
+    "isinId",
+    "brokerId",
+    "accountId",
+    "transaction_date",
+    "orderId",
+    "quantity",
+    "unit_price",
+]
+
+# SQL expression converting a 'YYYY-MM-DD' date into a sortable day number (days since 1970-01-01)
+DAY_NUMBER_SQL = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+
+INSERT_TRANSACTION = f"""
+    INSERT INTO "transaction" (id, isinId, brokerId, accountId, transaction_date, orderId, quantity, unit_price,
+                               transaction_day)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, {DAY_NUMBER_SQL.format("?5")})
+"""
+
+# Dtypes used to hash transaction rows, so that a row read from the CSV file
+# and the same row read back from the database produce the same content hash
+TRANSACTION_DTYPES = {
+    "id": "int64",
+    "isinId": "int64",
+    "brokerId": "int64",
+    "accountId": "int64",
+    "transaction_date": "str",
+    "orderId": "int64",
+    "quantity": "float64",
+    "unit_price": "float64",
+}
+
+INSERT_TRANSACTION_HASHED = f"""
+    INSERT INTO "transaction" (id, isinId, brokerId, accountId, transaction_date, orderId, quantity, unit_price,
+                               row_hash, transaction_day)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, {DAY_NUMBER_SQL.format("?5")})
+"""
+
+UPDATE_TRANSACTION = f"""
+    UPDATE "transaction"
+    SET isinId = ?1, brokerId = ?2, accountId = ?3, transaction_date = ?4, orderId = ?5,
+        quantity = ?6, unit_price = ?7, row_hash = ?8, transaction_day = {DAY_NUMBER_SQL.format("?4")}
+    WHERE id = ?9
+"""
+
+# Indexes of the transaction table: one covering index per foreign key used by
+# the joins of src.extract (join column first, then the selected columns) and
+# one on the day number for date-range filters and ordered scans
+TRANSACTION_INDEXES = {
+    "idx_transaction_isin": "isinId, transaction_day, transaction_date, quantity, unit_price",
+    "idx_transaction_broker": "brokerId, transaction_day, transaction_date, quantity, unit_price",
+    "idx_transaction_account": "accountId, transaction_day, transaction_date, quantity, unit_price",
+    "idx_transaction_order": "orderId, transaction_day, transaction_date, quantity, unit_price",
+    "idx_transaction_day": "transaction_day, id",
+}
+
+# Current schema version, stored in PRAGMA user_version
+# 1: row_hash column and ingestion table (incremental ingestion)
+# 2: transaction_day column and transaction indexes
+# 3: position, position_lot and position_state tables (src.positions)
+SCHEMA_VERSION = 3
+
+# SQLite pragmas used by the bulk loader (WAL journal, relaxed fsync, 64 MiB page cache)
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+}
+
+
+@instrument.timed()
 def create_from_csv(csv_file: str, database_file: str):
     """
     Create a SQLite database and populate it with data from a CSV file.
@@ -20,6 +106,8 @@ def create_from_csv(csv_file: str, database_file: str):
     id, isinId, brokerId, accountId, date, orderId, quantity, unit_price
     """
 
+    import pandas as pd
+
     # Read the CSV file
     df = pd.read_csv(csv_file)
 
@@ -27,7 +115,377 @@ def create_from_csv(csv_file: str, database_file: str):
     conn = sqlite3.connect(database_file)
     cursor = conn.cursor()
 
-    # Create tables if they don't already exist
+    # Create tables if they don't already exist and insert fixed data
+    _create_tables(cursor)
+    _insert_fixed_data(cursor)
+    _upgrade_schema(cursor)
+
+    # Insert data from the CSV file into the transaction table
+    for row in df.itertuples(index=False):
+        cursor.execute(
+            INSERT_TRANSACTION,
+            (
+                row.id,
+                row.isinId,
+                row.brokerId,
+                row.accountId,
+                row.transaction_date,
+                row.orderId,
+                row.quantity,
+                row.unit_price,
+            ),
+        )
+
+    # Commit the transactions and close the connection
+    conn.commit()
+    conn.close()
+    instrument.count("rows_ingested", len(df), loader="create_from_csv")
+
+
+@instrument.timed()
+def bulk_create_from_csv(
+    csv_file: str,
+    database_file: str,
+    chunksize: int = 50_000,
+    pragmas: Optional[dict] = None,
+) -> dict:
+    """
+    Create a SQLite database and bulk load a (possibly very large) CSV file.
+
+    Same tables and fixed data as `create_from_csv`, but the CSV file is
+    streamed in chunks of `chunksize` rows, each chunk is inserted with a
+    single `executemany` call inside its own transaction, and the connection
+    is tuned with SQLite pragmas beforehand. Memory usage is bounded by the
+    chunk size, not by the size of the CSV file.
+
+    Parameters:
+    csv_file (str): The path to the CSV file containing the transaction data.
+    database_file (str): The path to the SQLite database file.
+    chunksize (int): Number of CSV rows read and inserted per batch.
+    pragmas (dict): SQLite pragmas overriding DEFAULT_PRAGMAS,
+                    e.g. {"synchronous": "OFF", "cache_size": -200000}.
+
+    Returns:
+    dict: Ingestion statistics (rows, seconds, rows_per_sec).
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    rows = 0
+
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        _apply_pragmas(cursor, {**DEFAULT_PRAGMAS, **(pragmas or {})})
+
+        cursor.execute("BEGIN")
+        _create_tables(cursor)
+        _insert_fixed_data(cursor)
+        _upgrade_schema(cursor)
+        cursor.execute("COMMIT")
+
+        # Stream the CSV file and insert each chunk in a single transaction
+        for chunk in pd.read_csv(csv_file, chunksize=chunksize, usecols=TRANSACTION_COLUMNS):
+            cursor.execute("BEGIN")
+            cursor.executemany(
+                INSERT_TRANSACTION,
+                chunk[TRANSACTION_COLUMNS].itertuples(index=False, name=None),
+            )
+            cursor.execute("COMMIT")
+            rows += len(chunk)
+            instrument.count("rows_ingested", len(chunk), loader="bulk_create_from_csv")
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+    rows_per_sec = rows / seconds if seconds > 0 else float("inf")
+    logger.info("Inserted %d rows in %.2fs (%.0f rows/sec)", rows, seconds, rows_per_sec)
+
+    return {"rows": rows, "seconds": seconds, "rows_per_sec": rows_per_sec}
+
+
+@instrument.timed()
+def incremental_from_csv(
+    csv_file: str,
+    database_file: str,
+    chunksize: int = 50_000,
+    pragmas: Optional[dict] = None,
+) -> dict:
+    """
+    Incrementally (and idempotently) load a transaction CSV file into a SQLite database.
+
+    Every transaction row gets a content hash stored in the `row_hash` column
+    (with a unique index), and the `ingestion` table keeps a watermark: the
+    highest transaction id already loaded. While streaming the CSV file:
+    - rows above the watermark are new and inserted without any lookup,
+    - rows at or below the watermark are compared by hash with the stored row
+      and either skipped (same content) or updated (changed content).
+    Re-importing the same export, or a larger one, therefore only writes the
+    new or changed rows.
+
+    Parameters:
+    csv_file (str): The path to the CSV file containing the transaction data.
+    database_file (str): The path to the SQLite database file.
+    chunksize (int): Number of CSV rows read and processed per batch.
+    pragmas (dict): SQLite pragmas overriding DEFAULT_PRAGMAS.
+
+    Returns:
+    dict: Ingestion statistics (inserted, updated, skipped, watermark, seconds).
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    inserted = updated = skipped = 0
+
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        _apply_pragmas(cursor, {**DEFAULT_PRAGMAS, **(pragmas or {})})
+
+        cursor.execute("BEGIN")
+        _create_tables(cursor)
+        _insert_fixed_data(cursor)
+        _upgrade_schema(cursor)
+        _backfill_row_hash(cursor, chunksize)
+        cursor.execute("COMMIT")
+
+        watermark = _get_watermark(cursor)
+
+        for chunk in pd.read_csv(csv_file, chunksize=chunksize, usecols=TRANSACTION_COLUMNS):
+            chunk = chunk[TRANSACTION_COLUMNS].astype(TRANSACTION_DTYPES)
+            chunk["row_hash"] = _row_hash(chunk)
+
+            # Rows above the watermark can't be in the database yet
+            is_new = chunk["id"] > watermark
+            new_rows = chunk[is_new]
+            old_rows = chunk[~is_new]
+
+            # Compare the other rows with the stored hashes
+            to_insert = new_rows
+            to_update = old_rows.iloc[0:0]
+            rewritten = 0
+            if len(old_rows):
+                stored = _stored_hashes(cursor, int(old_rows["id"].min()), int(old_rows["id"].max()))
+                missing = ~old_rows["id"].isin(stored.keys())
+                changed = pd.Series(False, index=old_rows.index)
+                present = old_rows[~missing]
+                changed[~missing] = present["id"].map(stored) != present["row_hash"]
+                to_insert = pd.concat([old_rows[missing], new_rows])
+                to_update = old_rows[changed]
+                rewritten = int(missing.sum() + changed.sum())
+                skipped += len(old_rows) - rewritten
+
+            cursor.execute("BEGIN")
+            cursor.executemany(
+                INSERT_TRANSACTION_HASHED,
+                to_insert[TRANSACTION_COLUMNS + ["row_hash"]].itertuples(index=False, name=None),
+            )
+            cursor.executemany(
+                UPDATE_TRANSACTION,
+                to_update[TRANSACTION_COLUMNS[1:] + ["row_hash", "id"]].itertuples(index=False, name=None),
+            )
+            if len(chunk):
+                watermark = max(watermark, int(chunk["id"].max()))
+            _set_watermark(cursor, watermark)
+            if rewritten:
+                # Rows changed or inserted below the watermark: derived state must be rebuilt
+                _bump_revision(cursor)
+            cursor.execute("COMMIT")
+
+            inserted += len(to_insert)
+            updated += len(to_update)
+            instrument.count("rows_ingested", len(to_insert) + len(to_update), loader="incremental_from_csv")
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+    logger.info(
+        "Inserted %d, updated %d, skipped %d rows in %.2fs (watermark id=%d)",
+        inserted, updated, skipped, seconds, watermark,
+    )
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": skipped,
+        "watermark": watermark,
+        "seconds": seconds,
+    }
+
+
+@instrument.timed()
+def migrate(database_file: str) -> int:
+    """
+    Upgrade an existing SQLite database to the current schema.
+
+    Adds the columns and indexes introduced after the first version of the
+    schema (see SCHEMA_VERSION), backfills them for the rows already stored,
+    and refreshes the query planner statistics. Running it on an up-to-date
+    database does nothing.
+
+    Parameters:
+    database_file (str): The path to the SQLite database file.
+
+    Returns:
+    int: The schema version of the database after the migration.
+    """
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        _create_tables(cursor)
+        version = _upgrade_schema(cursor)
+        _backfill_row_hash(cursor, 50_000)
+        cursor.execute("COMMIT")
+        cursor.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+    return version
+
+
+def _upgrade_schema(cursor: sqlite3.Cursor) -> int:
+    """Apply the schema migrations newer than the database PRAGMA user_version."""
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+    if version < 1:
+        _ensure_ingestion_schema(cursor)
+
+    if version < 2:
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info("transaction")')]
+        if "transaction_day" not in columns:
+            cursor.execute('ALTER TABLE "transaction" ADD COLUMN transaction_day INTEGER')
+        cursor.execute(
+            f'UPDATE "transaction" SET transaction_day = {DAY_NUMBER_SQL.format("transaction_date")}'
+        )
+        for name, columns in TRANSACTION_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON "transaction" ({columns})')
+
+    if version < 3:
+        _create_position_tables(cursor)
+
+    if version < SCHEMA_VERSION:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    return max(version, SCHEMA_VERSION)
+
+
+def _row_hash(df: "pd.DataFrame") -> np.ndarray:
+    """Return a signed 64-bit content hash for each transaction row of `df`."""
+    import pandas as pd
+
+    hashes = pd.util.hash_pandas_object(df[TRANSACTION_COLUMNS].astype(TRANSACTION_DTYPES), index=False)
+    # SQLite integers are signed: reinterpret the unsigned hashes
+    return hashes.to_numpy().view(np.int64)
+
+
+def _ensure_ingestion_schema(cursor: sqlite3.Cursor):
+    """Add the row_hash column, its unique index and the ingestion table if missing."""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info("transaction")')]
+    if "row_hash" not in columns:
+        cursor.execute('ALTER TABLE "transaction" ADD COLUMN row_hash INTEGER')
+
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transaction_row_hash
+        ON "transaction" (row_hash)
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "ingestion" (
+            name TEXT PRIMARY KEY,
+            watermark INTEGER,
+            updated_at TEXT
+        )
+    """
+    )
+
+
+def _backfill_row_hash(cursor: sqlite3.Cursor, chunksize: int):
+    """Compute the row_hash of rows loaded without one (e.g. by create_from_csv)."""
+    import pandas as pd
+
+    query = f"""
+        SELECT {", ".join(TRANSACTION_COLUMNS)} FROM "transaction"
+        WHERE row_hash IS NULL LIMIT {int(chunksize)}
+    """
+    while True:
+        df = pd.DataFrame(cursor.execute(query).fetchall(), columns=TRANSACTION_COLUMNS)
+        if df.empty:
+            break
+        df = df.astype(TRANSACTION_DTYPES)
+        cursor.executemany(
+            'UPDATE "transaction" SET row_hash = ? WHERE id = ?',
+            zip(_row_hash(df).tolist(), df["id"].tolist()),
+        )
+
+
+def _stored_hashes(cursor: sqlite3.Cursor, min_id: int, max_id: int) -> dict:
+    """Return {id: row_hash} for stored transactions with min_id <= id <= max_id."""
+    cursor.execute(
+        'SELECT id, row_hash FROM "transaction" WHERE id BETWEEN ? AND ?',
+        (min_id, max_id),
+    )
+    return dict(cursor.fetchall())
+
+
+def _get_watermark(cursor: sqlite3.Cursor) -> int:
+    """Return the highest transaction id already ingested (0 for an empty table)."""
+    cursor.execute("SELECT watermark FROM \"ingestion\" WHERE name = 'transaction'")
+    row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+
+    # No watermark yet: start from what is already in the table
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM "transaction"')
+    return cursor.fetchone()[0]
+
+
+def _set_watermark(cursor: sqlite3.Cursor, watermark: int):
+    """Store the ingestion watermark of the transaction table."""
+    cursor.execute(
+        """
+        INSERT INTO "ingestion" (name, watermark, updated_at) VALUES ('transaction', ?, ?)
+        ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at
+    """,
+        (watermark, datetime.now(timezone.utc).isoformat()),
+    )
+
+
+def get_revision(cursor: sqlite3.Cursor) -> int:
+    """
+    Return the revision of the transaction table.
+
+    The revision is incremented whenever incremental ingestion changes or
+    inserts rows at or below the watermark, i.e. whenever the history changes
+    in a way that appending new transactions can't describe.
+    """
+    cursor.execute("SELECT watermark FROM \"ingestion\" WHERE name = 'transaction_revision'")
+    row = cursor.fetchone()
+    return row[0] if row is not None else 0
+
+
+def _bump_revision(cursor: sqlite3.Cursor):
+    """Increment the revision of the transaction table (see get_revision)."""
+    cursor.execute(
+        """
+        INSERT INTO "ingestion" (name, watermark, updated_at) VALUES ('transaction_revision', 1, ?)
+        ON CONFLICT (name) DO UPDATE SET watermark = watermark + 1, updated_at = excluded.updated_at
+    """,
+        (datetime.now(timezone.utc).isoformat(),),
+    )
+
+
+def _apply_pragmas(cursor: sqlite3.Cursor, pragmas: dict):
+    """Apply SQLite pragmas given as {name: value} on the connection of `cursor`."""
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def _create_tables(cursor: sqlite3.Cursor):
+    """Create the account, broker, order, isin and transaction tables."""
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS "account" (
@@ -87,7 +545,56 @@ def create_from_csv(csv_file: str, database_file: str):
     """
     )
 
-    # Insert fixed data into account, broker, order, and isin tables
+
+def _create_position_tables(cursor: sqlite3.Cursor):
+    """Create the position, position_lot and position_state tables holding the state of src.positions."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "position" (
+            method TEXT,
+            isinId INTEGER,
+            accountId INTEGER,
+            brokerId INTEGER,
+            quantity REAL,
+            cost_basis REAL,
+            realized_pnl REAL,
+            updated_at TEXT,
+            PRIMARY KEY (method, isinId, accountId, brokerId)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "position_lot" (
+            method TEXT,
+            isinId INTEGER,
+            accountId INTEGER,
+            brokerId INTEGER,
+            seq INTEGER,
+            transaction_id INTEGER,
+            quantity REAL,
+            unit_price REAL,
+            PRIMARY KEY (method, isinId, accountId, brokerId, seq)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "position_state" (
+            method TEXT PRIMARY KEY,
+            watermark INTEGER,
+            last_day INTEGER,
+            revision INTEGER,
+            updated_at TEXT
+        )
+    """
+    )
+
+
+def _insert_fixed_data(cursor: sqlite3.Cursor):
+    """Insert fixed data into account, broker, order, and isin tables."""
     cursor.execute(
         """
         INSERT OR IGNORE INTO "account" (id, number, name) VALUES
@@ -125,29 +632,6 @@ def create_from_csv(csv_file: str, database_file: str):
     """
     )
 
-    # Insert data from the CSV file into the transaction table
-    for row in df.itertuples(index=False):
-        cursor.execute(
-            """
-            INSERT INTO "transaction" (id, isinId, brokerId, accountId, transaction_date, orderId, quantity, unit_price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                row.id,
-                row.isinId,
-                row.brokerId,
-                row.accountId,
-                row.transaction_date,
-                row.orderId,
-                row.quantity,
-                row.unit_price,
-            ),
-        )
-
-    # Commit the transactions and close the connection
-    conn.commit()
-    conn.close()
-
 
 def list_tables(database_file: str) -> list:
     """
@@ -1,90 +1,556 @@
 """This module contains functions which extract data from sqlite database.db
 and third parties sources"""
 
+import logging
 import sqlite3
+from datetime import date
 from sqlite3 import Error
-import yfinance as yf
+import numpy as np
+from src import instrument
+from src.compact import CompactTransactions, encode
+from src.pool import get_pool
 
 
-# Functions to extract data from sqlite database.db
-def connection_to(db_file: str):
-    """Create a connection to the SQLite database specified by db_file."""
-    try:
-        conn = sqlite3.connect(db_file)
-        print(f"Successfully connected to {db_file}")
-        return conn
-    except Error as e:
-        print(f"Error connecting to {db_file}: {e}")
+logger = logging.getLogger(__name__)
+
+
+# Joins and columns of the dimension table referenced by each foreign key
+ATTRIBUTE_JOINS = {
+    "isinId": "JOIN isin ON 'transaction'.isinId = isin.id",
+    "brokerId": "JOIN broker ON 'transaction'.brokerId = broker.id",
+    "accountId": "JOIN account ON 'transaction'.accountId = account.id",
+    "orderId": "JOIN 'order' ON 'transaction'.orderId = 'order'.id",  # 'order' is a reserved keyword, use quotes
+}
+
+ATTRIBUTE_COLUMNS = {
+    "isinId": "isin, name, type",
+    "brokerId": "name, country",
+    "accountId": "number, name",
+    "orderId": "'order'.id AS id, 'order'.type AS type",  # 'id' alone is ambiguous with 'transaction'.id
+}
+
+# Dimension table and columns selected for each foreign key, used by the columnar readers
+ATTRIBUTE_DIMENSIONS = {
+    "isinId": ("isin", ["isin", "name", "type"]),
+    "brokerId": ("broker", ["name", "country"]),
+    "accountId": ("account", ["number", "name"]),
+    "orderId": ("order", ["id", "type"]),
+}
+
+ALL_ATTRIBUTE_DIMENSIONS = [
+    ("isinId", "isin", ["isin", "name", "type"]),
+    ("brokerId", "broker", ["name", "country"]),
+    ("accountId", "account", ["number", "name"]),
+    ("orderId", "order", ["type"]),
+]
+
+# Selected columns and joined tables of the all_attribute query
+ALL_ATTRIBUTE_SELECT = """
+    'transaction'.transaction_date,
+    isin.isin, isin.name, isin.type,
+    broker.name, broker.country,
+    account.number, account.name,
+    'order'.type,
+    'transaction'.quantity, 'transaction'.unit_price,
+    ('transaction'.quantity * 'transaction'.unit_price) AS total_price
+"""
+
+ALL_ATTRIBUTE_FROM = """
+    'transaction'
+JOIN isin ON 'transaction'.isinId = isin.id
+JOIN broker ON 'transaction'.brokerId = broker.id
+JOIN account ON 'transaction'.accountId = account.id
+JOIN 'order' ON 'transaction'.orderId = 'order'.id
+"""
+
+# SQL query joining all tables
+ALL_ATTRIBUTE_QUERY = f"SELECT{ALL_ATTRIBUTE_SELECT}FROM{ALL_ATTRIBUTE_FROM.rstrip()};\n"
+
+# Keys of the all_attribute result set, in column order
+ALL_ATTRIBUTE_KEYS = [
+    "transaction_date",
+    "isin",
+    "isin_name",
+    "isin_type",
+    "broker_name",
+    "broker_country",
+    "account_number",
+    "account_name",
+    "order_type",
+    "quantity",
+    "unit_price",
+    "total_price",
+]
+
+# Keys of the transaction listing (all_attribute keys and the transaction id), in column order
+TRANSACTION_KEYS = ["id"] + ALL_ATTRIBUTE_KEYS
+
+# Number of rows fetched from the cursor at a time by the columnar readers
+FETCH_SIZE = 50_000
+
+# Numeric columns of the result sets, read as float arrays (NULL as NaN)
+MEASURE_KEYS = ("quantity", "unit_price", "total_price")
+
+
+# Functions to extract data from sqlite database.db (connections come from src.pool)
+def _by_attribute_query(attribute: str):
+    """Return the SQL query used by by_attribute, or None if the attribute is unknown."""
+    if attribute not in ATTRIBUTE_JOINS or attribute not in ATTRIBUTE_COLUMNS:
         return None
 
+    return (
+        f"SELECT 'transaction'.transaction_date, "
+        f"{ATTRIBUTE_COLUMNS[attribute]}, "
+        f"'transaction'.quantity, 'transaction'.unit_price, "
+        f"('transaction'.quantity * 'transaction'.unit_price) AS total_price "
+        f"FROM 'transaction' "
+        f"{ATTRIBUTE_JOINS[attribute]};"
+    )
 
-def by_attribute(db_file: str, attribute: str) -> dict:
+
+def _by_attribute_keys(attribute: str) -> list:
+    """Return the keys of the by_attribute result set, in column order."""
+    return (
+        ["transaction_date"]
+        + [col.split(" ")[-1] for col in ATTRIBUTE_COLUMNS[attribute].split(", ")]
+        + ["quantity", "unit_price", "total_price"]
+    )
+
+
+def _fetch_columns(cursor: sqlite3.Cursor, fetch_size: int = FETCH_SIZE):
     """
-    Extract the values of a specified attribute from the transaction table and organize them into a dictionary.
+    Yield the result set of an executed cursor chunk by chunk, in columnar form.
+
+    Each chunk of `fetch_size` rows is transposed with zip (in C, no per-cell
+    Python work) into one tuple of values per column.
+    """
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        yield list(zip(*rows))
+
+
+def _to_array(values: tuple, numeric: bool = False) -> np.ndarray:
+    """
+    Convert a chunk of column values to a NumPy array.
+
+    Columns of numbers give int or float arrays, with NaN for NULL (always a
+    float array when `numeric`); other columns give object arrays.
+    """
+    if numeric:
+        return np.asarray(values, dtype=np.float64)
+    if isinstance(values[0], (int, float)):
+        array = np.asarray(values)
+        # A NULL among the numbers would give an object array
+        return array if array.dtype != object else np.asarray(values, dtype=np.float64)
+    return np.asarray(values, dtype=object)
+
+
+def _columnar(cursor: sqlite3.Cursor, keys: list, output: str):
+    """Read an executed cursor into the columnar `output` format (dict, numpy, pandas or arrow)."""
+    if output == "dict":
+        result = {key: [] for key in keys}
+        with instrument.span("extract.fetch"):
+            for chunk in _fetch_columns(cursor):
+                for key, values in zip(keys, chunk):
+                    result[key].extend(values)
+        instrument.count("rows_extracted", len(result[keys[0]]))
+        return result
+
+    numeric = [key in MEASURE_KEYS for key in keys]
+    with instrument.span("extract.fetch"):
+        chunks = [
+            [_to_array(values, is_numeric) for values, is_numeric in zip(chunk, numeric)]
+            for chunk in _fetch_columns(cursor)
+        ]
+    arrays = {
+        key: np.concatenate([chunk[i] for chunk in chunks]) if chunks else np.array([], dtype=object)
+        for i, key in enumerate(keys)
+    }
+    instrument.count("rows_extracted", len(arrays[keys[0]]))
+    return _format(arrays, output)
+
+
+def _decoded_columns(conn: sqlite3.Connection, dimensions: list, keys: list, output: str):
+    """
+    Read the transaction table joined with its dimension tables in columnar form.
+
+    Instead of letting SQLite repeat the dimension values (ISIN, names...) on
+    every row, only the foreign keys and numeric columns of the transaction
+    table are fetched, and the dimension tables (a few rows each) are joined
+    with NumPy fancy indexing. Rows with a dangling foreign key are dropped,
+    like the inner joins of the SQL queries.
+
+    :param dimensions (list): (foreign key, dimension table, dimension columns) tuples
+    :param keys (list): Keys of the result set, in column order
+    :return: The result set in the `output` format
+    """
+    foreign_keys = ", ".join(foreign_key for foreign_key, _, _ in dimensions)
+    with instrument.span("extract.fetch"):
+        cursor = conn.execute(
+            f"SELECT transaction_date, {foreign_keys}, quantity, unit_price FROM 'transaction'"
+        )
+        chunks = [_transaction_arrays(chunk) for chunk in _fetch_columns(cursor)]
+    if not chunks:
+        return _format({key: np.array([], dtype=object) for key in keys}, output)
+
+    columns = [np.concatenate(arrays) for arrays in zip(*chunks)]
+    dates, references, quantity, unit_price = columns[0], columns[1:-2], columns[-2], columns[-1]
+    if any(values.dtype.kind not in "iu" for values in references):
+        # NULL foreign keys: let SQLite do the joins
+        return None
+
+    with instrument.span("extract.join"):
+        arrays = [dates]
+        keep = np.ones(len(dates), dtype=bool)
+        for (_, table, table_columns), values in zip(dimensions, references):
+            rows = conn.execute(f"SELECT id, {', '.join(table_columns)} FROM '{table}'").fetchall()
+            codes = _dimension_codes(rows, values)
+            keep &= codes >= 0
+
+            for i in range(len(table_columns)):
+                dimension_values = np.asarray([row[i + 1] for row in rows] + [None], dtype=object)
+                arrays.append(dimension_values[codes])
+
+        arrays += [quantity, unit_price, quantity * unit_price]
+        if not keep.all():
+            arrays = [values[keep] for values in arrays]
+
+    instrument.count("rows_extracted", len(arrays[0]))
+    return _format(dict(zip(keys, arrays)), output)
+
+
+def _transaction_arrays(chunk: list) -> list:
+    """Convert a chunk of (transaction_date, foreign keys..., quantity, unit_price) columns to arrays."""
+    return [_to_array(values) for values in chunk[:-2]] + [_to_array(values, True) for values in chunk[-2:]]
+
+
+def _dimension_codes(rows: list, values: np.ndarray) -> np.ndarray:
+    """Return the position in `rows` (dimension table rows, id first) of each foreign key value, -1 if unknown."""
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    if not len(ids):
+        return np.full(len(values), -1, dtype=np.int64)
+    # Binary search among the sorted ids: memory proportional to the table, whatever the id values
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    index = np.minimum(np.searchsorted(sorted_ids, values), len(ids) - 1)
+    return np.where(sorted_ids[index] == values, order[index], -1)
+
+
+def _compact_columns(conn: sqlite3.Connection):
+    """
+    Read the transaction table and its dimension tables into a CompactTransactions.
+
+    Same rows as _decoded_columns, but the dimension values are not joined:
+    the foreign keys are converted to codes into the dimension tables.
+    """
+    foreign_keys = ", ".join(foreign_key for foreign_key, _, _ in ALL_ATTRIBUTE_DIMENSIONS)
+    with instrument.span("extract.fetch"):
+        cursor = conn.execute(f"SELECT transaction_date, {foreign_keys}, quantity, unit_price FROM 'transaction'")
+        chunks = [_transaction_arrays(chunk) for chunk in _fetch_columns(cursor)]
+    if not chunks:
+        return CompactTransactions.from_dict({key: [] for key in ALL_ATTRIBUTE_KEYS})
+
+    columns = [np.concatenate(arrays) for arrays in zip(*chunks)]
+    dates, references, quantity, unit_price = columns[0], columns[1:-2], columns[-2], columns[-1]
+    if any(values.dtype.kind not in "iu" for values in references):
+        # NULL foreign keys: let SQLite do the joins
+        return None
+
+    with instrument.span("extract.encode"):
+        # Keys of each dimension, in the order of ALL_ATTRIBUTE_KEYS
+        keys = iter(ALL_ATTRIBUTE_KEYS[1:])
+        date_codes, date_table = encode(dates)
+        dimensions = {"date": (date_codes, {"transaction_date": date_table})}
+        keep = np.ones(len(dates), dtype=bool)
+        for (_, table, table_columns), values in zip(ALL_ATTRIBUTE_DIMENSIONS, references):
+            rows = conn.execute(f"SELECT id, {', '.join(table_columns)} FROM '{table}'").fetchall()
+            codes = _dimension_codes(rows, values)
+            keep &= codes >= 0
+            tables = {}
+            for i in range(len(table_columns)):
+                tables[next(keys)] = np.asarray([row[i + 1] for row in rows], dtype=object)
+            dimensions[table] = (codes, tables)
+
+        if not keep.all():
+            dimensions = {name: (codes[keep], tables) for name, (codes, tables) in dimensions.items()}
+            quantity, unit_price = quantity[keep], unit_price[keep]
+
+    instrument.count("rows_extracted", len(quantity))
+    return CompactTransactions(dimensions, {"quantity": quantity, "unit_price": unit_price}, ALL_ATTRIBUTE_KEYS)
+
+
+def _format(arrays: dict, output: str):
+    """Convert a dict of NumPy arrays to the `output` format (numpy, pandas or arrow)."""
+    if output == "numpy":
+        return arrays
+    if output == "pandas":
+        # pandas is slow to import, only the callers asking for DataFrames pay for it
+        import pandas as pd
+
+        with instrument.span("extract.to_pandas"):
+            return pd.DataFrame(arrays, copy=False)
+    if output == "arrow":
+        import pyarrow as pa  # optional dependency, only needed for this output
+
+        with instrument.span("extract.to_arrow"):
+            return pa.table(arrays)
+    raise ValueError(f"Unknown output format '{output}', expected dict, numpy, pandas or arrow.")
+
+
+@instrument.timed()
+def by_attribute_columns(db_file: str, attribute: str, output: str = "pandas"):
+    """
+    Extract the values of a specified attribute from the transaction table in columnar form.
+
+    The result set is read from the cursor chunk by chunk and stored column by
+    column, without building Python objects per row. Except for the "dict"
+    output, the dimension table is joined in NumPy (see _decoded_columns).
 
     :param db_file (str): Path to the SQLite database file
     :param attribute (str): Name of the attribute to extract
-    :return: Dictionary with key=(date, quantity, unit_price) and values of the specified attribute in list form
+    :param output (str): "pandas" (DataFrame), "numpy" (dict of arrays), "arrow" (pyarrow Table)
+                         or "dict" (dict of lists)
+    :return: The result set in the requested format, or None on error
     """
-    conn = connection_to(db_file)
-    if conn is None:
-        return {}
+    query = _by_attribute_query(attribute)
+    if query is None:
+        logger.warning("Attribute '%s' not recognized for join.", attribute)
+        return None
 
+    keys = _by_attribute_keys(attribute)
     try:
-        cursor = conn.cursor()
-
-        joins = {
-            "isinId": "JOIN isin ON 'transaction'.isinId = isin.id",
-            "brokerId": "JOIN broker ON 'transaction'.brokerId = broker.id",
-            "accountId": "JOIN account ON 'transaction'.accountId = account.id",
-            "orderId": "JOIN 'order' ON 'transaction'.orderId = 'order'.id",  # 'order' is a reserved keyword, use quotes
-        }
-
-        columns = {
-            "isinId": "isin, name, type",
-            "brokerId": "name, country",
-            "accountId": "number, name",
-            "orderId": "id, type",
-        }
-
-        if attribute in joins and attribute in columns:
-            query = (
-                f"SELECT 'transaction'.transaction_date, "
-                f"{columns[attribute]}, "
-                f"'transaction'.quantity, 'transaction'.unit_price, "
-                f"('transaction'.quantity * 'transaction'.unit_price) AS total_price "
-                f"FROM 'transaction' "
-                f"{joins[attribute]};"
-            )
-        else:
-            print(f"Attribute '{attribute}' not recognized for join.")
-            return {}
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        # Define the keys for the dictionary using original attribute names
-        keys = (
-            ["transaction_date"]
-            + [col.split(" ")[-1] for col in columns[attribute].split(", ")]
-            + ["quantity", "unit_price", "total_price"]
-        )
+        with get_pool(db_file).connection() as conn:
+            if output != "dict":
+                table, columns = ATTRIBUTE_DIMENSIONS[attribute]
+                result = _decoded_columns(conn, [(attribute, table, columns)], keys, output)
+                if result is not None:
+                    return result
+            return _columnar(conn.execute(query), keys, output)
+    except Error as e:
+        logger.error("Error extracting data: %s", e)
+        return None
 
-        # Initialize the result dictionary with empty lists
-        result = {key: [] for key in keys}
 
-        # Populate the result dictionary
-        for row in rows:
-            for key, value in zip(keys, row):
-                result[key].append(value)
+@instrument.timed()
+def all_attribute_columns(db_file: str, output: str = "pandas"):
+    """
+    Extract all transactions joined with every dimension table in columnar form.
 
-        return result
+    The result set is read from the cursor chunk by chunk and stored column by
+    column, without building Python objects per row. Except for the "dict"
+    output, the dimension tables are joined in NumPy (see _decoded_columns),
+    or not joined at all for the "compact" output (see src.compact).
+
+    :param db_file (str): Path to the SQLite database file
+    :param output (str): "pandas" (DataFrame), "numpy" (dict of arrays), "arrow" (pyarrow Table),
+                         "compact" (CompactTransactions, dictionary-encoded) or "dict" (dict of lists)
+    :return: The result set in the requested format, or None on error
+    """
+    try:
+        with get_pool(db_file).connection() as conn:
+            if output == "compact":
+                result = _compact_columns(conn)
+                if result is None:
+                    result = CompactTransactions.from_dict(
+                        _columnar(conn.execute(ALL_ATTRIBUTE_QUERY), ALL_ATTRIBUTE_KEYS, "dict")
+                    )
+                return result
+            if output != "dict":
+                result = _decoded_columns(conn, ALL_ATTRIBUTE_DIMENSIONS, ALL_ATTRIBUTE_KEYS, output)
+                if result is not None:
+                    return result
+            return _columnar(conn.execute(ALL_ATTRIBUTE_QUERY), ALL_ATTRIBUTE_KEYS, output)
     except Error as e:
-        print(f"Error extracting data: {e}")
-        return {}
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Error extracting data: %s", e)
+        return None
+
+
+@instrument.timed()
+def iter_batches(
+    db_file: str,
+    batch_size: int = 10_000,
+    start_date: str = None,
+    end_date: str = None,
+    isins: list = None,
+    accounts: list = None,
+    output: str = "pandas",
+):
+    """
+    Stream the transactions joined with every dimension table in fixed-size batches.
+
+    Only one batch is held in memory at a time, so histories larger than RAM
+    can be processed (see transform.group_by_batches). Filters are pushed into
+    the SQL query, and transactions are returned ordered by date then id.
+    Requires a database with the transaction_day column (see database.migrate).
+
+    :param db_file (str): Path to the SQLite database file
+    :param batch_size (int): Number of transactions per batch
+    :param start_date (str): Keep transactions on or after this date ('YYYY-MM-DD')
+    :param end_date (str): Keep transactions on or before this date ('YYYY-MM-DD')
+    :param isins (list): Keep transactions of these ISIN codes
+    :param accounts (list): Keep transactions of these accounts (names or numbers)
+    :param output (str): "pandas" (DataFrame batches) or "dict" (dict of lists batches)
+    :return: Generator of batches with the keys of all_attribute
+    :raises sqlite3.Error: If the database can't be read
+    """
+    query, parameters = _filtered_query(start_date, end_date, isins, accounts)
+    if output != "dict":
+        import pandas as pd
+
+    # Database errors are raised: a consumer summing the batches must not get partial totals
+    with get_pool(db_file).connection() as conn:
+        cursor = conn.execute(query, parameters)
+        for chunk in _fetch_columns(cursor, batch_size):
+            instrument.count("rows_extracted", len(chunk[0]))
+            if output == "dict":
+                yield {key: list(values) for key, values in zip(ALL_ATTRIBUTE_KEYS, chunk)}
+            else:
+                yield pd.DataFrame(
+                    {key: _to_array(values, key in MEASURE_KEYS) for key, values in zip(ALL_ATTRIBUTE_KEYS, chunk)},
+                    copy=False,
+                )
+
+
+@instrument.timed()
+def iter_transactions(
+    db_file: str,
+    batch_size: int = 1_000,
+    start_date: str = None,
+    end_date: str = None,
+    isins: list = None,
+    accounts: list = None,
+    after: tuple = None,
+    limit: int = None,
+):
+    """
+    Stream the rows of the transaction listing, straight from the database cursor.
+
+    Rows are ordered by (transaction_date, id), so a listing can be resumed
+    with `after` set to the (transaction_date, id) of the last row received
+    (keyset pagination: each page costs the same, however deep it is). Only
+    one batch of rows is held in memory at a time.
+    Requires a database with the transaction_day column (see database.migrate).
+
+    :param db_file (str): Path to the SQLite database file
+    :param batch_size (int): Number of rows fetched from the cursor at a time
+    :param start_date (str): Keep transactions on or after this date ('YYYY-MM-DD')
+    :param end_date (str): Keep transactions on or before this date ('YYYY-MM-DD')
+    :param isins (list): Keep transactions of these ISIN codes
+    :param accounts (list): Keep transactions of these accounts (names or numbers)
+    :param after (tuple): Keep transactions after this (transaction_date, id) position
+    :param limit (int): Maximum number of rows (None: all of them)
+    :return: Generator of lists of row tuples with the keys of TRANSACTION_KEYS
+    """
+    query, parameters = _filtered_query(
+        start_date, end_date, isins, accounts, after, select=f" 'transaction'.id,{ALL_ATTRIBUTE_SELECT}", limit=limit
+    )
+
+    with get_pool(db_file).connection() as conn:
+        cursor = conn.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            instrument.count("rows_extracted", len(rows))
+            yield rows
+
+
+@instrument.timed()
+def next_cursor(
+    db_file: str,
+    limit: int,
+    start_date: str = None,
+    end_date: str = None,
+    isins: list = None,
+    accounts: list = None,
+    after: tuple = None,
+):
+    """
+    Return the position after which the page following a listing page starts.
+
+    Runs the filtered query of the listing (same joins and filters as
+    iter_transactions) selecting only the date and id of the last row of the
+    page and of the next one: SQLite still steps over the `limit - 1` rows
+    before them (OFFSET), but without building nor sending them, so the
+    cursor can be sent before the page itself.
+
+    :return: (transaction_date, id) of the last row of the page, or None if it is the last page
+    """
+    query, parameters = _filtered_query(
+        start_date, end_date, isins, accounts, after,
+        select=" 'transaction'.transaction_date, 'transaction'.id ", limit=2, offset=limit - 1,
+    )
+    with get_pool(db_file).connection() as conn:
+        rows = conn.execute(query, parameters).fetchall()
+    return rows[0] if len(rows) == 2 else None
+
+
+def _day_number(value: str) -> int:
+    """Convert a 'YYYY-MM-DD' date to its day number (days since 1970-01-01, see transaction_day)."""
+    return date.fromisoformat(value).toordinal() - date(1970, 1, 1).toordinal()
+
+
+def _filtered_query(
+    start_date: str = None,
+    end_date: str = None,
+    isins: list = None,
+    accounts: list = None,
+    after: tuple = None,
+    select: str = ALL_ATTRIBUTE_SELECT,
+    limit: int = None,
+    offset: int = None,
+):
+    """
+    Return the all_attribute query restricted by the given filters, and its parameters.
+
+    Rows are ordered by date then id; `after` = (transaction_date, id) keeps
+    only the rows after this position (keyset pagination, served by the
+    idx_transaction_day index), and `select` replaces the selected columns.
+    """
+    conditions = []
+    parameters = []
+
+    if start_date is not None:
+        conditions.append("'transaction'.transaction_day >= ?")
+        parameters.append(_day_number(start_date))
+    if end_date is not None:
+        conditions.append("'transaction'.transaction_day <= ?")
+        parameters.append(_day_number(end_date))
+    if isins:
+        conditions.append(f"isin.isin IN ({', '.join('?' * len(isins))})")
+        parameters.extend(isins)
+    if accounts:
+        placeholders = ", ".join("?" * len(accounts))
+        conditions.append(f"(account.name IN ({placeholders}) OR account.number IN ({placeholders}))")
+        parameters.extend(list(accounts) * 2)
+    if after is not None:
+        conditions.append("('transaction'.transaction_day, 'transaction'.id) > (?, ?)")
+        parameters.extend([_day_number(after[0]), int(after[1])])
+
+    query = f"SELECT{select}FROM{ALL_ATTRIBUTE_FROM.rstrip()}"
+    if conditions:
+        query += "\nWHERE " + " AND ".join(conditions)
+    query += "\nORDER BY 'transaction'.transaction_day, 'transaction'.id"
+    if limit is not None:
+        query += f"\nLIMIT {int(limit)}"
+        if offset is not None:
+            query += f" OFFSET {int(offset)}"
+
+    return query + ";", parameters
+
+
+def by_attribute(db_file: str, attribute: str) -> dict:
+    """
+    Extract the values of a specified attribute from the transaction table and organize them into a dictionary.
+
+    :param db_file (str): Path to the SQLite database file
+    :param attribute (str): Name of the attribute to extract
+    :return: Dictionary with key=(date, quantity, unit_price) and values of the specified attribute in list form
+    """
+    result = by_attribute_columns(db_file, attribute, output="dict")
+    return {} if result is None else result
 
 
 def all_attribute(db_file: str) -> dict:
@@ -94,62 +560,52 @@ def all_attribute(db_file: str) -> dict:
     :param db_file (str): Path to the SQLite database file
     :return: List of dictionaries representing the merged result set.
     """
-    conn = connection_to(db_file)
-    if conn is None:
-        return {}
+    result = all_attribute_columns(db_file, output="dict")
+    return {} if result is None else result
 
-    try:
-        cursor = conn.cursor()
-
-        # Define the SQL query to join all tables
-        query = """
-        SELECT
-            'transaction'.transaction_date,
-            isin.isin, isin.name, isin.type,
-            broker.name, broker.country,
-            account.number, account.name,
-            'order'.type,
-            'transaction'.quantity, 'transaction'.unit_price,
-            ('transaction'.quantity * 'transaction'.unit_price) AS total_price
-        FROM
-            'transaction'
-        JOIN isin ON 'transaction'.isinId = isin.id
-        JOIN broker ON 'transaction'.brokerId = broker.id
-        JOIN account ON 'transaction'.accountId = account.id
-        JOIN 'order' ON 'transaction'.orderId = 'order'.id;
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        # Define the keys for the dictionary using original attribute names
-        keys = [
-            "transaction_date",
-            "isin",
-            "isin_name",
-            "isin_type",
-            "broker_name",
-            "broker_country",
-            "account_number",
-            "account_name",
-            "order_type",
-            "quantity",
-            "unit_price",
-            "total_price",
-        ]
 
-        # Initialize the result dictionary with empty lists
-        result = {key: [] for key in keys}
+def list_isins(db_file: str) -> list:
+    """
+    Return the ISIN codes of the isin table.
 
-        # Populate the result dictionary
-        for row in rows:
-            for key, value in zip(keys, row):
-                result[key].append(value)
+    :param db_file (str): Path to the SQLite database file
+    :return: List of ISIN codes
+    """
+    with get_pool(db_file).connection() as conn:
+        return [row[0] for row in conn.execute("SELECT isin FROM isin ORDER BY isin")]
 
-        return result
+
+def explain(db_file: str, attribute: str = None) -> list:
+    """
+    Print the EXPLAIN QUERY PLAN output of the extract queries.
+
+    Useful to check that the joins use the transaction indexes (see
+    src.database.TRANSACTION_INDEXES) instead of full table scans.
+
+    :param db_file (str): Path to the SQLite database file
+    :param attribute (str): Explain only the by_attribute query of this attribute.
+                            By default, explain all_attribute and every by_attribute query.
+    :return: List of (query name, plan rows) tuples
+    """
+    if attribute is None:
+        queries = {"all_attribute": ALL_ATTRIBUTE_QUERY}
+        queries.update({f"by_attribute({name})": _by_attribute_query(name) for name in ATTRIBUTE_JOINS})
+    else:
+        queries = {f"by_attribute({attribute})": _by_attribute_query(attribute)}
+
+    plans = []
+    try:
+        with get_pool(db_file).connection() as conn:
+            for name, query in queries.items():
+                if query is None:
+                    logger.warning("Attribute '%s' not recognized for join.", attribute)
+                    continue
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+                print(name)
+                for _, _, _, detail in rows:
+                    print(f"    {detail}")
+                plans.append((name, rows))
     except Error as e:
-        print(f"Error extracting data: {e}")
-        return {}
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Error explaining query: %s", e)
+
+    return plans
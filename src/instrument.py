@@ -0,0 +1,358 @@
+"""This module contains lightweight timing spans, counters and their Prometheus text exposition
+
+Spans time a block of code (or a function with the `timed` decorator) and
+are aggregated per name into Prometheus histograms; counters count rows,
+calls... When instrumentation is disabled (INSTRUMENT=0 or `disable()`),
+every call returns after a single flag check.
+
+The spans of the current request (see `collect_spans`) are also kept in a
+list, to build a Server-Timing header.
+"""
+
+import contextvars
+import functools
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the span histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# Prefix of the exported metric names
+PREFIX = "portfolio"
+
+_enabled = os.getenv("INSTRUMENT", "1") != "0"
+_lock = threading.Lock()
+# {span name: [count, sum of seconds, count per bucket]}
+_spans = {}
+# {(counter name, sorted labels): value}
+_counters = {}
+# {collector name: function returning {gauge name: value}}
+_collectors = {}
+
+# (name, seconds) of the spans of the current request, see collect_spans
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Forget every recorded span and counter (the collectors are kept)."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def record(name: str, seconds: float):
+    """Record the duration of a span."""
+    if not _enabled:
+        return
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            entry = _spans[name] = [0, 0.0, [0] * len(BUCKETS)]
+        entry[0] += 1
+        entry[1] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[2][i] += 1
+                break
+
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+class _NoSpan:
+    """Context manager doing nothing, returned by span() when instrumentation is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name: str):
+    """
+    Time a block of code.
+
+    Example:
+        with instrument.span("extract.query"):
+            rows = cursor.fetchall()
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def timed(name: str = None):
+    """
+    Decorator timing every call of a function as a span (default name: 'module.function').
+
+    For a generator function, the span covers the time spent producing the
+    items, not the time the caller spends between two items.
+    """
+
+    def decorator(function):
+        span_name = name or f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+        if inspect.isgeneratorfunction(function):
+
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from function(*args, **kwargs))
+                seconds = 0.0
+                iterator = function(*args, **kwargs)
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            seconds += time.perf_counter() - start
+                        yield item
+                finally:
+                    iterator.close()
+                    record(span_name, seconds)
+
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(span_name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: float = 1, **labels):
+    """Increment a counter (e.g. count("rows_extracted", len(rows), query="all_attribute"))."""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_collector(name: str, function):
+    """
+    Register a function returning {gauge name: value}, read at every export.
+
+    Used to export the statistics other components already keep (price
+    cache, connection pool...) without counting twice.
+    """
+    with _lock:
+        _collectors[name] = function
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans recorded in the current context (e.g. a request) in the yielded list."""
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def server_timing(spans: list, total: float = None) -> str:
+    """Format (name, seconds) spans as a Server-Timing header value (durations in milliseconds)."""
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name.replace('.', '-')};dur={seconds * 1000:.2f}" for name, seconds in totals.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def snapshot() -> dict:
+    """
+    Return the recorded metrics.
+
+    Returns:
+        dict: spans ({name: {count, sum, buckets}}), counters ({(name, labels): value})
+              and gauges ({collector: {name: value}}).
+    """
+    with _lock:
+        spans = {
+            name: {"count": entry[0], "sum": entry[1], "buckets": list(entry[2])} for name, entry in _spans.items()
+        }
+        counters = dict(_counters)
+        collectors = dict(_collectors)
+
+    gauges = {}
+    for collector, function in collectors.items():
+        try:
+            gauges[collector] = function()
+        except Exception as e:  # a broken collector must not break the export
+            logger.warning("Error collecting %s metrics: %s", collector, e)
+    return {"spans": spans, "counters": counters, "gauges": gauges}
+
+
+def render_prometheus() -> str:
+    """Return the recorded metrics in the Prometheus text exposition format."""
+    metrics = snapshot()
+    lines = []
+
+    if metrics["spans"]:
+        histogram = f"{PREFIX}_span_seconds"
+        lines += [f"# HELP {histogram} Duration of the instrumented code spans.", f"# TYPE {histogram} histogram"]
+        for name, entry in sorted(metrics["spans"].items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, entry["buckets"]):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{histogram}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{histogram}_sum{{span="{name}"}} {entry["sum"]!r}')
+            lines.append(f'{histogram}_count{{span="{name}"}} {entry["count"]}')
+
+    counters = {}
+    for (name, labels), value in metrics["counters"].items():
+        counters.setdefault(name, []).append((labels, value))
+    for name, values in sorted(counters.items()):
+        metric = f"{PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in sorted(values):
+            lines.append(f"{metric}{_labels(labels)} {value!r}")
+
+    for collector, gauges in sorted(metrics["gauges"].items()):
+        for name, value in sorted(gauges.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f"{PREFIX}_{collector}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value!r}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    """Format sorted (key, value) labels as {key="value",...}."""
+    if not labels:
+        return ""
+
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class SlowRequestProfiler:
+    """
+    Profile requests and keep the profiles of those slower than a threshold.
+
+    Uses pyinstrument (async-aware, HTML output) when installed, cProfile
+    (.prof files, for snakeviz or pstats) otherwise. cProfile can only profile
+    one request at a time: concurrent requests are not profiled meanwhile.
+
+    Args:
+        directory (str): Directory where the profiles are written.
+        threshold (float): Minimum duration (seconds) of a request to keep its profile.
+    """
+
+    def __init__(self, directory: str, threshold: float = 1.0):
+        self.directory = directory
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        try:
+            import pyinstrument
+
+            self._pyinstrument = pyinstrument
+        except ImportError:
+            self._pyinstrument = None
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile the block; write the profile if it lasted more than the threshold.
+
+        Args:
+            name (str or callable): Name of the profile, or a function returning it
+                                    when the block ends (e.g. a route only known then).
+        """
+        if not self._lock.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            if self._pyinstrument is not None:
+                profiler = self._pyinstrument.Profiler(async_mode="enabled")
+                start_profiler, stop_profiler = profiler.start, profiler.stop
+            else:
+                import cProfile
+
+                profiler = cProfile.Profile()
+                start_profiler, stop_profiler = profiler.enable, profiler.disable
+
+            start = time.perf_counter()
+            start_profiler()
+            try:
+                yield
+            finally:
+                stop_profiler()
+                seconds = time.perf_counter() - start
+                if seconds >= self.threshold:
+                    self._write(profiler, name() if callable(name) else name, seconds)
+        finally:
+            self._lock.release()
+
+    def _write(self, profiler, name: str, seconds: float):
+        safe_name = "".join(c if c.isalnum() else "_" for c in name).strip("_")
+        stem = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_name}_{seconds * 1000:.0f}ms")
+        if self._pyinstrument is not None:
+            with open(f"{stem}.html", "w", encoding="utf-8") as file:
+                file.write(profiler.output_html())
+        else:
+            profiler.dump_stats(f"{stem}.prof")
+        logger.info("Slow request %s (%.0f ms), profile written to %s", name, seconds * 1000, stem)
@@ -0,0 +1,298 @@
+"""Module containing functions which compute the money-weighted (XIRR) and time-weighted (TWR)
+returns of many positions at once"""
+
+import numpy as np
+from src import instrument
+from src.metric.compute_return import ArrayLike, masked
+
+
+# Status of the XIRR of a position (see xirr_array)
+CONVERGED = "converged"
+NO_ROOT = "no_root"
+MAX_ITERATIONS = "max_iterations"
+INVALID = "invalid"
+
+# Rates evaluated to bracket the XIRR of the positions where Newton's method fails, from the
+# lowest to the highest XIRR computed
+BRACKET_RATES = np.array(
+    [-0.999999, -0.9999, -0.99, -0.9, -0.75, -0.5, -0.25, -0.1, 0.0, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 100.0, 1e4]
+)
+
+# Quantities smaller than this are considered as zero (see positions.EPSILON)
+EPSILON = 1e-9
+
+
+def _npv(amounts: np.ndarray, years: np.ndarray, positions: np.ndarray, growth: np.ndarray, size: int) -> tuple:
+    """
+    Return the net present value of the cash flows of every position, and its derivative.
+
+    The rate of each position is given as its continuous rate, growth = log(1 + rate).
+    """
+    with np.errstate(over="ignore", invalid="ignore"):
+        discounted = amounts * np.exp(-years * growth[positions])
+        npv = np.bincount(positions, weights=discounted, minlength=size)
+        derivative = np.bincount(positions, weights=-years * discounted, minlength=size)
+    return npv, derivative
+
+
+def _newton(amounts, years, positions, size, growth, active, tolerance, max_iterations) -> tuple:
+    """
+    Newton's method on the NPV of the active positions, from the continuous rates `growth`.
+
+    The cash flows of the positions solved (or given up) are left out of the
+    next steps once they are half of the remaining ones.
+
+    Returns:
+        tuple: (growth, converged, iterations), the positions whose step isn't finite,
+               or leaves the range of BRACKET_RATES, being given up.
+    """
+    lowest, highest = np.log1p(BRACKET_RATES[[0, -1]])
+    iterations = np.zeros(size, dtype=np.int64)
+    converged = np.zeros(size, dtype=bool)
+    active = active.copy()
+    working = len(positions)
+    for _ in range(max_iterations):
+        if np.count_nonzero(active[positions]) * 2 < working:
+            kept = active[positions]
+            amounts, years, positions = amounts[kept], years[kept], positions[kept]
+            working = len(positions)
+
+        npv, derivative = _npv(amounts, years, positions, growth, size)
+        converged |= active & (np.abs(npv) <= tolerance)
+        active &= ~converged
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = growth - npv / derivative
+        active &= np.isfinite(step) & (step >= lowest) & (step <= highest)
+        if not active.any():
+            break
+
+        iterations += active
+        growth = np.where(active, step, growth)
+    return growth, converged, iterations
+
+
+def _bracketed(amounts, years, positions, size, start, tolerance, max_iterations) -> tuple:
+    """
+    Newton's method safeguarded by bisection, on an interval where the NPV of every position changes sign.
+
+    Returns:
+        tuple: (growth, converged, has_root, iterations), see _newton.
+    """
+    # Bracket the root of every position on the grid of rates, the interval closest to its start
+    bounds = np.log1p(BRACKET_RATES)
+    grid = np.stack([_npv(amounts, years, positions, np.full(size, bound), size)[0] for bound in bounds], 1)
+    changes = np.sign(grid[:, :-1]) * np.sign(grid[:, 1:]) <= 0
+    middles = (bounds[:-1] + bounds[1:]) / 2
+    distance = np.where(changes, np.abs(middles - start[:, None]), np.inf)
+    bracket = np.argmin(distance, axis=1)
+    has_root = np.isfinite(distance[np.arange(size), bracket])
+
+    low, high = bounds[bracket], bounds[bracket + 1]
+    low_sign = np.sign(grid[np.arange(size), bracket])
+    growth = np.where((start >= low) & (start <= high), start, (low + high) / 2)
+
+    iterations = np.zeros(size, dtype=np.int64)
+    converged = np.zeros(size, dtype=bool)
+    active = has_root.copy()
+    for _ in range(max_iterations):
+        npv, derivative = _npv(amounts, years, positions, growth, size)
+        converged |= active & (np.abs(npv) <= tolerance)
+        active &= ~converged
+        if not active.any():
+            break
+
+        # Shrink the bracket on the side where the NPV has the sign of its lower end
+        same_side = np.sign(npv) == low_sign
+        low = np.where(active & same_side, growth, low)
+        high = np.where(active & ~same_side, growth, high)
+
+        # Newton step, or bisection when it leaves the bracket
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = growth - npv / derivative
+        bisect = ~np.isfinite(step) | (step < low) | (step > high)
+        step = np.where(bisect, (low + high) / 2, step)
+
+        iterations += active
+        done = active & (high - low <= tolerance * (1 + np.abs(growth)))
+        growth = np.where(active, step, growth)
+        converged |= done
+        active &= ~done
+    return growth, converged, has_root, iterations
+
+
+@instrument.timed()
+def xirr_array(
+    amounts: ArrayLike,
+    days: ArrayLike,
+    positions: ArrayLike,
+    n_positions: int = None,
+    guess: float = None,
+    tolerance: float = 1e-10,
+    max_iterations: int = 50,
+) -> dict:
+    """Calculate the XIRR (money-weighted annual return) of many positions in one vectorized pass
+
+    The XIRR of a position is the rate r for which the net present value of
+    its dated cash flows, sum(amount * (1 + r) ** -(days / 365)), is zero.
+    The cash flows of all the positions are held in flat arrays, and each
+    Newton step is computed for every position at once with np.bincount
+    instead of a root-finding loop per position.
+
+    The solvers work on the continuous rate log(1 + r), which keeps the rates
+    above -100% and makes the NPV of the usual positions (invested, then
+    received) convex and decreasing: Newton's method from the starting rate
+    converges in a few steps. The positions where it fails (step not finite
+    or out of the range of BRACKET_RATES, no convergence) are solved again,
+    alone, by a safeguarded Newton's method like rtsafe: the rates of
+    BRACKET_RATES give each of them an interval where its NPV changes sign
+    (the one closest to the starting rate, as BUYs and SELLs mixed can give
+    several roots), and a step leaving the interval is replaced with a
+    bisection, so it always converges on a bracketed root.
+
+    Args:
+        amounts (ArrayLike): Cash flows, negative when invested (BUY) and positive
+                             when received (SELL, value of the position at the end)
+        days (ArrayLike): Date of each cash flow, as a number of days (e.g. transaction_day)
+        positions (ArrayLike): Position number of each cash flow, from 0 to n_positions - 1
+        n_positions (int): Number of positions (default: highest position number + 1)
+        guess (float): Rate from which Newton's method starts (default: estimated for each
+                       position from its invested and received amounts and their mean dates)
+        tolerance (float): Convergence threshold on the NPV, relative to the sum of
+                           the absolute cash flows of the position (and on the width of
+                           the interval of the safeguarded method)
+        max_iterations (int): Maximum number of steps of each method
+
+    Returns:
+        dict: Arrays of one value per position:
+              rate (np.ma.MaskedArray, masked where not converged),
+              converged (bool), status (CONVERGED, NO_ROOT when the NPV never changes
+              sign, e.g. only BUYs, MAX_ITERATIONS, or INVALID for positions without
+              cash flows or with non finite ones), bracketed (solved by the safeguarded
+              method), iterations (steps of both methods) and residual (relative NPV at the rate)
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    days = np.asarray(days, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.int64)
+    size = int(positions.max()) + 1 if n_positions is None and len(positions) else int(n_positions or 0)
+
+    # Years since the first cash flow of each position, and NPVs relative to the size of the flows
+    first_day = np.full(size, np.inf)
+    np.minimum.at(first_day, positions, days)
+    years = (days - first_day[positions]) / 365
+    scale = np.bincount(positions, weights=np.abs(amounts), minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amounts = amounts / scale[positions]
+    invalid = ~(scale > 0) | ~np.isfinite(scale)
+
+    # Without both invested and received cash flows, the NPV can't be zero
+    received = np.bincount(positions, weights=np.maximum(amounts, 0), minlength=size)
+    invested = np.bincount(positions, weights=np.maximum(-amounts, 0), minlength=size)
+    solvable = ~invalid & (received > 0) & (invested > 0)
+
+    if guess is None:
+        # Continuous rate turning the invested amount into the received one between their
+        # mean dates: exact for one investment and one payment, close for the others
+        with np.errstate(divide="ignore", invalid="ignore"):
+            duration = (
+                np.bincount(positions, weights=years * np.maximum(amounts, 0), minlength=size) / received
+                - np.bincount(positions, weights=years * np.maximum(-amounts, 0), minlength=size) / invested
+            )
+            start = np.log(received / invested) / duration
+        start = np.where(np.isfinite(start), start, np.log1p(0.1))
+    else:
+        start = np.full(size, np.log1p(guess))
+
+    growth, converged, iterations = _newton(
+        amounts, years, positions, size, start, solvable, tolerance, max_iterations
+    )
+    has_root = converged.copy()
+
+    # Positions left by Newton's method: solve their cash flows again with the safeguarded method
+    bracketed = solvable & ~converged
+    if bracketed.any():
+        subset = np.flatnonzero(bracketed)
+        number = np.full(size, -1, dtype=np.int64)
+        number[subset] = np.arange(len(subset))
+        kept = bracketed[positions]
+        sub_growth, sub_converged, sub_root, sub_iterations = _bracketed(
+            amounts[kept], years[kept], number[positions[kept]], len(subset), start[subset], tolerance,
+            max_iterations,
+        )
+        growth[subset] = sub_growth
+        converged[subset] = sub_converged
+        has_root[subset] = sub_root
+        iterations[subset] += sub_iterations
+
+    # Relative NPV at the final rates
+    npv, _ = _npv(amounts, years, positions, growth, size)
+    residual = np.where(has_root & ~invalid, np.abs(npv), np.nan)
+
+    status = np.full(size, MAX_ITERATIONS, dtype=object)
+    status[converged] = CONVERGED
+    status[~has_root] = NO_ROOT
+    status[invalid] = INVALID
+    return {
+        "rate": masked(np.expm1(growth), ~converged),
+        "converged": converged,
+        "status": status,
+        "bracketed": bracketed,
+        "iterations": iterations,
+        "residual": residual,
+    }
+
+
+@instrument.timed()
+def twr_array(
+    prices: ArrayLike,
+    holdings: ArrayLike,
+    positions: ArrayLike,
+    end_prices: ArrayLike,
+    n_positions: int = None,
+) -> np.ma.MaskedArray:
+    """Calculate the time-weighted return of many positions in one vectorized pass
+
+    The holding period is cut at every cash flow, and the returns of the
+    sub-periods are chained, so the timing and size of the BUYs and SELLs
+    don't weigh on the result. Each position holds a single security valued
+    at the price of its transactions, so the return of a sub-period is the
+    price variation between two cash flows (reversed for a short position),
+    and a sub-period without holding has a zero return.
+
+    Args:
+        prices (ArrayLike): Unit price of each cash flow, sorted by position then date
+        holdings (ArrayLike): Signed quantity held after each cash flow
+        positions (ArrayLike): Position number of each cash flow, from 0 to n_positions - 1
+        end_prices (ArrayLike): Price of each position at the end of the period (NaN if unknown)
+        n_positions (int): Number of positions (default: highest position number + 1)
+
+    Returns:
+        np.ma.MaskedArray: Time-weighted returns as ratios, masked where invalid
+                           (no cash flow, missing end price of an open position...)
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    holdings = np.asarray(holdings, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.int64)
+    end_prices = np.asarray(end_prices, dtype=np.float64)
+    size = int(positions.max()) + 1 if n_positions is None and len(positions) else int(n_positions or 0)
+
+    # Last cash flow of each position, and whether each cash flow follows one of the same position
+    last = np.full(size, -1, dtype=np.int64)
+    last[positions] = np.arange(len(positions))
+    follows = np.zeros(len(positions), dtype=bool)
+    follows[1:] = positions[1:] == positions[:-1]
+
+    # Sub-periods between two cash flows of a position, then from its last cash flow to the end
+    previous = np.flatnonzero(follows) - 1
+    held = np.concatenate([holdings[previous], holdings[last[last >= 0]]])
+    start_prices = np.concatenate([prices[previous], prices[last[last >= 0]]])
+    stop_prices = np.concatenate([prices[previous + 1], end_prices[last >= 0]])
+    periods = np.concatenate([positions[previous], np.flatnonzero(last >= 0)])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = 1 + np.sign(held) * (stop_prices / start_prices - 1)
+    growth = np.where(np.abs(held) > EPSILON, growth, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_growth = np.bincount(periods, weights=np.log(growth), minlength=size)
+        result = np.expm1(log_growth)
+
+    return masked(result, last < 0)
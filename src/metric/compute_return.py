@@ -1,5 +1,16 @@
 """Module containing functions which compute return"""
 
+from typing import TYPE_CHECKING, Union
+import numpy as np
+from src import instrument
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Inputs accepted by the array versions of the functions
+ArrayLike = Union[float, np.ndarray, "pd.Series", list]
+
 
 def cumulative_return(curent_price: float, original_price: float) -> float:
     """Calculate the cumulative return of a security
@@ -46,3 +57,109 @@ def required_annualized_return(
     result = ((required_price / current_price) ** (1 / nb_years)) - 1
 
     return result
+
+
+def masked(result: np.ndarray, invalid: np.ndarray) -> np.ma.MaskedArray:
+    """
+    Mask the invalid inputs and the non finite results of an array function.
+
+    Args:
+        result (np.ndarray): Result computed for every input.
+        invalid (np.ndarray): True where the inputs are invalid.
+
+    Returns:
+        np.ma.MaskedArray: The result, NaN and masked where invalid or not finite.
+    """
+    invalid = invalid | ~np.isfinite(result)
+    return np.ma.masked_array(np.where(invalid, np.nan, result), mask=invalid)
+
+
+@instrument.timed()
+def cumulative_return_array(
+    curent_price: ArrayLike, original_price: ArrayLike
+) -> np.ma.MaskedArray:
+    """Calculate the cumulative return of many securities in one vectorized pass
+
+    Same formula as cumulative_return, with NumPy broadcasting of the inputs.
+    Instead of raising or returning inf, invalid inputs (NaN, negative current
+    price, zero or negative original price) give masked results.
+
+    Args:
+        curent_price (ArrayLike): Current prices of the securities
+        original_price (ArrayLike): Original prices of the securities
+
+    Returns:
+        np.ma.MaskedArray: Cumulative returns as ratios, masked where invalid
+    """
+    curent_price, original_price = np.broadcast_arrays(
+        np.asarray(curent_price, dtype=np.float64), np.asarray(original_price, dtype=np.float64)
+    )
+    invalid = ~(curent_price >= 0) | ~(original_price > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = (curent_price - original_price) / original_price
+
+    return masked(result, invalid)
+
+
+@instrument.timed()
+def annualized_return_array(
+    days_held: ArrayLike, cum_return: ArrayLike
+) -> np.ma.MaskedArray:
+    """Calculate the annualized return of many securities in one vectorized pass
+
+    Same formula as annualized_return, with NumPy broadcasting of the inputs
+    (e.g. one days_held per position against a shared cumulative return).
+    Invalid inputs (NaN, zero or negative days held, cumulative return below
+    -100%) give masked results instead of complex numbers or errors.
+
+    Args:
+        days_held (ArrayLike): Number of days each security was held
+        cum_return (ArrayLike): Cumulative return during the number of days
+
+    Returns:
+        np.ma.MaskedArray: Annualized returns, masked where invalid
+    """
+    # Masked cumulative returns (e.g. from cumulative_return_array) stay masked
+    days_held, cum_return = np.broadcast_arrays(
+        np.asarray(days_held, dtype=np.float64), np.ma.filled(np.ma.asarray(cum_return, dtype=np.float64), np.nan)
+    )
+    invalid = ~(days_held > 0) | ~(cum_return >= -1)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        result = ((1 + cum_return) ** (365 / days_held)) - 1
+
+    return masked(result, invalid)
+
+
+@instrument.timed()
+def required_annualized_return_array(
+    current_price: ArrayLike, required_price: ArrayLike, nb_years: ArrayLike
+) -> np.ma.MaskedArray:
+    """Calculate the required annualized return to reach required prices in x years,
+    for many securities in one vectorized pass
+
+    Same formula as required_annualized_return, with NumPy broadcasting of the
+    inputs (e.g. many positions against a shared horizon). Invalid inputs
+    (NaN, zero or negative prices, zero or negative number of years) give
+    masked results.
+
+    Args:
+        current_price (ArrayLike): Current prices of the securities
+        required_price (ArrayLike): Prices to reach
+        nb_years (ArrayLike): Number of years to reach the required prices
+
+    Returns:
+        np.ma.MaskedArray: Required annualized returns, masked where invalid
+    """
+    current_price, required_price, nb_years = np.broadcast_arrays(
+        np.asarray(current_price, dtype=np.float64),
+        np.asarray(required_price, dtype=np.float64),
+        np.asarray(nb_years, dtype=np.float64),
+    )
+    invalid = ~(current_price > 0) | ~(required_price > 0) | ~(nb_years > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        result = ((required_price / current_price) ** (1 / nb_years)) - 1
+
+    return masked(result, invalid)
@@ -1,8 +1,7 @@
 """Module containing functions which compute risk-adjusted return"""
 
 from typing import List
-import numpy as np
-from src.compute_function import rolling_variation
+from src.metric.compute_risk_matrix import risk_metrics
 
 
 def beta(security_returns: List[float], benchmark_returns: List[float]):
@@ -18,21 +17,8 @@ def beta(security_returns: List[float], benchmark_returns: List[float]):
     Returns:
         float: The calculated beta.
     """
-    # Calculate percentage variation for security returns
-    pct_change_security_returns = rolling_variation(security_returns, 2)
-
-    # Calculate percentage variation for benchmark returns
-    pct_change_benchmark_returns = rolling_variation(benchmark_returns, 2)
-
-    # Calculate the covariance between security_returns and benchmark_returns
-    covariance = np.cov(pct_change_benchmark_returns,
-                        pct_change_security_returns)[0, 1]
-
-    # Calculate the variance for benchmark_returns
-    variance = np.var(pct_change_benchmark_returns)
-
-    # Calculate beta metric
-    compute_beta = covariance / variance
+    # Calculate beta metric with the batched engine (one security, one benchmark)
+    compute_beta = risk_metrics(security_returns, benchmark_returns)["beta"][0, 0]
 
     return compute_beta
 
@@ -51,28 +37,15 @@ def sharpe_ratio(security_returns: List[float],
     Returns:
         float: The calculated Sharpe Ratio.
     """
-    # Calculate mean portfolio return
-    mean_security_return = np.mean(security_returns)
-
-    # Calculate mean benchmark return
-    mean_benchmark_return = np.mean(benchmark_returns)
-
-    # Calculate standard deviation of portfolio returns
-    std_dev_security = np.std(security_returns)
-
-    # Calculate excess return of portfolio over benchmark
-    excess_return = mean_security_return - mean_benchmark_return
-
-    # Calculate Sharpe Ratio
-    compute_sharpe_ratio = excess_return / std_dev_security
-    # rounded_compute_sharpe_ratio = round(compute_sharpe_ratio, 2)
+    # Calculate the metrics with the batched engine (one security, one benchmark)
+    metrics = risk_metrics(security_returns, benchmark_returns)
 
     return {
-        "mean_security_return": mean_security_return,
-        "mean_benchmark_return": mean_benchmark_return,
-        "std_dev_security": std_dev_security,
-        "excess_return": excess_return,
-        "compute_sharpe_ratio": compute_sharpe_ratio,
+        "mean_security_return": metrics["mean_security_return"][0],
+        "mean_benchmark_return": metrics["mean_benchmark_return"][0],
+        "std_dev_security": metrics["std_dev_security"][0],
+        "excess_return": metrics["excess_return"][0, 0],
+        "compute_sharpe_ratio": metrics["sharpe_ratio"][0, 0],
     }
 
 
@@ -91,20 +64,8 @@ def treynor_ratio(
     Returns:
         float: The calculated Sharpe Ratio.
     """
-    # Calculate mean portfolio return
-    mean_security_return = np.mean(security_returns)
-
-    # Calculate mean benchmark return
-    mean_benchmark_return = np.mean(benchmark_returns)
-
-    # Calculate the beta for the security relative to benchmark returns
-    compute_beta = beta(security_returns, benchmark_returns)
-
-    # Calculate excess return of portfolio over benchmark
-    excess_return = mean_security_return - mean_benchmark_return
-
-    # Calculate Sharpe Ratio
-    compute_treynor_ratio = excess_return / compute_beta
+    # Calculate the metrics with the batched engine, beta is computed only once
+    compute_treynor_ratio = risk_metrics(security_returns, benchmark_returns)["treynor_ratio"][0, 0]
 
     return {"compute_treynor_ratio": compute_treynor_ratio}
 
@@ -127,23 +88,9 @@ def jensen_alpha(
     Returns:
         float: The calculated Jensen's Alpha Ratio.
     """
-    # Calculate mean expected portfolio return
-    mean_expected_portfolio_return = np.mean(expected_portfolio_return)
-
-    # Calculate mean benchmark return
-    mean_benchmark_return = np.mean(benchmark_return)
-
-    # Calculate mean risk free rate
-    mean_risk_free_rate = np.mean(risk_free_rate)
-
-    # Calculate the beta of the portfolio
-    compute_beta = beta(expected_portfolio_return, benchmark_return)
-
-    # Calculate Jensen's Alpha Ratio
-    compute_alpha_ratio = (
-        mean_expected_portfolio_return
-        - mean_risk_free_rate
-        - compute_beta * (mean_benchmark_return - mean_risk_free_rate)
-    )
+    # Calculate the metrics with the batched engine, beta is computed only once
+    compute_alpha_ratio = risk_metrics(
+        expected_portfolio_return, benchmark_return, risk_free_rate
+    )["jensen_alpha"][0, 0]
 
     return {"compute_alpha_ratio": compute_alpha_ratio}
@@ -0,0 +1,91 @@
+"""Module containing a batched engine computing risk-adjusted returns of many securities
+against many benchmarks at once"""
+
+from typing import List, Union
+import numpy as np
+from src import instrument
+from src.compute_function import rolling_variation
+
+
+def _as_matrix(returns: Union[List[float], np.ndarray]) -> np.ndarray:
+    """Return returns as a 2-D float array with one series per column."""
+    matrix = np.asarray(returns, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    return matrix
+
+
+@instrument.timed()
+def risk_metrics(
+    security_returns: Union[List[float], np.ndarray],
+    benchmark_returns: Union[List[float], np.ndarray],
+    risk_free_rate: Union[List[float], np.ndarray] = None,
+) -> dict:
+    """
+    Calculate beta, Sharpe ratio, Treynor ratio and Jensen's alpha of every security
+    against every benchmark in one vectorized pass.
+
+    The formulas are those of compute_risk_adjusted_return; the intermediates
+    they share (means, standard deviations, percentage variations, covariances)
+    are computed once for the whole universe:
+    - beta = cov(pct change of benchmark, pct change of security) / var(pct change of benchmark)
+    - sharpe_ratio = (mean security return - mean benchmark return) / std dev of security returns
+    - treynor_ratio = (mean security return - mean benchmark return) / beta
+    - jensen_alpha = mean security return - mean risk free rate
+                     - beta * (mean benchmark return - mean risk free rate)
+
+    Args:
+        security_returns (List[float] or np.ndarray): Returns of N securities,
+            shape (T, N) (or (T,) for a single security).
+        benchmark_returns (List[float] or np.ndarray): Returns of M benchmarks,
+            shape (T, M) (or (T,) for a single benchmark).
+        risk_free_rate (List[float] or np.ndarray): Risk free rate, shape (T,).
+            Jensen's alpha is only computed when it is given.
+
+    Returns:
+        dict: mean_security_return (N,), mean_benchmark_return (M,),
+              std_dev_security (N,), excess_return, beta, sharpe_ratio,
+              treynor_ratio and jensen_alpha (N, M).
+    """
+    securities = _as_matrix(security_returns)
+    benchmarks = _as_matrix(benchmark_returns)
+
+    # Means and standard deviations of the returns
+    mean_security_return = securities.mean(axis=0)
+    mean_benchmark_return = benchmarks.mean(axis=0)
+    std_dev_security = securities.std(axis=0)
+    excess_return = mean_security_return[:, None] - mean_benchmark_return[None, :]
+
+    # Percentage variations, centered once for the covariance and the variance
+    # (a return of 0 gives infinite variations: NaN metrics, without warnings)
+    pct_change_securities = rolling_variation(securities, 2)
+    pct_change_benchmarks = rolling_variation(benchmarks, 2)
+    n_variations = len(pct_change_benchmarks)
+
+    # Sample covariance (like np.cov) and population variance (like np.var)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centered_securities = pct_change_securities - pct_change_securities.mean(axis=0)
+        centered_benchmarks = pct_change_benchmarks - pct_change_benchmarks.mean(axis=0)
+        covariance = centered_securities.T @ centered_benchmarks / (n_variations - 1)
+        variance = (centered_benchmarks ** 2).sum(axis=0) / n_variations
+        beta = covariance / variance[None, :]
+
+        metrics = {
+            "mean_security_return": mean_security_return,
+            "mean_benchmark_return": mean_benchmark_return,
+            "std_dev_security": std_dev_security,
+            "excess_return": excess_return,
+            "beta": beta,
+            "sharpe_ratio": excess_return / std_dev_security[:, None],
+            "treynor_ratio": excess_return / beta,
+        }
+
+    if risk_free_rate is not None:
+        mean_risk_free_rate = np.mean(risk_free_rate)
+        metrics["jensen_alpha"] = (
+            mean_security_return[:, None]
+            - mean_risk_free_rate
+            - beta * (mean_benchmark_return[None, :] - mean_risk_free_rate)
+        )
+
+    return metrics
@@ -0,0 +1,255 @@
+"""Module containing rolling-window risk-adjusted return calculators updated in O(1)
+per new observation"""
+
+from typing import List, Union
+import numpy as np
+
+
+class RollingCovariance:
+    """
+    Sliding-window means, variances and covariance of a pair of series.
+
+    The window is a ring buffer; each update adds the new pair and evicts the
+    oldest one with Welford-style updates, in O(1) per series. Every `window`
+    updates the moments are recomputed from the buffer, so rounding errors of
+    the removals can't accumulate (amortized O(1) as well). Any shape of array
+    state is supported, so many series are updated in parallel.
+
+    A NaN (or infinite) observation makes the moments NaN while it is in the
+    window; they are recomputed from the buffer when it is evicted. A series
+    whose last `count` observations are equal has exactly a zero variance
+    (and covariance), without the rounding errors of the removals.
+
+    Args:
+        window (int): Number of observations in the window.
+        shape (tuple): Shape of the observations (() for scalars, (N,) for N series).
+    """
+
+    def __init__(self, window: int, shape: tuple = ()):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.shape = shape
+        self.count = 0
+        self._position = 0
+        self._updates = 0
+        self._x = np.zeros((window,) + shape)
+        self._y = np.zeros((window,) + shape)
+        # Number of equal observations ending with the last one, per series
+        self._run_x = np.zeros(shape, dtype=np.int64)
+        self._run_y = np.zeros(shape, dtype=np.int64)
+        self._reset()
+
+    def _reset(self):
+        self.mean_x = np.zeros(self.shape)
+        self.mean_y = np.zeros(self.shape)
+        self._m2_x = np.zeros(self.shape)
+        self._m2_y = np.zeros(self.shape)
+        self._c_xy = np.zeros(self.shape)
+
+    def update(self, x, y):
+        """Add a new (x, y) observation, evicting the oldest one when the window is full."""
+        x = np.broadcast_to(np.asarray(x, dtype=np.float64), self.shape)
+        y = np.broadcast_to(np.asarray(y, dtype=np.float64), self.shape)
+
+        if self.count:
+            previous = (self._position - 1) % self.window
+            self._run_x = np.where(x == self._x[previous], self._run_x + 1, 1)
+            self._run_y = np.where(y == self._y[previous], self._run_y + 1, 1)
+        else:
+            self._run_x = np.ones(self.shape, dtype=np.int64)
+            self._run_y = np.ones(self.shape, dtype=np.int64)
+
+        resync = False
+        if self.count == self.window:
+            evicted_x, evicted_y = self._x[self._position].copy(), self._y[self._position].copy()
+            # The moments are NaN since it was added: they can only be recomputed without it
+            resync = not (np.isfinite(evicted_x).all() and np.isfinite(evicted_y).all())
+            if not resync:
+                self._remove(evicted_x, evicted_y)
+        self._x[self._position] = x
+        self._y[self._position] = y
+        self._position = (self._position + 1) % self.window
+        self._updates += 1
+        if resync or self._updates % self.window == 0:
+            self._resync()
+        else:
+            self._add(x, y)
+        self._zero_constant(x, y)
+
+    def _zero_constant(self, x: np.ndarray, y: np.ndarray):
+        """Set the exact moments of the series whose observations in the window are all equal."""
+        constant_x = self._run_x >= self.count
+        constant_y = self._run_y >= self.count
+        if constant_x.any() or constant_y.any():
+            self.mean_x = np.where(constant_x, x, self.mean_x)
+            self.mean_y = np.where(constant_y, y, self.mean_y)
+            self._m2_x = np.where(constant_x, 0.0, self._m2_x)
+            self._m2_y = np.where(constant_y, 0.0, self._m2_y)
+            self._c_xy = np.where(constant_x | constant_y, 0.0, self._c_xy)
+
+    def _add(self, x: np.ndarray, y: np.ndarray):
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x = self.mean_x + dx / self.count
+        self.mean_y = self.mean_y + dy / self.count
+        self._m2_x = self._m2_x + dx * (x - self.mean_x)
+        self._m2_y = self._m2_y + dy * (y - self.mean_y)
+        self._c_xy = self._c_xy + dx * (y - self.mean_y)
+
+    def _remove(self, x: np.ndarray, y: np.ndarray):
+        self.count -= 1
+        if self.count == 0:
+            self._reset()
+            return
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x = self.mean_x - dx / self.count
+        self.mean_y = self.mean_y - dy / self.count
+        self._m2_x = self._m2_x - dx * (x - self.mean_x)
+        self._m2_y = self._m2_y - dy * (y - self.mean_y)
+        self._c_xy = self._c_xy - dx * (y - self.mean_y)
+
+    def _resync(self):
+        """Recompute the moments from the observations of the window."""
+        self.count = min(self._updates, self.window)
+        x = self._x[:self.count]
+        y = self._y[:self.count]
+        self.mean_x = x.mean(axis=0)
+        self.mean_y = y.mean(axis=0)
+        self._m2_x = ((x - self.mean_x) ** 2).sum(axis=0)
+        self._m2_y = ((y - self.mean_y) ** 2).sum(axis=0)
+        self._c_xy = ((x - self.mean_x) * (y - self.mean_y)).sum(axis=0)
+
+    def variance_x(self, ddof: int = 0) -> np.ndarray:
+        """Variance of x over the window."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._m2_x / (self.count - ddof)
+
+    def variance_y(self, ddof: int = 0) -> np.ndarray:
+        """Variance of y over the window."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._m2_y / (self.count - ddof)
+
+    def covariance(self, ddof: int = 1) -> np.ndarray:
+        """Covariance of x and y over the window."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._c_xy / (self.count - ddof)
+
+
+class RollingRiskMetrics:
+    """
+    Rolling-window beta, Sharpe ratio, Treynor ratio and Jensen's alpha of many securities.
+
+    Each `update` with the returns of a new period costs O(1) per security,
+    instead of calling the functions of compute_risk_adjusted_return again on
+    the whole history. The metrics are those of compute_risk_adjusted_return
+    (and compute_risk_matrix) applied to the last `window` returns:
+    beta uses the percentage variations of the returns (window - 1 of them).
+
+    A NaN return makes the metrics NaN until it has left the window.
+
+    Args:
+        window (int): Number of returns in the window (at least 2).
+        n_securities (int): Number of securities updated in parallel.
+    """
+
+    def __init__(self, window: int, n_securities: int = 1):
+        if window < 2:
+            raise ValueError("window must be at least 2")
+        self.window = window
+        self.n_securities = n_securities
+        self._returns = RollingCovariance(window, (n_securities,))
+        self._variations = RollingCovariance(window - 1, (n_securities,))
+        self._risk_free = RollingCovariance(window)
+        self._previous = None
+
+    def update(
+        self,
+        security_returns: Union[float, List[float], np.ndarray],
+        benchmark_return: Union[float, List[float], np.ndarray],
+        risk_free_rate: float = 0.0,
+    ):
+        """
+        Add the returns of a new period.
+
+        Args:
+            security_returns: Return of each security (shape (n_securities,)).
+            benchmark_return: Return of the benchmark (a scalar, or one per security).
+            risk_free_rate (float): Risk free rate of the period.
+        """
+        shape = (self.n_securities,)
+        security = np.broadcast_to(np.asarray(security_returns, dtype=np.float64), shape)
+        benchmark = np.broadcast_to(np.asarray(benchmark_return, dtype=np.float64), shape)
+
+        if self._previous is not None:
+            previous_security, previous_benchmark = self._previous
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self._variations.update(
+                    (security - previous_security) / previous_security,
+                    (benchmark - previous_benchmark) / previous_benchmark,
+                )
+        self._returns.update(security, benchmark)
+        self._risk_free.update(risk_free_rate, risk_free_rate)
+        self._previous = (security.copy(), benchmark.copy())
+
+    @property
+    def count(self) -> int:
+        """Number of returns currently in the window."""
+        return self._returns.count
+
+    def mean_security_return(self) -> np.ndarray:
+        return self._returns.mean_x
+
+    def mean_benchmark_return(self) -> np.ndarray:
+        return self._returns.mean_y
+
+    def std_dev_security(self) -> np.ndarray:
+        return np.sqrt(self._returns.variance_x(ddof=0))
+
+    def beta(self) -> np.ndarray:
+        """Covariance (ddof=1) of the variations over the variance (ddof=0) of the benchmark variations."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._variations.covariance(ddof=1) / self._variations.variance_y(ddof=0)
+
+    def sharpe_ratio(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (self._returns.mean_x - self._returns.mean_y) / self.std_dev_security()
+
+    def treynor_ratio(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (self._returns.mean_x - self._returns.mean_y) / self.beta()
+
+    def jensen_alpha(self) -> np.ndarray:
+        mean_risk_free_rate = self._risk_free.mean_x
+        return (
+            self._returns.mean_x
+            - mean_risk_free_rate
+            - self.beta() * (self._returns.mean_y - mean_risk_free_rate)
+        )
+
+    def metrics(self) -> dict:
+        """
+        Return every metric of the current window.
+
+        Returns:
+            dict: mean_security_return, mean_benchmark_return, std_dev_security,
+                  beta, sharpe_ratio, treynor_ratio and jensen_alpha (one value per security).
+        """
+        beta = self.beta()
+        excess_return = self._returns.mean_x - self._returns.mean_y
+        mean_risk_free_rate = self._risk_free.mean_x
+        std_dev_security = self.std_dev_security()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                "mean_security_return": self._returns.mean_x,
+                "mean_benchmark_return": self._returns.mean_y,
+                "std_dev_security": std_dev_security,
+                "beta": beta,
+                "sharpe_ratio": excess_return / std_dev_security,
+                "treynor_ratio": excess_return / beta,
+                "jensen_alpha": (
+                    self._returns.mean_x - mean_risk_free_rate - beta * (self._returns.mean_y - mean_risk_free_rate)
+                ),
+            }
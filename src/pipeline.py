@@ -0,0 +1,263 @@
+"""This module contains a lazy DataFrame pipeline over the transformations of src.transform,
+with memoized stages"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from src import extract, transform
+from src.price_cache import PriceCache, default_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageMemo:
+    """
+    LRU of stage outputs keyed by fingerprint.
+
+    Outputs are shared between runs: with pandas Copy-on-Write (the default
+    since pandas 3), a caller modifying a returned DataFrame gets its own copy
+    and never alters the memoized one. The least recently used outputs are
+    evicted once there are more than `maxsize` of them or once their estimated
+    size (DataFrame.memory_usage) exceeds `max_bytes`.
+
+    Args:
+        maxsize (int): Maximum number of stage outputs kept.
+        max_bytes (int): Maximum total size of the stage outputs kept.
+    """
+
+    def __init__(self, maxsize: int = 64, max_bytes: int = 256 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, result: pd.DataFrame):
+        """Memoize a stage output, unless it is larger than max_bytes on its own."""
+        # deep: the strings of object columns are most of the size of the transactions
+        size = int(result.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Return hits, misses, evictions, size (number of outputs kept) and bytes (their estimated size)."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+# Memo used by Pipeline.run when none is given
+default_memo = StageMemo()
+
+
+def _ttl_period(cache: PriceCache) -> int:
+    """Return the number of the current period of the shortest ttl of the cache."""
+    ttl = min([cache.ttl, *cache.ttls.values()])
+    # No ttl: every run looks the prices up again
+    return int(time.time() // ttl) if ttl > 0 else time.time_ns()
+
+
+class Pipeline:
+    """
+    Lazy plan of transformations over a single DataFrame.
+
+    Each method returns a new Pipeline with one more stage; nothing runs until
+    `run` (or `to_dict`). Every stage works on the DataFrame produced by the
+    previous one (no dict-of-lists round trips, no input modified in place),
+    and its output is memoized under a fingerprint of the stage, its
+    parameters and its inputs, so running a plan again with unchanged inputs
+    (same database file, same price cache epoch...) skips the work. Plans can
+    share stages: a stage used twice in a plan runs once.
+
+    Example, the /overview flow:
+        transactions = Pipeline.from_database(db_file)
+        prices = transactions.keep(["isin"]).unique().with_last_price()
+        overview = transactions.group_by(["isin", "account_name"]).merge(prices).with_cumulative_return()
+        overview.to_dict()
+    """
+
+    def __init__(self, stage: str, function, key, inputs: tuple = ()):
+        self.stage = stage
+        self._function = function
+        self._key = key
+        self._inputs = inputs
+
+    # Sources
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Pipeline":
+        """Start a pipeline from a DataFrame (hashed once, it must not be modified afterwards)."""
+        fingerprint = _frame_fingerprint(df)
+        return cls("frame", lambda: df, lambda: fingerprint)
+
+    @classmethod
+    def from_dict(cls, input_dict: dict) -> "Pipeline":
+        """Start a pipeline from a dictionary of lists (e.g. extract.all_attribute)."""
+        return cls.from_frame(pd.DataFrame(input_dict))
+
+    @classmethod
+    def from_database(cls, db_file: str) -> "Pipeline":
+        """
+        Start a pipeline from the transactions of a database (see extract.all_attribute_columns).
+
+        The fingerprint is the size and modification time of the database
+        file (and of its WAL file), so any write invalidates the memoized stages.
+        """
+        return cls(
+            "database",
+            lambda: extract.all_attribute_columns(db_file, output="pandas"),
+            lambda: (os.path.abspath(db_file), _file_state(db_file), _wal_state(db_file)),
+        )
+
+    # Stages
+    def keep(self, columns: list) -> "Pipeline":
+        """Keep only the given columns (transform.keep_attribute)."""
+        columns = list(columns)
+        return self._then("keep", lambda df: df[[c for c in columns if c in df.columns]], tuple(columns))
+
+    def unique(self) -> "Pipeline":
+        """Drop the duplicated rows (transform.remove_duplicate, for a single column)."""
+        return self._then("unique", lambda df: df.drop_duplicates(ignore_index=True))
+
+    def with_last_price(self, cache: PriceCache = None) -> "Pipeline":
+        """
+        Add the last_date and last_price columns from the isin column (transform.add_last_price).
+
+        The fingerprint includes the price cache epoch, so the stage runs again
+        whenever a cached price changes, and the current period of the cache
+        ttl, so the prices are looked up again (and refreshed by the cache)
+        once they may have expired.
+        """
+
+        def current_cache() -> PriceCache:
+            return cache if cache is not None else default_cache()
+
+        def function(df: pd.DataFrame) -> pd.DataFrame:
+            last_dates, last_prices = transform.last_prices(df["isin"].tolist(), current_cache())
+            return df.assign(last_date=last_dates, last_price=last_prices)
+
+        def price_version() -> tuple:
+            cache = current_cache()
+            return id(cache), cache.epoch, _ttl_period(cache)
+
+        return self._then("with_last_price", function, price_version)
+
+    def group_by(self, attributes: list) -> "Pipeline":
+        """Sum the quantity and total price by attributes, SELLs subtracted (transform.group_by)."""
+        attributes = list(attributes)
+        return self._then("group_by", lambda df: transform.group_by_frame(attributes, df), tuple(attributes))
+
+    def merge(self, other: "Pipeline", on: str = "isin", how: str = "inner") -> "Pipeline":
+        """Merge with the output of another pipeline (transform.merge_dictionary)."""
+        return self._then("merge", lambda df, other_df: pd.merge(df, other_df, on=on, how=how), (on, how), (other,))
+
+    def with_cumulative_return(self) -> "Pipeline":
+        """Add the total_last_price and cumulative_return columns (transform.add_cumulative_return)."""
+        return self._then("with_cumulative_return", transform.add_cumulative_return_frame)
+
+    def apply(self, name: str, function, *params) -> "Pipeline":
+        """Add a custom stage: `function(df, *params)` must return a new DataFrame."""
+        return self._then(name, lambda df: function(df, *params), params)
+
+    # Execution
+    def fingerprint(self) -> str:
+        """Return the fingerprint of the output of the pipeline (stages, parameters and sources)."""
+        inputs = tuple(pipeline.fingerprint() for pipeline in self._inputs)
+        return hashlib.blake2b(repr((self.stage, self._key(), inputs)).encode(), digest_size=16).hexdigest()
+
+    def run(self, memo: StageMemo = None) -> pd.DataFrame:
+        """Run the stages whose output is not memoized yet and return the output DataFrame."""
+        return self._run(default_memo if memo is None else memo)
+
+    def to_dict(self, memo: StageMemo = None) -> dict:
+        """Run the pipeline and return its output as a dictionary of lists, like src.transform."""
+        return self.run(memo).to_dict("list")
+
+    def explain(self) -> str:
+        """Return the plan as an indented tree, the output stage first."""
+        lines = []
+
+        def visit(pipeline: "Pipeline", depth: int):
+            lines.append("    " * depth + pipeline.stage)
+            for parent in pipeline._inputs:
+                visit(parent, depth + 1)
+
+        visit(self, 0)
+        return "\n".join(lines)
+
+    def _then(self, stage: str, function, params=(), others: tuple = ()) -> "Pipeline":
+        key = params if callable(params) else (lambda: params)
+        return Pipeline(stage, function, key, (self,) + tuple(others))
+
+    def _run(self, memo: StageMemo) -> pd.DataFrame:
+        key = self.fingerprint()
+        result = memo.get(key)
+        if result is None:
+            inputs = [pipeline._run(memo) for pipeline in self._inputs]
+            result = self._function(*inputs)
+            memo.put(key, result)
+        return result
+
+
+def _frame_fingerprint(df: pd.DataFrame) -> tuple:
+    """Return a content fingerprint of a DataFrame (columns, dtypes and hash of the values)."""
+    hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+    return tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), digest
+
+
+def _file_state(path: str) -> tuple:
+    """Return (size, modification time) of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _wal_state(db_file: str) -> tuple:
+    """Return the state of the WAL file of a database, or None if it is missing or empty.
+
+    Opening a WAL database creates an empty WAL file: it must not change the fingerprint.
+    """
+    state = _file_state(f"{db_file}-wal")
+    return state if state is not None and state[0] else None
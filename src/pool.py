@@ -0,0 +1,211 @@
+"""This module contains a thread-safe pool of reusable SQLite connections"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from src import instrument
+
+
+logger = logging.getLogger(__name__)
+
+# Pools shared by the whole process, one per (database file, read_only)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections to a single database file.
+
+    Connections are opened lazily (at most `size` of them), handed out with
+    `connection()` and returned to the pool afterwards instead of being closed,
+    so callers don't pay the connect, schema parsing and cold page cache costs
+    on every query. A thread asking again for a connection gets back the one it
+    used last if it is idle (per-thread reuse), otherwise any idle connection.
+    When all connections are in use, callers wait for one to be released.
+
+    A connection keeps reading the file it was opened on: when the database
+    file is replaced at the same path (e.g. a rebuilt database moved over the
+    old one), the idle connections to the old file are closed and reopened on
+    checkout (the file identity, device and inode, is checked each time).
+
+    Args:
+        db_file (str): Path to the SQLite database file.
+        size (int): Maximum number of open connections.
+        read_only (bool): Open connections in read-only mode.
+        timeout (float): Maximum number of seconds to wait for a connection.
+    """
+
+    def __init__(self, db_file: str, size: int = 8, read_only: bool = True, timeout: float = 30.0):
+        self.db_file = db_file
+        self.size = size
+        self.read_only = read_only
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        self._idle = []
+        self._connections = []
+        # File identity (see _file_identity) of the database each connection was opened on
+        self._identities = {}
+        self._local = threading.local()
+
+        # Counters exposed by stats()
+        self._requests = 0
+        self._hits = 0
+        self._thread_hits = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._reopened = 0
+
+    def _file_identity(self) -> tuple:
+        """Return the (device, inode) of the database file, None if it doesn't exist."""
+        try:
+            stat = os.stat(self.db_file)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection to the database file."""
+        with instrument.span("pool.connect"):
+            if self.read_only:
+                uri = Path(self.db_file).resolve().as_uri() + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        logger.debug("Opened connection %d/%d to %s", len(self._connections) + 1, self.size, self.db_file)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection from the pool, opening or waiting for one if needed."""
+        identity = self._file_identity()
+        with self._condition:
+            self._requests += 1
+
+            # Wait until a connection is idle or a new one can be opened
+            if not self._idle and len(self._connections) >= self.size:
+                start = time.perf_counter()
+                self._waits += 1
+                available = self._condition.wait_for(lambda: self._idle, timeout=self.timeout)
+                self._wait_time += time.perf_counter() - start
+                if not available:
+                    raise sqlite3.OperationalError(
+                        f"Timed out after {self.timeout}s waiting for a connection to {self.db_file}"
+                    )
+
+            conn = None
+            if self._idle:
+                self._hits += 1
+                # Prefer the connection this thread used last
+                conn = getattr(self._local, "conn", None)
+                if conn is not None and conn in self._idle:
+                    self._thread_hits += 1
+                    self._idle.remove(conn)
+                else:
+                    conn = self._idle.pop()
+                if self._identities[conn] != identity:
+                    # Opened on a file since replaced: reopen it on the current one
+                    logger.debug("Reopening a connection to the replaced file %s", self.db_file)
+                    self._discard(conn)
+                    self._reopened += 1
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+                self._connections.append(conn)
+                # After connecting: a writable connection creates a missing file
+                self._identities[conn] = self._file_identity()
+
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Give a connection back to the pool."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection and releasing it on exit."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        """
+        Return the pool statistics.
+
+        Returns:
+            dict: size (maximum connections), open, idle and in_use connections,
+                  requests, hits (served by an already open connection),
+                  thread_hits (served by the connection of the same thread),
+                  hit_rate, waits (requests which had to wait), wait_time
+                  (total seconds spent waiting), avg_wait_time and reopened
+                  (connections reopened because the file was replaced).
+        """
+        with self._condition:
+            return {
+                "size": self.size,
+                "open": len(self._connections),
+                "idle": len(self._idle),
+                "in_use": len(self._connections) - len(self._idle),
+                "requests": self._requests,
+                "hits": self._hits,
+                "thread_hits": self._thread_hits,
+                "hit_rate": self._hits / self._requests if self._requests else 0.0,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "avg_wait_time": self._wait_time / self._waits if self._waits else 0.0,
+                "reopened": self._reopened,
+            }
+
+    def close(self):
+        """Close the idle connections of the pool."""
+        with self._condition:
+            for conn in self._idle:
+                self._discard(conn)
+            self._idle.clear()
+        logger.debug("Closed idle connections to %s", self.db_file)
+
+    def _discard(self, conn: sqlite3.Connection):
+        """Close a connection taken out of the idle list (with the condition held)."""
+        conn.close()
+        self._connections.remove(conn)
+        del self._identities[conn]
+
+
+def get_pool(db_file: str, size: int = 8, read_only: bool = True) -> ConnectionPool:
+    """
+    Return the process-wide connection pool of a database file, creating it on first use.
+
+    Args:
+        db_file (str): Path to the SQLite database file.
+        size (int): Maximum number of open connections, used when the pool is created.
+        read_only (bool): Whether the pool hands out read-only connections.
+
+    Returns:
+        ConnectionPool: The shared pool.
+    """
+    key = (str(Path(db_file).resolve()), read_only)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_file, size=size, read_only=read_only)
+            _pools[key] = pool
+    return pool
+
+
+def close_all():
+    """Close the idle connections of every shared pool and forget the pools."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
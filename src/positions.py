@@ -0,0 +1,357 @@
+"""This module contains an incremental position and cost-basis engine"""
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from src import database
+from src.pool import get_pool
+
+
+logger = logging.getLogger(__name__)
+
+# Cost-basis methods: average cost, or first in first out lots
+METHODS = ("average", "fifo")
+
+# Quantities smaller than this are considered as zero (rounding errors of fractional shares)
+EPSILON = 1e-9
+
+# Transactions applied by the engine, in chronological order
+TRANSACTION_QUERY = """
+SELECT t.id, t.isinId, t.accountId, t.brokerId, t.transaction_day, o.type, t.quantity, t.unit_price
+FROM "transaction" AS t
+JOIN "order" AS o ON t.orderId = o.id
+WHERE t.id > ?
+ORDER BY t.transaction_day, t.id
+"""
+
+# Stored positions with the names of their isin, account and broker
+HOLDINGS_QUERY = """
+SELECT isin.isin, isin.name, account.name, broker.name, p.quantity, p.cost_basis, p.realized_pnl
+FROM "position" AS p
+JOIN isin ON p.isinId = isin.id
+JOIN account ON p.accountId = account.id
+JOIN broker ON p.brokerId = broker.id
+WHERE p.method = ?
+ORDER BY isin.isin, account.name, broker.name
+"""
+
+# Keys of the holdings result set, in column order
+HOLDINGS_KEYS = [
+    "isin",
+    "isin_name",
+    "account_name",
+    "broker_name",
+    "quantity",
+    "total_price",
+    "realized_pnl",
+]
+
+
+class Position:
+    """
+    Running quantity, cost basis and realized P&L of one (isin, account, broker) key.
+
+    Quantities are signed: a SELL beyond the held quantity opens a short
+    position, closed by the next BUYs. With the FIFO method, `lots` holds the
+    open [transaction id, quantity, unit price] lots, oldest first.
+    """
+
+    __slots__ = ("quantity", "cost_basis", "realized_pnl", "lots")
+
+    def __init__(self, quantity: float = 0.0, cost_basis: float = 0.0, realized_pnl: float = 0.0, lots=None):
+        self.quantity = quantity
+        self.cost_basis = cost_basis
+        self.realized_pnl = realized_pnl
+        self.lots = deque(lots or [])
+
+    @property
+    def cost_price(self) -> float:
+        """Average cost of the held quantity (NaN for a closed position)."""
+        return self.cost_basis / self.quantity if self.quantity else math.nan
+
+    def apply_average(self, quantity: float, unit_price: float):
+        """Apply a signed quantity with the average cost method."""
+        if abs(self.quantity) <= EPSILON or (self.quantity > 0) == (quantity > 0):
+            self.quantity += quantity
+            self.cost_basis += quantity * unit_price
+            return
+
+        # Close (part of) the position at its average cost
+        average = self.cost_basis / self.quantity
+        closed = self.quantity if abs(self.quantity) <= abs(quantity) else -quantity
+        self.realized_pnl += closed * (unit_price - average)
+        self.quantity -= closed
+        self.cost_basis -= closed * average
+
+        # The rest opens a position in the other direction
+        remaining = quantity + closed
+        if abs(remaining) > EPSILON:
+            self.quantity = remaining
+            self.cost_basis = remaining * unit_price
+        elif abs(self.quantity) <= EPSILON:
+            self.quantity = 0.0
+            self.cost_basis = 0.0
+
+    def apply_fifo(self, transaction_id: int, quantity: float, unit_price: float):
+        """Apply a signed quantity with the FIFO method."""
+        remaining = quantity
+        lots = self.lots
+
+        # Close the oldest lots of the other direction first
+        while abs(remaining) > EPSILON and lots and (lots[0][1] > 0) != (remaining > 0):
+            lot = lots[0]
+            closed = lot[1] if abs(lot[1]) <= abs(remaining) else -remaining
+            self.realized_pnl += closed * (unit_price - lot[2])
+            self.cost_basis -= closed * lot[2]
+            lot[1] -= closed
+            remaining += closed
+            if abs(lot[1]) <= EPSILON:
+                lots.popleft()
+
+        # The rest opens a new lot
+        if abs(remaining) > EPSILON:
+            lots.append([transaction_id, remaining, unit_price])
+            self.cost_basis += remaining * unit_price
+
+        self.quantity += quantity
+        if not lots:
+            self.quantity = 0.0
+            self.cost_basis = 0.0
+
+
+class PositionBook:
+    """
+    In-memory positions keyed by (isinId, accountId, brokerId).
+
+    Transactions must be applied in chronological order; each one costs O(1)
+    with the average cost method (amortized O(1) with FIFO), so keeping the
+    book up to date only costs the new transactions.
+
+    Args:
+        method (str): Cost-basis method, one of METHODS.
+    """
+
+    def __init__(self, method: str = "average"):
+        if method not in METHODS:
+            raise ValueError(f"Unknown cost-basis method {method!r}, expected one of {METHODS}")
+        self.method = method
+        self.positions = {}
+        self.watermark = 0
+        self.last_day = None
+        self.dirty = set()
+
+    def apply(self, transactions) -> int:
+        """
+        Apply transactions sorted by date.
+
+        Args:
+            transactions (iterable): (id, isinId, accountId, brokerId, transaction_day,
+                                      order type, quantity, unit_price) tuples.
+
+        Returns:
+            int: Number of transactions applied.
+        """
+        fifo = self.method == "fifo"
+        count = 0
+        for transaction_id, isin_id, account_id, broker_id, day, order_type, quantity, unit_price in transactions:
+            key = (isin_id, account_id, broker_id)
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = Position()
+
+            # SELL quantities are stored as positive numbers
+            if order_type == "SELL":
+                quantity = -quantity
+            if fifo:
+                position.apply_fifo(transaction_id, quantity, unit_price)
+            else:
+                position.apply_average(quantity, unit_price)
+
+            self.dirty.add(key)
+            self.watermark = max(self.watermark, transaction_id)
+            self.last_day = day if self.last_day is None else max(self.last_day, day)
+            count += 1
+        return count
+
+
+class PositionEngine:
+    """
+    Positions of the transaction table, kept up to date incrementally and persisted.
+
+    The positions, the open FIFO lots and the state of the engine (highest
+    transaction id applied, last transaction day, revision of the transaction
+    table) are stored in the position, position_lot and position_state tables.
+    `update` only reads and applies the transactions added since the last
+    call; the positions are rebuilt from the whole history only when that
+    can't give the right result: older transactions were changed or inserted
+    (see database.get_revision), or new transactions are dated before the
+    last applied one.
+
+    Args:
+        db_file (str): Path of the SQLite database.
+        method (str): Cost-basis method, one of METHODS.
+    """
+
+    def __init__(self, db_file: str, method: str = "average"):
+        self.db_file = db_file
+        self.book = PositionBook(method)
+        self._lock = threading.Lock()
+        database.migrate(db_file)
+
+    @property
+    def method(self) -> str:
+        return self.book.method
+
+    def update(self, rebuild: bool = False) -> dict:
+        """
+        Apply the new transactions to the positions and persist them.
+
+        Args:
+            rebuild (bool): Recompute the positions from the whole history.
+
+        Returns:
+            dict: applied (number of transactions), rebuilt (bool), watermark and seconds.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            conn = sqlite3.connect(self.db_file, isolation_level=None)
+            try:
+                cursor = conn.cursor()
+                # Take the write lock first, so concurrent engines apply each transaction once
+                cursor.execute("BEGIN IMMEDIATE")
+                revision = database.get_revision(cursor)
+                state = cursor.execute(
+                    'SELECT watermark, last_day, revision FROM "position_state" WHERE method = ?', (self.method,)
+                ).fetchone()
+
+                if state is None or state[2] != revision:
+                    rebuild = True
+                elif not rebuild and (self.book.watermark, self.book.last_day) != state[:2]:
+                    # Another engine has written newer positions: start from them
+                    self._load(cursor, state)
+
+                transactions = [] if rebuild else cursor.execute(TRANSACTION_QUERY, (self.book.watermark,)).fetchall()
+                if transactions and self.book.last_day is not None and transactions[0][4] < self.book.last_day:
+                    logger.info("Backdated transactions, rebuilding the %s positions", self.method)
+                    rebuild = True
+
+                if rebuild:
+                    self.book = PositionBook(self.method)
+                    cursor.execute('DELETE FROM "position" WHERE method = ?', (self.method,))
+                    cursor.execute('DELETE FROM "position_lot" WHERE method = ?', (self.method,))
+                    transactions = cursor.execute(TRANSACTION_QUERY, (0,)).fetchall()
+
+                applied = self.book.apply(transactions)
+                # Nothing new: don't write, so the database (and its data_version) is unchanged
+                if applied or rebuild:
+                    self._save(cursor, revision)
+                cursor.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+        seconds = time.perf_counter() - start
+        logger.debug("Applied %d transactions to the %s positions in %.3fs", applied, self.method, seconds)
+        return {"applied": applied, "rebuilt": rebuild, "watermark": self.book.watermark, "seconds": seconds}
+
+    def holdings(self, include_closed: bool = False) -> dict:
+        """
+        Return the stored positions with the names of their isin, account and broker.
+
+        Args:
+            include_closed (bool): Also return the positions with a zero quantity.
+
+        Returns:
+            dict: Lists of isin, isin_name, account_name, broker_name, quantity,
+                  cost_price, total_price (cost basis) and realized_pnl.
+        """
+        with get_pool(self.db_file).connection() as conn:
+            rows = conn.execute(HOLDINGS_QUERY, (self.method,)).fetchall()
+
+        if not include_closed:
+            rows = [row for row in rows if abs(row[4]) > EPSILON]
+        output_dict = {key: [row[i] for row in rows] for i, key in enumerate(HOLDINGS_KEYS)}
+        output_dict["cost_price"] = [
+            total_price / quantity if quantity else math.nan
+            for quantity, total_price in zip(output_dict["quantity"], output_dict["total_price"])
+        ]
+        return output_dict
+
+    def _load(self, cursor: sqlite3.Cursor, state: tuple):
+        """Replace the in-memory book with the stored positions."""
+        book = PositionBook(self.method)
+        book.watermark, book.last_day = state[0], state[1]
+        cursor.execute(
+            'SELECT isinId, accountId, brokerId, quantity, cost_basis, realized_pnl FROM "position" WHERE method = ?',
+            (self.method,),
+        )
+        for isin_id, account_id, broker_id, quantity, cost_basis, realized_pnl in cursor.fetchall():
+            book.positions[(isin_id, account_id, broker_id)] = Position(quantity, cost_basis, realized_pnl)
+
+        cursor.execute(
+            """
+            SELECT isinId, accountId, brokerId, transaction_id, quantity, unit_price FROM "position_lot"
+            WHERE method = ? ORDER BY isinId, accountId, brokerId, seq
+        """,
+            (self.method,),
+        )
+        for isin_id, account_id, broker_id, transaction_id, quantity, unit_price in cursor.fetchall():
+            book.positions[(isin_id, account_id, broker_id)].lots.append([transaction_id, quantity, unit_price])
+        self.book = book
+
+    def _save(self, cursor: sqlite3.Cursor, revision: int):
+        """Write the positions changed since the last save and the state of the engine."""
+        book = self.book
+        updated_at = datetime.now(timezone.utc).isoformat()
+        keys = sorted(book.dirty)
+
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO "position"
+                (method, isinId, accountId, brokerId, quantity, cost_basis, realized_pnl, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (self.method, *key, book.positions[key].quantity, book.positions[key].cost_basis,
+                 book.positions[key].realized_pnl, updated_at)
+                for key in keys
+            ],
+        )
+
+        if self.method == "fifo":
+            cursor.executemany(
+                'DELETE FROM "position_lot" WHERE method = ? AND isinId = ? AND accountId = ? AND brokerId = ?',
+                [(self.method, *key) for key in keys],
+            )
+            cursor.executemany(
+                """
+                INSERT INTO "position_lot"
+                    (method, isinId, accountId, brokerId, seq, transaction_id, quantity, unit_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [
+                    (self.method, *key, seq, *lot)
+                    for key in keys
+                    for seq, lot in enumerate(book.positions[key].lots)
+                ],
+            )
+
+        cursor.execute(
+            """
+            INSERT INTO "position_state" (method, watermark, last_day, revision, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (method) DO UPDATE SET
+                watermark = excluded.watermark,
+                last_day = excluded.last_day,
+                revision = excluded.revision,
+                updated_at = excluded.updated_at
+        """,
+            (self.method, book.watermark, book.last_day, revision, updated_at),
+        )
+        book.dirty.clear()
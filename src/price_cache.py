@@ -0,0 +1,342 @@
+"""This module contains a two-level (memory + SQLite) cache of last security prices"""
+
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src import instrument
+from src.price_provider import PriceProvider, YFinanceProvider
+from src.quote_fetcher import QuoteFetcher
+
+
+logger = logging.getLogger(__name__)
+
+# Cache used by transform.add_last_price when no cache is given
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class PriceCache:
+    """
+    Cache of last close prices in front of a PriceProvider.
+
+    Prices are kept in an in-process LRU dictionary and, if `db_file` is given,
+    in a SQLite table so they survive restarts. A cached price is:
+    - fresh for `ttl` seconds (per symbol ttls override it): returned as is,
+    - stale for `stale_ttl` more seconds: returned as is while a background
+      thread fetches a new price (stale-while-revalidate),
+    - expired afterwards: fetched from the provider before returning.
+
+    Args:
+        provider (PriceProvider): Source of the prices.
+        db_file (str): Path of the SQLite file persisting the prices (None: memory only).
+        ttl (float): Default number of seconds a price is fresh.
+        ttls (dict): {symbol: ttl} overriding `ttl` for some symbols.
+        stale_ttl (float): Number of seconds a price can be served stale after its ttl.
+        maxsize (int): Maximum number of prices kept in memory (least recently used are evicted).
+        disk_maxsize (int): Maximum number of prices kept in the SQLite table (oldest are evicted).
+        fetcher (QuoteFetcher): Fetcher used by get_many for the missing prices
+                                (defaults to a QuoteFetcher of `provider`).
+    """
+
+    def __init__(
+        self,
+        provider: PriceProvider,
+        db_file: str = None,
+        ttl: float = 900,
+        ttls: dict = None,
+        stale_ttl: float = 86400,
+        maxsize: int = 1024,
+        disk_maxsize: int = 100_000,
+        fetcher: QuoteFetcher = None,
+    ):
+        self.provider = provider
+        self.fetcher = fetcher if fetcher is not None else QuoteFetcher(provider)
+        self.db_file = db_file
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.disk_maxsize = disk_maxsize
+
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="price-refresh")
+
+        # Incremented every time a cached price changes, see `epoch`
+        self._epoch = 0
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+            "provider_calls": 0,
+            "provider_symbols": 0,
+            "provider_errors": 0,
+        }
+
+        self._conn = None
+        # Number of rows of the SQLite table, kept up to date by _store and invalidate
+        self._disk_size = 0
+        if db_file is not None:
+            self._conn = sqlite3.connect(db_file, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS "price" (
+                    symbol TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    last_price REAL,
+                    fetched_at REAL
+                )
+            """
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_price_fetched_at ON "price" (fetched_at)')
+            self._conn.commit()
+            self._disk_size = self._conn.execute('SELECT COUNT(*) FROM "price"').fetchone()[0]
+
+    @property
+    def epoch(self) -> int:
+        """Counter incremented whenever a cached price changes (to invalidate derived results)."""
+        return self._epoch
+
+    def get(self, symbol: str) -> tuple:
+        """
+        Return the last close price of a symbol, from the cache if possible.
+
+        Args:
+            symbol (str): ISIN or ticker of the security.
+
+        Returns:
+            tuple: (datetime.date, float) date and value of the last close price.
+        """
+        entry = self._lookup(symbol)
+        now = time.time()
+
+        if entry is not None:
+            age = now - entry[2]
+            ttl = self.ttls.get(symbol, self.ttl)
+            if age <= ttl:
+                self._count("hits")
+                return entry[0], entry[1]
+            if age <= ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(symbol)
+                return entry[0], entry[1]
+
+        self._count("misses")
+        return self._fetch(symbol)
+
+    def get_many(self, symbols: list) -> tuple:
+        """
+        Return the last close prices of many symbols, fetching the missing ones together.
+
+        Cached prices are served like `get`; the others are fetched in one go by
+        the QuoteFetcher (batched or concurrent calls), and a symbol without a
+        price doesn't prevent the others from being returned.
+
+        Args:
+            symbols (list): ISINs or tickers of the securities.
+
+        Returns:
+            tuple: (prices, errors) with prices = {symbol: (datetime.date, float)}
+                   and errors = {symbol: exception} for the symbols without a price.
+        """
+        prices = {}
+        missing = []
+        now = time.time()
+
+        for symbol in dict.fromkeys(symbols):
+            entry = self._lookup(symbol)
+            if entry is not None:
+                age = now - entry[2]
+                ttl = self.ttls.get(symbol, self.ttl)
+                if age <= ttl:
+                    self._count("hits")
+                    prices[symbol] = entry[:2]
+                    continue
+                if age <= ttl + self.stale_ttl:
+                    self._count("stale_hits")
+                    self._refresh_in_background(symbol)
+                    prices[symbol] = entry[:2]
+                    continue
+            self._count("misses")
+            missing.append(symbol)
+
+        errors = {}
+        if missing:
+            self._count("provider_symbols", len(missing))
+            fetched, errors = self.fetcher.fetch(missing, on_call=lambda: self._count("provider_calls"))
+            self._count("provider_errors", len(errors))
+            fetched_at = time.time()
+            for symbol, (last_date, last_price) in fetched.items():
+                self._store(symbol, (last_date, last_price, fetched_at))
+            prices.update(fetched)
+
+        return prices, errors
+
+    def invalidate(self, symbol: str = None):
+        """Forget the cached price of a symbol (or of every symbol if None)."""
+        with self._lock:
+            if symbol is None:
+                self._memory.clear()
+                if self._conn is not None:
+                    self._conn.execute('DELETE FROM "price"')
+                    self._conn.commit()
+                    self._disk_size = 0
+            else:
+                self._memory.pop(symbol, None)
+                if self._conn is not None:
+                    deleted = self._conn.execute('DELETE FROM "price" WHERE symbol = ?', (symbol,)).rowcount
+                    self._conn.commit()
+                    self._disk_size -= deleted
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        """
+        Return the cache statistics.
+
+        Returns:
+            dict: hits, stale_hits, misses, disk_hits, evictions, disk_evictions,
+                  provider_calls (requests to the provider, one per batch and per retry),
+                  provider_symbols (symbols asked to it), provider_errors (symbols
+                  without a price), hit_rate, size (prices in memory) and epoch.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            requests = stats["hits"] + stats["stale_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / requests if requests else 0.0
+            stats["size"] = len(self._memory)
+            stats["epoch"] = self._epoch
+        return stats
+
+    def close(self):
+        """Stop the background refreshes and close the SQLite connection."""
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _lookup(self, symbol: str):
+        """Return the (date, price, fetched_at) entry of a symbol from memory or disk, or None."""
+        with self._lock:
+            entry = self._memory.get(symbol)
+            if entry is not None:
+                self._memory.move_to_end(symbol)
+                return entry
+
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                'SELECT last_date, last_price, fetched_at FROM "price" WHERE symbol = ?', (symbol,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._counters["disk_hits"] += 1
+            entry = (datetime.date.fromisoformat(row[0]), row[1], row[2])
+            self._remember(symbol, entry)
+            return entry
+
+    def _fetch(self, symbol: str) -> tuple:
+        """Fetch the price of a symbol from the provider and store it."""
+        self._count("provider_calls")
+        self._count("provider_symbols")
+        try:
+            with instrument.span("price_cache.fetch"):
+                last_date, last_price = self.provider.last_price(symbol)
+        except Exception:
+            self._count("provider_errors")
+            raise
+        self._store(symbol, (last_date, last_price, time.time()))
+        return last_date, last_price
+
+    def _store(self, symbol: str, entry: tuple):
+        """Store a fresh (date, price, fetched_at) entry in memory and on disk."""
+        with self._lock:
+            previous = self._memory.get(symbol)
+            if previous is None or previous[:2] != entry[:2]:
+                self._epoch += 1
+            self._remember(symbol, entry)
+
+            if self._conn is not None:
+                values = (entry[0].isoformat(), entry[1], entry[2], symbol)
+                updated = self._conn.execute(
+                    'UPDATE "price" SET last_date = ?, last_price = ?, fetched_at = ? WHERE symbol = ?', values
+                ).rowcount
+                if not updated:
+                    self._conn.execute(
+                        'INSERT INTO "price" (last_date, last_price, fetched_at, symbol) VALUES (?, ?, ?, ?)', values
+                    )
+                    self._disk_size += 1
+                    if self._disk_size > self.disk_maxsize:
+                        self._evict_disk()
+                self._conn.commit()
+
+    def _remember(self, symbol: str, entry: tuple):
+        """Put an entry in the memory LRU, evicting the least recently used ones."""
+        self._memory[symbol] = entry
+        self._memory.move_to_end(symbol)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _evict_disk(self):
+        """Delete the oldest prices of the SQLite table beyond disk_maxsize."""
+        excess = self._disk_size - self.disk_maxsize
+        deleted = self._conn.execute(
+            'DELETE FROM "price" WHERE symbol IN (SELECT symbol FROM "price" ORDER BY fetched_at LIMIT ?)',
+            (excess,),
+        ).rowcount
+        self._disk_size -= deleted
+        self._counters["disk_evictions"] += deleted
+
+    def _refresh_in_background(self, symbol: str):
+        """Fetch a new price for a stale symbol in a background thread (once at a time)."""
+        with self._lock:
+            if symbol in self._refreshing:
+                return
+            self._refreshing.add(symbol)
+
+        def refresh():
+            try:
+                self._fetch(symbol)
+            except Exception as e:  # keep serving the stale price
+                logger.warning("Error refreshing the price of %s: %s", symbol, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(symbol)
+
+        self._executor.submit(refresh)
+
+
+def default_cache() -> PriceCache:
+    """
+    Return the process-wide price cache, unless set_default_cache is called: yfinance
+    prices persisted in the SQLite file PRICE_CACHE_DB of config.py.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            from config import PRICE_CACHE_DB
+
+            os.makedirs(os.path.dirname(PRICE_CACHE_DB) or ".", exist_ok=True)
+            _default_cache = PriceCache(YFinanceProvider(), db_file=PRICE_CACHE_DB)
+        return _default_cache
+
+
+def set_default_cache(cache: PriceCache):
+    """Replace the process-wide price cache (e.g. with a persistent one or a fake provider)."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
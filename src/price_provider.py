@@ -0,0 +1,187 @@
+"""This module contains the providers of security prices used by the price cache"""
+
+import datetime
+import time
+import zlib
+from typing import TYPE_CHECKING
+import numpy as np
+
+# pandas (like yfinance) is only imported by the history methods, on first call
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class PriceProvider:
+    """
+    Interface of a source of security prices.
+
+    Subclasses implement `last_price`, which returns the date and value of the
+    last known close price of a symbol (an ISIN or a ticker), and raise an
+    exception when the symbol is unknown or the source is unreachable.
+    Providers able to fetch many symbols in a single call set `supports_batch`
+    and implement `last_prices`. Providers of daily history implement `history`.
+    """
+
+    name = "provider"
+    supports_batch = False
+
+    def last_price(self, symbol: str) -> tuple:
+        """
+        Return the last close price of a symbol.
+
+        Args:
+            symbol (str): ISIN or ticker of the security.
+
+        Returns:
+            tuple: (datetime.date, float) date and value of the last close price.
+        """
+        raise NotImplementedError
+
+    def last_prices(self, symbols: list) -> dict:
+        """
+        Return the last close prices of many symbols in a single call.
+
+        Symbols without a price are missing from the result instead of raising.
+
+        Args:
+            symbols (list): ISINs or tickers of the securities.
+
+        Returns:
+            dict: {symbol: (datetime.date, float)}.
+        """
+        raise NotImplementedError
+
+    def history(self, symbol: str, start: datetime.date, end: datetime.date) -> "pd.DataFrame":
+        """
+        Return the daily prices of a symbol between two dates.
+
+        Args:
+            symbol (str): ISIN or ticker of the security.
+            start (datetime.date): First date (included).
+            end (datetime.date): Last date (included).
+
+        Returns:
+            pd.DataFrame: One row per trading day (DatetimeIndex) with the columns
+                          Open, High, Low, Close and Volume.
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(PriceProvider):
+    """Prices downloaded from Yahoo Finance with yfinance."""
+
+    name = "yfinance"
+    supports_batch = True
+
+    def __init__(self, period: str = "5d"):
+        # A few days are enough to get the last close, even after a weekend or a holiday
+        self.period = period
+
+    def last_price(self, symbol: str) -> tuple:
+        import yfinance as yf
+
+        stock_history = yf.Ticker(symbol).history(period=self.period)["Close"].dropna()
+        if stock_history.empty:
+            raise LookupError(f"No price found for {symbol}")
+        return stock_history.index[-1].date(), float(stock_history.iloc[-1])
+
+    def last_prices(self, symbols: list) -> dict:
+        import yfinance as yf
+
+        close = yf.download(list(symbols), period=self.period, progress=False, group_by="column")["Close"]
+        if not hasattr(close, "columns"):
+            # A single symbol gives a Series
+            close = close.to_frame(symbols[0])
+
+        prices = {}
+        for symbol in close.columns:
+            stock_history = close[symbol].dropna()
+            if not stock_history.empty:
+                prices[symbol] = (stock_history.index[-1].date(), float(stock_history.iloc[-1]))
+        return prices
+
+    def history(self, symbol: str, start: datetime.date, end: datetime.date) -> "pd.DataFrame":
+        import yfinance as yf
+
+        # yfinance excludes the end date
+        history = yf.Ticker(symbol).history(start=start, end=end + datetime.timedelta(days=1), interval="1d")
+        return history[["Open", "High", "Low", "Close", "Volume"]]
+
+
+class FakeProvider(PriceProvider):
+    """
+    Offline provider serving prices from a dictionary, for tests and benchmarks.
+
+    Its daily history is a deterministic random walk per symbol (same symbol,
+    same prices), on business days.
+
+    Args:
+        prices (dict): {symbol: price} or {symbol: (date, price)}.
+        default (float): Price of the symbols missing from `prices`
+                         (None: raise LookupError for them).
+        latency (float): Seconds each call sleeps, to simulate network round trips.
+        supports_batch (bool): Whether `last_prices` can be used (one latency per batch).
+        timezone (str): Time zone of the history index, e.g. "America/New_York" like
+                        the exchange dates of yfinance (None: naive dates).
+    """
+
+    name = "fake"
+
+    def __init__(self, prices: dict = None, default: float = None, latency: float = 0.0,
+                 supports_batch: bool = False, timezone: str = None):
+        self.prices = dict(prices or {})
+        self.default = default
+        self.latency = latency
+        self.supports_batch = supports_batch
+        self.timezone = timezone
+        self.calls = 0
+
+    def _price(self, symbol: str) -> tuple:
+        value = self.prices.get(symbol, self.default)
+        if value is None:
+            raise LookupError(f"No price found for {symbol}")
+        if isinstance(value, tuple):
+            return value
+        return datetime.date.today(), float(value)
+
+    def last_price(self, symbol: str) -> tuple:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._price(symbol)
+
+    def last_prices(self, symbols: list) -> dict:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        prices = {}
+        for symbol in symbols:
+            try:
+                prices[symbol] = self._price(symbol)
+            except LookupError:
+                pass
+        return prices
+
+    def history(self, symbol: str, start: datetime.date, end: datetime.date) -> "pd.DataFrame":
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        import pandas as pd
+
+        # Random walk from a fixed origin, so any date range gives the same prices
+        dates = pd.bdate_range("2000-01-03", end, tz=self.timezone)
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, len(dates))))
+        history = pd.DataFrame(
+            {
+                "Open": close * (1 + rng.normal(0, 0.002, len(dates))),
+                "High": close * 1.01,
+                "Low": close * 0.99,
+                "Close": close,
+                "Volume": rng.integers(1_000, 100_000, len(dates)).astype(float),
+            },
+            index=dates,
+        )
+        return history[history.index >= pd.Timestamp(start, tz=self.timezone)]
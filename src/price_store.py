@@ -0,0 +1,244 @@
+"""This module contains a local store of daily security prices with incremental gap-filling"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+from src.price_provider import PriceProvider
+
+
+logger = logging.getLogger(__name__)
+
+# Columns stored for each day, in order
+FIELDS = ["open", "high", "low", "close", "volume"]
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(value) -> int:
+    """Convert a date ('YYYY-MM-DD', datetime.date or pd.Timestamp) to its day number since 1970-01-01."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    elif isinstance(value, pd.Timestamp):
+        value = value.date()
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def to_date(day: int) -> datetime.date:
+    """Convert a day number since 1970-01-01 to a datetime.date."""
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+class PriceStore:
+    """
+    Local time series store of daily OHLCV prices, one partition per symbol.
+
+    Each symbol directory holds two NumPy files, read memory-mapped:
+    - dates.npy: sorted day numbers (days since 1970-01-01) of the trading days,
+    - ohlcv.npy: one row per trading day with the columns of FIELDS,
+    and coverage.json, the list of [first day, last day] ranges already asked
+    to the provider (including week-ends and holidays, so they are not asked
+    again). Reading a range only fetches its missing gaps from the provider;
+    today is never marked as covered since its prices can still change.
+
+    The two NumPy files of a symbol are replaced and opened together under a
+    lock, so `load` never returns the dates of one version with the prices of
+    another (the store is written by a single process). Symbols are used as
+    directory names: they can't contain a path separator nor be '.' or '..'.
+
+    Args:
+        root_dir (str): Directory of the store (created if needed).
+        provider (PriceProvider): Source of the missing prices.
+    """
+
+    def __init__(self, root_dir: str, provider: PriceProvider):
+        self.root_dir = root_dir
+        self.provider = provider
+        self._lock = threading.Lock()
+        # Held only while the files of a partition are replaced or opened
+        self._files_lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _directory(self, symbol: str) -> str:
+        """Return the directory of a symbol, raising ValueError if it isn't a plain directory name."""
+        separators = [sep for sep in (os.sep, os.altsep, "\0") if sep]
+        if not symbol or symbol in (".", "..") or any(sep in symbol for sep in separators):
+            raise ValueError(f"Invalid symbol {symbol!r}")
+        return os.path.join(self.root_dir, symbol)
+
+    def _path(self, symbol: str, name: str) -> str:
+        return os.path.join(self._directory(symbol), name)
+
+    def coverage(self, symbol: str) -> list:
+        """Return the [first day, last day] ranges of a symbol already fetched from the provider."""
+        path = self._path(symbol, "coverage.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def gaps(self, symbol: str, start, end) -> list:
+        """
+        Return the ranges between two dates which are not stored yet for a symbol.
+
+        Returns:
+            list: (first day, last day) tuples of day numbers, both included.
+        """
+        start, end = to_day(start), to_day(end)
+        gaps = []
+        cursor = start
+        for first, last in self.coverage(symbol):
+            if last < cursor:
+                continue
+            if first > end:
+                break
+            if first > cursor:
+                gaps.append((cursor, first - 1))
+            cursor = max(cursor, last + 1)
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def load(self, symbol: str) -> tuple:
+        """
+        Return every stored day of a symbol, memory-mapped.
+
+        Returns:
+            tuple: (dates, ohlcv) arrays of day numbers and of rows with the columns of FIELDS.
+        """
+        with self._files_lock:
+            if not os.path.exists(self._path(symbol, "dates.npy")):
+                return np.array([], dtype=np.int64), np.empty((0, len(FIELDS)))
+            # The maps keep the opened versions readable when the files are replaced
+            return (
+                np.load(self._path(symbol, "dates.npy"), mmap_mode="r"),
+                np.load(self._path(symbol, "ohlcv.npy"), mmap_mode="r"),
+            )
+
+    def update(self, symbol: str, start, end) -> int:
+        """
+        Fetch from the provider the prices of a symbol missing between two dates.
+
+        Returns:
+            int: Number of gaps fetched (0 when everything was already stored).
+        """
+        today = to_day(datetime.date.today())
+        with self._lock:
+            gaps = self.gaps(symbol, start, end)
+            if not gaps:
+                return 0
+
+            dates, ohlcv = self.load(symbol)
+            new_dates = [np.asarray(dates)]
+            new_ohlcv = [np.asarray(ohlcv)]
+            coverage = self.coverage(symbol)
+            for first, last in gaps:
+                logger.debug("Fetching %s from %s to %s", symbol, to_date(first), to_date(last))
+                history = self.provider.history(symbol, to_date(first), to_date(last))
+                # yfinance dates the days at midnight of the exchange time zone: keep the exchange dates
+                if history.index.tz is not None:
+                    history.index = history.index.tz_localize(None).normalize()
+                history = history[
+                    (history.index >= pd.Timestamp(to_date(first))) & (history.index <= pd.Timestamp(to_date(last)))
+                ]
+                new_dates.append(
+                    history.index.values.astype("datetime64[D]").astype(np.int64)
+                )
+                new_ohlcv.append(history[["Open", "High", "Low", "Close", "Volume"]].to_numpy(dtype=np.float64))
+                # Today's prices can still change: don't mark it as covered
+                if first < today:
+                    coverage.append([first, min(last, today - 1)])
+
+            self._write(symbol, np.concatenate(new_dates), np.concatenate(new_ohlcv), coverage)
+            return len(gaps)
+
+    def history(self, symbol: str, start, end) -> pd.DataFrame:
+        """
+        Return the daily prices of a symbol between two dates, fetching only the missing gaps.
+
+        Returns:
+            pd.DataFrame: One row per trading day (DatetimeIndex) with the columns of FIELDS.
+        """
+        self.update(symbol, start, end)
+        dates, ohlcv = self.load(symbol)
+        first, last = np.searchsorted(dates, [to_day(start), to_day(end) + 1])
+        return pd.DataFrame(
+            np.array(ohlcv[first:last]),
+            index=pd.DatetimeIndex(np.asarray(dates[first:last]).astype("datetime64[D]"), name="date"),
+            columns=FIELDS,
+        )
+
+    def matrix(self, symbols: list, start, end, field: str = "close", fill: str = None) -> tuple:
+        """
+        Return one field of many symbols aligned on the same dates (dates × symbols).
+
+        Args:
+            symbols (list): ISINs or tickers of the securities.
+            start: First date (included).
+            end: Last date (included).
+            field (str): One of FIELDS.
+            fill (str): None (NaN when a symbol has no price on a date) or "ffill"
+                        (last known price, NaN before the first one).
+
+        Returns:
+            tuple: (dates, values) with dates a datetime64[D] array of the union of
+                   the trading days, and values a float array of shape (dates, symbols).
+        """
+        column = FIELDS.index(field)
+        first_day, last_day = to_day(start), to_day(end)
+
+        series = []
+        for symbol in symbols:
+            self.update(symbol, start, end)
+            dates, ohlcv = self.load(symbol)
+            first, last = np.searchsorted(dates, [first_day, last_day + 1])
+            series.append((np.asarray(dates[first:last]), np.asarray(ohlcv[first:last, column])))
+
+        all_dates = np.unique(np.concatenate([dates for dates, _ in series])) if series else np.array([], np.int64)
+        values = np.full((len(all_dates), len(symbols)), np.nan)
+        for i, (dates, column_values) in enumerate(series):
+            values[np.searchsorted(all_dates, dates), i] = column_values
+
+        if fill == "ffill" and len(all_dates):
+            valid = ~np.isnan(values)
+            last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(all_dates))[:, None], 0), axis=0)
+            values = np.where(valid.cumsum(axis=0) > 0, values[last_valid, np.arange(len(symbols))], np.nan)
+
+        return all_dates.astype("datetime64[D]"), values
+
+    def _write(self, symbol: str, dates: np.ndarray, ohlcv: np.ndarray, coverage: list):
+        """Write the partition of a symbol (sorted, last value wins for a duplicated day)."""
+        os.makedirs(self._directory(symbol), exist_ok=True)
+
+        # Keep the last occurrence of each day (the freshest fetch)
+        order = np.argsort(dates, kind="stable")[::-1]
+        unique_dates, index = np.unique(dates[order], return_index=True)
+        ohlcv = ohlcv[order][index]
+
+        names = ("dates.npy", "ohlcv.npy")
+        for name, array in zip(names, (unique_dates.astype(np.int64), ohlcv)):
+            with open(self._path(symbol, f"{name}.tmp"), "wb") as file:
+                np.save(file, array)
+        with self._files_lock:
+            for name in names:
+                os.replace(self._path(symbol, f"{name}.tmp"), self._path(symbol, name))
+
+        with open(self._path(symbol, "coverage.json.tmp"), "w", encoding="utf-8") as file:
+            json.dump(_merge_ranges(coverage), file)
+        os.replace(self._path(symbol, "coverage.json.tmp"), self._path(symbol, "coverage.json"))
+
+
+def _merge_ranges(ranges: list) -> list:
+    """Merge overlapping or adjacent [first, last] ranges."""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
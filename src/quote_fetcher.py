@@ -0,0 +1,152 @@
+"""This module contains a batched, concurrent and rate-limited quote fetcher"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src import instrument
+from src.price_provider import PriceProvider
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by threads.
+
+    Args:
+        rate (float): Number of tokens added per second (None: no limit).
+        capacity (float): Maximum number of tokens (burst size), defaults to `rate`.
+    """
+
+    def __init__(self, rate: float = None, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate or 1, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """Block until `tokens` tokens are available, then take them."""
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class QuoteFetcher:
+    """
+    Fetch the last prices of many symbols from a PriceProvider.
+
+    If the provider supports it, symbols are grouped in batches fetched with a
+    single `last_prices` call. Otherwise symbols are fetched one by one on a
+    thread pool of `max_workers` threads. Every provider call goes through a
+    token-bucket rate limiter and is retried with exponential backoff. Errors
+    are isolated per symbol: a failing symbol is reported in the errors and
+    doesn't prevent the others from being fetched.
+
+    Args:
+        provider (PriceProvider): Source of the prices.
+        max_workers (int): Maximum number of concurrent provider calls.
+        rate (float): Maximum number of provider calls per second (None: no limit).
+        burst (float): Number of provider calls allowed in a burst (defaults to `rate`).
+        retries (int): Number of retries of a failing provider call.
+        backoff (float): Seconds before the first retry, doubled at each retry.
+        batch_size (int): Maximum number of symbols per batched call.
+    """
+
+    def __init__(
+        self,
+        provider: PriceProvider,
+        max_workers: int = 8,
+        rate: float = None,
+        burst: float = None,
+        retries: int = 2,
+        backoff: float = 0.5,
+        batch_size: int = 100,
+    ):
+        self.provider = provider
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.limiter = TokenBucket(rate, burst)
+
+    def fetch(self, symbols: list, on_call=None) -> tuple:
+        """
+        Fetch the last close price of each symbol.
+
+        Args:
+            symbols (list): ISINs or tickers of the securities (duplicates are fetched once).
+            on_call (callable): Called without argument before every provider call
+                                (batches, single symbols and retries), e.g. to count them.
+
+        Returns:
+            tuple: (prices, errors) with prices = {symbol: (datetime.date, float)}
+                   and errors = {symbol: exception} for the symbols without a price.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        prices = {}
+        errors = {}
+        if not symbols:
+            return prices, errors
+
+        if getattr(self.provider, "supports_batch", False):
+            batches = [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = executor.map(lambda batch: self._call(self.provider.last_prices, batch, on_call), batches)
+                for batch, result in zip(batches, results):
+                    if isinstance(result, Exception):
+                        # The whole batch failed: fall back to one call per symbol
+                        logger.warning("Batch of %d symbols failed (%s), fetching them one by one", len(batch), result)
+                        batch_prices, batch_errors = self._fetch_each(batch, on_call)
+                        prices.update(batch_prices)
+                        errors.update(batch_errors)
+                        continue
+                    prices.update(result)
+                    for symbol in batch:
+                        if symbol not in result:
+                            errors[symbol] = LookupError(f"No price found for {symbol}")
+            return prices, errors
+
+        return self._fetch_each(symbols, on_call)
+
+    def _fetch_each(self, symbols: list, on_call=None) -> tuple:
+        """Fetch symbols one by one on the thread pool."""
+        prices = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as executor:
+            results = executor.map(lambda symbol: self._call(self.provider.last_price, symbol, on_call), symbols)
+            for symbol, result in zip(symbols, results):
+                if isinstance(result, Exception):
+                    errors[symbol] = result
+                else:
+                    prices[symbol] = result
+        return prices, errors
+
+    def _call(self, function, argument, on_call=None):
+        """Call the provider with rate limiting and retries, returning the last exception on failure."""
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            if on_call is not None:
+                on_call()
+            try:
+                with instrument.span("quotes.provider_call"):
+                    return function(argument)
+            except LookupError as e:
+                # Unknown symbol: retrying won't help
+                return e
+            except Exception as e:
+                if attempt == self.retries:
+                    return e
+                logger.debug("Provider call failed (%s), retry %d/%d", e, attempt + 1, self.retries)
+                time.sleep(self.backoff * 2 ** attempt)
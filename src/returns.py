@@ -0,0 +1,180 @@
+"""This module contains the money-weighted (XIRR) and time-weighted (TWR) returns of every position"""
+
+import logging
+import threading
+from datetime import date
+import numpy as np
+from src import database, instrument
+from src.compact import encode
+from src.metric.compute_position_return import CONVERGED, EPSILON, twr_array, xirr_array
+from src.metric.compute_return import annualized_return_array
+from src.pool import get_pool
+from src.price_cache import PriceCache, default_cache
+
+
+logger = logging.getLogger(__name__)
+
+# Cash flows of the transaction table, by position (isin, account) then date
+CASH_FLOW_QUERY = """
+SELECT isin.isin, isin.name, account.name, t.transaction_day, o.type, t.quantity, t.unit_price
+FROM "transaction" AS t
+JOIN "order" AS o ON t.orderId = o.id
+JOIN isin ON t.isinId = isin.id
+JOIN account ON t.accountId = account.id
+ORDER BY isin.isin, account.name, t.transaction_day, t.id
+"""
+
+# Cheap signature of the transaction table: appended, deleted or rewritten rows change it
+SIGNATURE_QUERY = 'SELECT max(id), count(*) FROM "transaction"'
+
+# Cash flows loaded by cash_flows, with the signature of their table, by database file
+_cash_flows = {}
+_cash_flows_lock = threading.Lock()
+
+
+def cash_flows(db_file: str) -> dict:
+    """
+    Return the cash flows of every (isin, account) position of the transaction table.
+
+    The flows are read once and kept in memory until the transaction table
+    changes (new rows, deleted rows, or a new revision of the history, see
+    database.get_revision), so computing the returns again, e.g. with new
+    prices, doesn't read the database.
+
+    Args:
+        db_file (str): Path of the SQLite database.
+
+    Returns:
+        dict: keys (list of (isin, isin_name, account_name), one per position) and
+              arrays of one value per transaction, sorted by position then date:
+              position (number of the position in keys), day (transaction_day),
+              amount (cash flow, negative for a BUY), price (unit price) and
+              holding (signed quantity held after the transaction).
+    """
+    with get_pool(db_file).connection() as conn:
+        cursor = conn.cursor()
+        signature = (*cursor.execute(SIGNATURE_QUERY).fetchone(), database.get_revision(cursor))
+        with _cash_flows_lock:
+            cached = _cash_flows.get(db_file)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with instrument.span("returns.fetch"):
+            rows = cursor.execute(CASH_FLOW_QUERY).fetchall()
+
+    isins, isin_names, account_names, days, order_types, quantities, prices = list(zip(*rows)) or [()] * 7
+
+    # Rows are sorted by position: the codes of (isin, account) number the positions in order
+    positions, keys = encode(zip(isins, isin_names, account_names))
+    positions = positions.astype(np.int64)
+    sign = np.where(np.array(order_types, dtype=object) == "SELL", -1.0, 1.0)
+    quantities = np.asarray(quantities, dtype=np.float64) * sign
+    prices = np.asarray(prices, dtype=np.float64)
+
+    # Running quantity of each position: cumulative sum restarted at the first row of each position
+    running = np.cumsum(quantities)
+    first = np.flatnonzero(np.diff(positions, prepend=-1))
+    holdings = running - np.repeat(running[first] - quantities[first], np.diff(np.append(first, len(positions))))
+
+    flows = {
+        "keys": keys.tolist(),
+        "position": positions,
+        "day": np.asarray(days, dtype=np.float64),
+        "amount": -quantities * prices,
+        "price": prices,
+        "holding": holdings,
+    }
+    with _cash_flows_lock:
+        _cash_flows[db_file] = (signature, flows)
+    logger.debug("Loaded %d cash flows of %d positions", len(positions), len(flows["keys"]))
+    return flows
+
+
+@instrument.timed()
+def position_returns(
+    db_file: str,
+    last_prices: dict = None,
+    as_of: date = None,
+    cache: PriceCache = None,
+    include_closed: bool = True,
+) -> dict:
+    """
+    Compute the XIRR and the time-weighted return of every (isin, account) position.
+
+    The cash flows of all the positions (see cash_flows) and their value on
+    `as_of`, at the last price, are solved together by the vectorized
+    functions of src.metric.compute_position_return: the whole book takes a
+    few milliseconds once the cash flows are in memory.
+
+    Args:
+        db_file (str): Path of the SQLite database.
+        last_prices (dict): {isin: price} valuing the open positions on `as_of`
+                            (default: the last prices of the price cache).
+        as_of (date): Date of the valuation (default: today).
+        cache (PriceCache): Price cache to use instead of the default one.
+        include_closed (bool): Also return the positions with a zero quantity.
+
+    Returns:
+        dict: Lists of isin, isin_name, account_name, quantity, invested (sum of
+              the BUYs), received (sum of the SELLs), market_value, xirr, twr,
+              annualized_twr, days_held and the diagnostics of the XIRR solver:
+              status (see xirr_array), iterations and residual. Returns which
+              can't be computed (no price of an open position, no root...) are NaN.
+    """
+    flows = cash_flows(db_file)
+    keys = flows["keys"]
+    size = len(keys)
+    isins = [key[0] for key in keys]
+
+    if last_prices is None:
+        prices, errors = (cache or default_cache()).get_many(isins)
+        for isin, error in errors.items():
+            logger.warning("No last price for %s: %s", isin, error)
+        last_prices = {isin: price for isin, (_, price) in prices.items()}
+    as_of_day = ((as_of or date.today()) - date(1970, 1, 1)).days
+
+    # Value of every position on as_of: the last cash flow of its XIRR
+    last = np.full(size, -1, dtype=np.int64)
+    last[flows["position"]] = np.arange(len(flows["position"]))
+    quantity = flows["holding"][last] if size else np.zeros(0)
+    end_prices = np.array([last_prices.get(isin, np.nan) for isin in isins], dtype=np.float64)
+    market_value = np.where(np.abs(quantity) > EPSILON, quantity * end_prices, 0.0)
+
+    amount, position = flows["amount"], flows["position"]
+    xirr = xirr_array(
+        np.concatenate([amount, market_value]),
+        np.concatenate([flows["day"], np.full(size, as_of_day, dtype=np.float64)]),
+        np.concatenate([position, np.arange(size)]),
+        size,
+    )
+    twr = twr_array(flows["price"], flows["holding"], position, end_prices, size)
+
+    first_day = np.full(size, np.inf)
+    np.minimum.at(first_day, position, flows["day"])
+    days_held = as_of_day - first_day
+    annualized_twr = annualized_return_array(days_held, twr)
+
+    not_converged = int(np.count_nonzero(xirr["status"] != CONVERGED))
+    if not_converged:
+        logger.info("No XIRR for %d of %d positions", not_converged, size)
+
+    output_dict = {
+        "isin": isins,
+        "isin_name": [key[1] for key in keys],
+        "account_name": [key[2] for key in keys],
+        "quantity": quantity.tolist(),
+        "invested": np.bincount(position, weights=np.maximum(-amount, 0), minlength=size).tolist(),
+        "received": np.bincount(position, weights=np.maximum(amount, 0), minlength=size).tolist(),
+        "market_value": market_value.tolist(),
+        "xirr": np.ma.filled(xirr["rate"], np.nan).tolist(),
+        "twr": np.ma.filled(twr, np.nan).tolist(),
+        "annualized_twr": np.ma.filled(annualized_twr, np.nan).tolist(),
+        "days_held": days_held.tolist(),
+        "status": xirr["status"].tolist(),
+        "iterations": xirr["iterations"].tolist(),
+        "residual": xirr["residual"].tolist(),
+    }
+    if not include_closed:
+        kept = [i for i, value in enumerate(output_dict["quantity"]) if abs(value) > EPSILON]
+        output_dict = {key: [values[i] for i in kept] for key, values in output_dict.items()}
+    return output_dict
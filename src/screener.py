@@ -0,0 +1,225 @@
+"""This module contains a multi-core screener ranking a universe of securities by risk-adjusted return"""
+
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from src import instrument
+from src.compute_function import rolling_variation
+from src.metric.compute_return import annualized_return_array, cumulative_return_array
+from src.metric.compute_risk_matrix import risk_metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Trading days per year, to convert a number of price rows to days held
+TRADING_DAYS = 252
+
+# Metrics computed for every security, in output order
+METRICS = ["beta", "sharpe_ratio", "treynor_ratio", "jensen_alpha", "cumulative_return", "annualized_return"]
+
+# Prices and parameters of the current worker process (see _init_worker)
+_worker = {}
+
+
+def screen_chunk(
+    prices: np.ndarray,
+    benchmark: np.ndarray,
+    risk_free_rate: np.ndarray = None,
+    days_held: float = None,
+) -> dict:
+    """
+    Compute the metrics of a block of securities.
+
+    Args:
+        prices (np.ndarray): Daily prices, shape (T, N), one security per column.
+        benchmark (np.ndarray): Daily prices of the benchmark, shape (T,).
+        risk_free_rate (np.ndarray): Daily risk free rate, shape (T - 1,) (default 0).
+        days_held (float): Calendar days between the first and last prices
+                           (default: T - 1 trading days).
+
+    Returns:
+        dict: {metric: array of shape (N,)} for every metric of METRICS.
+    """
+    security_returns = rolling_variation(prices, 2)
+    benchmark_returns = rolling_variation(np.asarray(benchmark, dtype=np.float64)[:, None], 2)
+    if risk_free_rate is None:
+        risk_free_rate = np.zeros(len(security_returns))
+    if days_held is None:
+        days_held = (len(prices) - 1) * 365 / TRADING_DAYS
+
+    metrics = risk_metrics(security_returns, benchmark_returns, risk_free_rate)
+    cumulative_return = cumulative_return_array(prices[-1], prices[0])
+    annualized_return = annualized_return_array(days_held, cumulative_return)
+
+    result = {key: metrics[key][:, 0] for key in ("beta", "sharpe_ratio", "treynor_ratio", "jensen_alpha")}
+    result["cumulative_return"] = np.ma.filled(cumulative_return, np.nan)
+    result["annualized_return"] = np.ma.filled(annualized_return, np.nan)
+    return result
+
+
+def _init_worker(source: tuple, benchmark: np.ndarray, risk_free_rate: np.ndarray, days_held: float):
+    """Map the price matrix of the parent (shared memory or .npy file) in a worker process, once."""
+    kind, location, shape, dtype = source
+    if kind == "shm":
+        # The pool workers share the resource tracker of the parent, which unlinks the block
+        shm = shared_memory.SharedMemory(name=location)
+        _worker["shm"] = shm
+        prices = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order="F")
+    else:
+        prices = np.load(location, mmap_mode="r")
+    _worker.update(prices=prices, benchmark=benchmark, risk_free_rate=risk_free_rate, days_held=days_held)
+
+
+def _screen_columns(start: int, stop: int) -> tuple:
+    """Compute the metrics of the securities start:stop of the mapped price matrix (in a worker)."""
+    prices = np.asarray(_worker["prices"][:, start:stop], dtype=np.float64)
+    return start, screen_chunk(prices, _worker["benchmark"], _worker["risk_free_rate"], _worker["days_held"])
+
+
+@instrument.timed()
+def screen(
+    prices,
+    benchmark: np.ndarray,
+    symbols: list = None,
+    risk_free_rate: np.ndarray = None,
+    days_held: float = None,
+    workers: int = None,
+    chunk_size: int = None,
+    rank_by: str = "sharpe_ratio",
+    top: int = None,
+) -> dict:
+    """
+    Rank a universe of securities by risk-adjusted return, using several processes.
+
+    The price matrix is placed once in shared memory (or, for a .npy file,
+    memory-mapped by every worker), and the worker processes attach to it when
+    they start: the tasks only carry column ranges, and only the few metric
+    values per security are sent back. Each worker computes the metrics of its
+    block of securities with the vectorized src.metric functions.
+
+    Args:
+        prices (np.ndarray or str): Aligned daily prices, shape (T, N), one security
+            per column (e.g. PriceStore.matrix(..., fill="ffill")), or the path of a
+            .npy file holding them.
+        benchmark (np.ndarray): Daily prices of the benchmark on the same dates, shape (T,).
+        symbols (list): Names of the N securities (default: column numbers).
+        risk_free_rate (np.ndarray): Daily risk free rate, shape (T - 1,) (default 0).
+        days_held (float): Calendar days between the first and last prices
+                           (default: T - 1 trading days).
+        workers (int): Number of processes (default: all CPUs; 1 computes in this process).
+        chunk_size (int): Securities per task (default: about 4 tasks per worker).
+        rank_by (str): Metric of METRICS ranking the securities, highest first (NaN last).
+        top (int): Keep only the `top` first securities.
+
+    Returns:
+        dict: symbol, rank and the metrics of METRICS, as lists sorted by rank.
+    """
+    if rank_by not in METRICS:
+        raise ValueError(f"Unknown metric '{rank_by}', expected one of {METRICS}.")
+
+    path = prices if isinstance(prices, str) else None
+    if path is not None:
+        prices = np.load(path, mmap_mode="r")
+    n_days, n_securities = prices.shape
+    benchmark = np.asarray(benchmark, dtype=np.float64)
+    if len(benchmark) != n_days:
+        raise ValueError(f"benchmark has {len(benchmark)} prices, expected {n_days}.")
+    if symbols is None:
+        symbols = list(range(n_securities))
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(math.ceil(n_securities / (workers * 4)), 1)
+    ranges = [(start, min(start + chunk_size, n_securities)) for start in range(0, n_securities, chunk_size)]
+
+    # Metrics of every security, filled block by block
+    metrics = {key: np.full(n_securities, np.nan) for key in METRICS}
+
+    if workers == 1:
+        for start, stop in ranges:
+            block = screen_chunk(
+                np.asarray(prices[:, start:stop], dtype=np.float64), benchmark, risk_free_rate, days_held
+            )
+            for key in METRICS:
+                metrics[key][start:stop] = block[key]
+    else:
+        shm = None
+        try:
+            if path is not None:
+                source = ("npy", path, None, None)
+            else:
+                # Column-major copy, so the block of columns of each task is contiguous
+                shm = shared_memory.SharedMemory(create=True, size=max(n_days * n_securities * 8, 1))
+                shared = np.ndarray((n_days, n_securities), dtype=np.float64, buffer=shm.buf, order="F")
+                shared[:] = prices
+                source = ("shm", shm.name, shared.shape, shared.dtype.str)
+
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(source, benchmark, risk_free_rate, days_held),
+            ) as executor:
+                futures = [executor.submit(_screen_columns, start, stop) for start, stop in ranges]
+                for future in futures:
+                    start, block = future.result()
+                    for key in METRICS:
+                        metrics[key][start : start + len(block[key])] = block[key]
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    logger.debug("Screened %d securities over %d days with %d worker(s)", n_securities, n_days, workers)
+    return rank(metrics, symbols, rank_by, top)
+
+
+def rank(metrics: dict, symbols: list, rank_by: str = "sharpe_ratio", top: int = None) -> dict:
+    """
+    Sort securities by a metric, highest first and NaN last.
+
+    Args:
+        metrics (dict): {metric: array of shape (N,)}.
+        symbols (list): Names of the N securities.
+        rank_by (str): Metric ranking the securities.
+        top (int): Keep only the `top` first securities.
+
+    Returns:
+        dict: symbol, rank and the metrics, as lists sorted by rank.
+    """
+    values = np.asarray(metrics[rank_by], dtype=np.float64)
+    # NaN are sorted last by argsort: sort the negated values for a descending order
+    order = np.argsort(-values, kind="stable")
+    if top is not None:
+        order = order[:top]
+
+    result = {"symbol": [symbols[i] for i in order], "rank": list(range(1, len(order) + 1))}
+    for key, values in metrics.items():
+        result[key] = np.asarray(values)[order].tolist()
+    return result
+
+
+def screen_store(store, symbols: list, benchmark: str, start, end, **kwargs) -> dict:
+    """
+    Screen securities of a PriceStore against a benchmark symbol between two dates.
+
+    The prices are aligned on the trading days of all the symbols and forward
+    filled (see PriceStore.matrix); `days_held` is the calendar span of the dates.
+
+    Args:
+        store (PriceStore): Store of the daily prices.
+        symbols (list): ISINs or tickers of the securities to screen.
+        benchmark (str): ISIN or ticker of the benchmark.
+        start: First date (included).
+        end: Last date (included).
+        **kwargs: Other arguments of screen (workers, rank_by, top...).
+
+    Returns:
+        dict: See screen.
+    """
+    dates, prices = store.matrix(list(symbols) + [benchmark], start, end, fill="ffill")
+    if len(dates) < 2:
+        raise ValueError(f"Not enough prices between {start} and {end} to screen.")
+    days_held = float((dates[-1] - dates[0]) / np.timedelta64(1, "D"))
+    return screen(prices[:, :-1], prices[:, -1], symbols=list(symbols), days_held=days_held, **kwargs)
@@ -2,10 +2,25 @@
 and feature engineering)
 """
 
-import yfinance as yf
-import pandas as pd
+import logging
+from typing import TYPE_CHECKING
+from src import instrument
+from src.compact import CompactTransactions, cost_prices
+from src.price_cache import PriceCache, default_cache
 
+# pandas takes a few hundred milliseconds to import: the functions using it
+# import it on first call, so importing this module stays fast
+if TYPE_CHECKING:
+    import pandas as pd
 
+
+logger = logging.getLogger(__name__)
+
+# Sums of each group: the net quantity and total price, and those of the BUYs for the cost price
+GROUP_SUMS = {'quantity': 'sum', 'total_price': 'sum', 'bought_quantity': 'sum', 'bought_total': 'sum'}
+
+
+@instrument.timed()
 def keep_attribute(input_dict: dict, keys_to_keep: list) -> dict:
     """
     Filters a dictionary by retaining only the specified keys.
@@ -14,9 +29,12 @@ def keep_attribute(input_dict: dict, keys_to_keep: list) -> dict:
     :param keys_to_keep: A list of keys to retain in the new dictionary.
     :return: A new dictionary containing only the specified keys.
     """
+    if isinstance(input_dict, CompactTransactions):
+        return input_dict.select(keys_to_keep)
     return {key: input_dict[key] for key in keys_to_keep if key in input_dict}
 
 
+@instrument.timed()
 def remove_duplicate(input_dict: dict) -> dict:
     """
     Remove duplicates from the list of values associated with any key in the input dictionary.
@@ -27,6 +45,10 @@ def remove_duplicate(input_dict: dict) -> dict:
     Returns:
     dict: The same dictionary with duplicates removed from the list of values.
     """
+    if isinstance(input_dict, CompactTransactions):
+        # Distinct codes, decoded once
+        return input_dict.distinct()
+
     # Iterate through each key in the dictionary
     for key in input_dict:
         # Use set to remove duplicates, then convert back to list
@@ -35,68 +57,165 @@ def remove_duplicate(input_dict: dict) -> dict:
     return input_dict
 
 
-def add_last_price(input_dict: dict):
+@instrument.timed()
+def add_last_price(input_dict: dict, cache: PriceCache = None):
     """
-    Add the latest stock prices to the input dictionary for each ISIN using yfinance.
+    Add the latest stock prices to the input dictionary for each ISIN.
+
+    Prices come from a price cache (by default the process-wide one, backed by
+    yfinance), and the missing ones are fetched together in batched or
+    concurrent calls. An ISIN without a price gets a None date and a NaN price
+    instead of failing the whole dictionary.
 
     Parameters:
     input_dict (dict): A dictionary with ISINs as values in a list.
+    cache (PriceCache): Price cache to use instead of the default one.
 
     Returns:
     dict: The same dictionary with a new key 'last_price' containing the last stock prices.
     """
-    # Initialize a dictionary to store the latest dates and values
-    last_dates = []
-    last_prices = []
-
-    # Iterate through each ISIN in the input dictionary
-    for isin in input_dict['isin']:
-        # Get the stock symbol from ISIN. This part might need a mapping function if the ISIN doesn't directly map to a symbol.
-        stock = yf.Ticker(isin)
-        # Retrieve the latest market data
-        stock_history = stock.history(period='1mo')['Close']
-        last_date = stock_history.index[-1].date()
-        last_price = stock_history.iloc[-1]
-        # Store the latest dates and prices in the dictionary
-        last_dates.append(last_date)
-        last_prices.append(last_price)
-
+    # Store the latest dates and prices in the dictionary
     output_dict = input_dict
-    output_dict['last_date'] = last_dates
-    output_dict['last_price'] = last_prices
+    output_dict['last_date'], output_dict['last_price'] = last_prices(input_dict['isin'], cache)
     return output_dict
 
 
+def last_prices(isins: list, cache: PriceCache = None) -> tuple:
+    """
+    Return the last close dates and prices of a list of ISINs, from a price cache.
+
+    Parameters:
+    isins (list): ISINs, possibly repeated (each one is fetched once).
+    cache (PriceCache): Price cache to use instead of the default one.
+
+    Returns:
+    tuple: (last_dates, last_prices) lists aligned with `isins`, None and NaN for an ISIN without a price.
+    """
+    if cache is None:
+        cache = default_cache()
+
+    # Get the stock prices from ISINs. This part might need a mapping function if the ISIN doesn't directly map to a symbol.
+    prices, errors = cache.get_many(isins)
+    for isin, error in errors.items():
+        logger.warning("No last price for %s: %s", isin, error)
+
+    last_dates = [prices[isin][0] if isin in prices else None for isin in isins]
+    last_price = [prices[isin][1] if isin in prices else float('nan') for isin in isins]
+    return last_dates, last_price
+
+
+@instrument.timed()
 def group_by(attributes: list, input_dict: dict) -> dict:
     """
     Groups data by specified columns and aggregate others.
 
     Args:
-        input_dict (dict): A dictionary of all transactions.
+        input_dict (dict): A dictionary of all transactions, or a CompactTransactions
+                           (grouped on its integer codes, see src.compact).
         attributes (list): List of column names to group by.
 
+    SELL transactions (order_type) are subtracted from the quantity and the
+    total price. The cost_price is the average price of the transactions in
+    the direction of the position, NaN for a closed one (see
+    compact.cost_prices). For the cost basis of positions (average cost or
+    FIFO), see src.positions.
+
     Returns:
         dict: A dictionary with grouped data.
     """
+    if isinstance(input_dict, CompactTransactions):
+        return input_dict.group_by(attributes)
+
+    import pandas as pd
+
     # Convert the dictionary to a pandas DataFrame
-    df = pd.DataFrame(input_dict)
+    output_dict = group_by_frame(attributes, pd.DataFrame(input_dict)).to_dict('list')
+    return output_dict
+
+
+def group_by_frame(attributes: list, df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Group a DataFrame of transactions like group_by, and return the grouped DataFrame.
+
+    Args:
+        attributes (list): List of column names to group by.
+        df (pd.DataFrame): Transactions with quantity, total_price and optionally order_type columns.
 
+    Returns:
+        pd.DataFrame: The attributes, quantity, cost_price and total_price of each group, sorted by attributes.
+    """
     # Group by the specified columns and aggregate
-    grouped_df = df.groupby(attributes).agg({
-        'quantity': 'sum',
-        'total_price': 'sum'
-    }).reset_index()
+    grouped_df = signed(_with_bought(df)).groupby(attributes).agg(GROUP_SUMS).reset_index()
+    return _with_cost_price(grouped_df)
+
+
+@instrument.timed()
+def group_by_batches(attributes: list, batches) -> dict:
+    """
+    Groups batches of transactions by specified columns and aggregate others.
+
+    Same result as group_by, but the transactions are consumed batch by batch
+    (e.g. from extract.iter_batches): only the running totals per group are
+    kept in memory, never the whole transaction history.
+
+    Args:
+        attributes (list): List of column names to group by.
+        batches (iterable): Batches of transactions (DataFrames or dictionaries).
+
+    Returns:
+        dict: A dictionary with grouped data.
+    """
+    import pandas as pd
+
+    totals = None
+    for batch in batches:
+        df = signed(_with_bought(pd.DataFrame(batch)))
+        partial = df.groupby(attributes).agg(GROUP_SUMS)
+        # Add the partial sums of this batch to the running totals
+        totals = partial if totals is None else totals.add(partial, fill_value=0)
+
+    if totals is None:
+        return {key: [] for key in attributes + ['quantity', 'cost_price', 'total_price']}
+
+    output_dict = _with_cost_price(totals.sort_index().reset_index()).to_dict('list')
+    return output_dict
+
+
+def _with_bought(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Add the quantity and total price of the BUY transactions (all of them if order_type is unknown)."""
+    if "order_type" not in df:
+        return df.assign(bought_quantity=df["quantity"], bought_total=df["total_price"])
+    is_buy = df["order_type"] != "SELL"
+    return df.assign(
+        bought_quantity=df["quantity"].where(is_buy, 0.0),
+        bought_total=df["total_price"].where(is_buy, 0.0),
+    )
 
-    grouped_df['cost_price'] = grouped_df['total_price'] / grouped_df['quantity']
+
+def _with_cost_price(grouped_df: "pd.DataFrame") -> "pd.DataFrame":
+    """Replace the sums of the BUYs of grouped transactions by their cost_price (see compact.cost_prices)."""
+    grouped_df['cost_price'] = cost_prices(
+        grouped_df['quantity'], grouped_df['total_price'], grouped_df['bought_quantity'], grouped_df['bought_total']
+    )
+    grouped_df = grouped_df.drop(columns=['bought_quantity', 'bought_total'])
 
     # Reorder columns to ensure 'total_price' is last
     columns_order = [col for col in grouped_df.columns if col != 'total_price'] + ['total_price']
-    grouped_df = grouped_df[columns_order]
+    return grouped_df[columns_order]
 
-    output_dict = grouped_df.to_dict('list')
-    return output_dict
+
+def signed(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Negate the quantity and total price of the SELL transactions (if order_type is known)."""
+    if "order_type" not in df:
+        return df
+    is_sell = df["order_type"] == "SELL"
+    if is_sell.any():
+        df = df.copy()
+        df.loc[is_sell, ["quantity", "total_price"]] *= -1
+    return df
 
 
+@instrument.timed()
 def merge_dictionary(input_dict_1: dict, input_dict_2: dict) -> dict:
     """
     Merges two dictionaries on the 'isin' column.
@@ -108,6 +227,8 @@ def merge_dictionary(input_dict_1: dict, input_dict_2: dict) -> dict:
     Returns:
         output_dict: The merged dictionary.
     """
+    import pandas as pd
+
     # Convert dictionaries to pandas DataFrames
     df1 = pd.DataFrame(input_dict_1)
     df2 = pd.DataFrame(input_dict_2)
@@ -118,6 +239,7 @@ def merge_dictionary(input_dict_1: dict, input_dict_2: dict) -> dict:
     return output_dict
 
 
+@instrument.timed()
 def add_cumulative_return(input_dict: dict) -> dict:
     """
     Calculate the cumulative return for a set of transactions.
@@ -132,9 +254,16 @@ def add_cumulative_return(input_dict: dict) -> dict:
     Returns:
     dict: input_dict + these new keys (total_last_price, cumulative_return)
     """
-    df = pd.DataFrame(input_dict)
-    df['total_last_price'] = df['quantity'] * df['last_price']
-    df['cumulative_return'] = (df['total_last_price'] - df['total_price']) / df['total_price']
+    import pandas as pd
 
-    output_dict = df.to_dict('list')
+    output_dict = add_cumulative_return_frame(pd.DataFrame(input_dict)).to_dict('list')
     return output_dict
+
+
+def add_cumulative_return_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Return a DataFrame with quantity, last_price and total_price columns plus total_last_price and cumulative_return."""
+    total_last_price = df['quantity'] * df['last_price']
+    return df.assign(
+        total_last_price=total_last_price,
+        cumulative_return=(total_last_price - df['total_price']) / df['total_price'],
+    )
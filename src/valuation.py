@@ -0,0 +1,306 @@
+"""This module contains a daily mark-to-market valuation of the portfolio, by account and broker"""
+
+import datetime
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+import numpy as np
+from src import database, instrument
+from src.pool import get_pool
+from src.positions import EPSILON
+
+if TYPE_CHECKING:
+    from src.price_store import PriceStore
+
+
+logger = logging.getLogger(__name__)
+
+# Attributes the valuation series can be grouped by (None: the whole portfolio)
+GROUPS = ("account_name", "broker_name")
+
+# Transactions valued by the engine, in chronological order
+TRANSACTION_QUERY = """
+SELECT t.id, isin.isin, account.name, broker.name, t.transaction_day, o.type, t.quantity, t.unit_price
+FROM "transaction" AS t
+JOIN "order" AS o ON t.orderId = o.id
+JOIN isin ON t.isinId = isin.id
+JOIN account ON t.accountId = account.id
+JOIN broker ON t.brokerId = broker.id
+WHERE t.id > ?
+ORDER BY t.transaction_day, t.id
+"""
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def as_of_sum(
+    rows: np.ndarray, columns: np.ndarray, values: np.ndarray, shape: tuple, start: np.ndarray
+) -> np.ndarray:
+    """
+    Cumulate values dated by row into a (dates, columns) matrix.
+
+    Args:
+        rows (np.ndarray): Row of each value, i.e. first date on or after its day
+                           (np.searchsorted(dates, days)).
+        columns (np.ndarray): Column of each value.
+        values (np.ndarray): Values to add from their row on.
+        shape (tuple): (number of dates, number of columns).
+        start (np.ndarray): Cumulated values before the first date, one per column.
+
+    Returns:
+        np.ndarray: start + the sum of the values dated on or before each date.
+    """
+    delta = np.zeros(shape)
+    np.add.at(delta, (rows, columns), values)
+    return start + np.cumsum(delta, axis=0)
+
+
+def as_of_last(
+    rows: np.ndarray, columns: np.ndarray, values: np.ndarray, shape: tuple, start: np.ndarray
+) -> np.ndarray:
+    """
+    Return the last value dated on or before each date, per column (forward filled).
+
+    Values must be in chronological order: the last one of a row wins.
+    `start` gives the values before the first date (NaN when unknown).
+    """
+    matrix = np.full(shape, np.nan)
+    # Keep the last value of each (row, column): assign in reverse order, then take the first ones
+    cells = rows * shape[1] + columns
+    _, last = np.unique(cells[::-1], return_index=True)
+    last = len(cells) - 1 - last
+    matrix[rows[last], columns[last]] = values[last]
+    return forward_fill(matrix, start)
+
+
+def forward_fill(matrix: np.ndarray, start: np.ndarray) -> np.ndarray:
+    """Replace the NaN of each column by its last valid value above it, or by `start` before the first one."""
+    # The start values are a first row, always taken as valid (NaN stays NaN)
+    filled = np.vstack([start[None, :], matrix])
+    valid = ~np.isnan(filled)
+    valid[0] = True
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(filled))[:, None], 0), axis=0)
+    return filled[last_valid, np.arange(filled.shape[1])][1:]
+
+
+class ValuationEngine:
+    """
+    Daily value, invested capital and P&L of the portfolio, kept up to date incrementally.
+
+    The quantity and the invested capital (BUYs minus SELLs, at their price)
+    of every (isin, account, broker) position are cumulated day by day with
+    an as-of join of the transactions against the trading days of the price
+    store, and valued with the close prices of the store (forward filled,
+    the last transaction price before the first close) in one vectorized
+    pass over the dates × positions matrices.
+
+    The matrices are kept in memory: `update` only reads the transactions
+    added since the last call and values the new days, starting from the
+    quantities and prices of the last valued day. The series are rebuilt from
+    the whole history only when older transactions were changed, deleted or
+    inserted (see database.get_revision), or new ones are dated on or before
+    the last valued day. Today's prices can still change (see PriceStore):
+    the series stop at the previous day.
+
+    Args:
+        db_file (str): Path of the SQLite database.
+        store (PriceStore): Store of the daily prices of the ISINs.
+        field (str): Price field of the store valuing the positions.
+    """
+
+    def __init__(self, db_file: str, store: "PriceStore", field: str = "close"):
+        self.db_file = db_file
+        self.store = store
+        self.field = field
+        self._lock = threading.Lock()
+        self._reset()
+        database.migrate(db_file)
+
+    def _reset(self):
+        """Forget the valued days and the transactions."""
+        self.watermark = 0
+        self.revision = None
+        self.transactions = 0
+        # Column of each (isin, account, broker) position and of each ISIN
+        self.positions = {}
+        self.isins = {}
+        self._position_isin = np.empty(0, dtype=np.int64)
+        # Valued dates (day numbers) and their value and invested capital, one column per position
+        self.dates = np.empty(0, dtype=np.int64)
+        self.value = np.empty((0, 0))
+        self.invested = np.empty((0, 0))
+        self.last_day = None
+        # State at the last valued date: quantity and invested capital per position, prices per ISIN
+        self._quantity = np.empty(0)
+        self._capital = np.empty(0)
+        self._close = np.empty(0)
+        self._trade_price = np.empty(0)
+        # Transactions read but dated after the last valued date
+        self._pending = {key: np.empty(0) for key in ("day", "position", "quantity", "amount", "price")}
+
+    @instrument.timed()
+    def update(self, end: datetime.date = None, rebuild: bool = False) -> dict:
+        """
+        Read the new transactions and value the new days up to `end`.
+
+        Args:
+            end (datetime.date): Last day to value (default and at most: yesterday).
+            rebuild (bool): Value the whole history again.
+
+        Returns:
+            dict: applied (number of transactions read), rebuilt (bool), days (number
+                  of trading days added) and seconds.
+        """
+        start = time.perf_counter()
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        end_day = (min(end or yesterday, yesterday) - EPOCH).days
+
+        with self._lock:
+            with get_pool(self.db_file).connection() as conn:
+                cursor = conn.cursor()
+                revision = database.get_revision(cursor)
+                count = cursor.execute('SELECT count(*) FROM "transaction"').fetchone()[0]
+                rows = cursor.execute(TRANSACTION_QUERY, (self.watermark,)).fetchall()
+
+                backdated = bool(rows) and len(self.dates) > 0 and rows[0][4] <= self.dates[-1]
+                changed = revision != self.revision or count != self.transactions + len(rows)
+                if rebuild or backdated or (changed and self.revision is not None):
+                    if backdated:
+                        logger.info("Backdated transactions, rebuilding the valuation")
+                    rebuild = True
+                    self._reset()
+                    rows = cursor.execute(TRANSACTION_QUERY, (0,)).fetchall()
+
+            self.revision = revision
+            self.transactions = count
+            self._add(rows)
+            days = self._extend(end_day)
+
+        seconds = time.perf_counter() - start
+        logger.debug("Valued %d new days with %d new transactions in %.3fs", days, len(rows), seconds)
+        return {"applied": len(rows), "rebuilt": rebuild, "days": days, "seconds": seconds}
+
+    def series(self, by: str = None) -> dict:
+        """
+        Return the daily value, invested capital and P&L, by account or broker.
+
+        Args:
+            by (str): One of GROUPS, or None for the whole portfolio.
+
+        Returns:
+            dict: date (datetime64[D] array of the valued days), names (the accounts,
+                  brokers, or ["total"]) and value, invested and pnl arrays of shape
+                  (dates, names).
+        """
+        if by is not None and by not in GROUPS:
+            raise ValueError(f"Unknown attribute '{by}', expected one of {GROUPS} or None.")
+
+        with self._lock:
+            keys = list(self.positions)
+            value, invested = self.value, self.invested
+            dates = self.dates
+
+        # Sum the positions of each group with a (positions, groups) matrix of ones
+        if by is None:
+            names, groups = ["total"], np.zeros(len(keys), dtype=np.int64)
+        else:
+            labels = [key[GROUPS.index(by) + 1] for key in keys]
+            names = sorted(set(labels))
+            index = {name: i for i, name in enumerate(names)}
+            groups = np.array([index[label] for label in labels], dtype=np.int64)
+        membership = np.zeros((len(keys), len(names)))
+        membership[np.arange(len(keys)), groups] = 1.0
+
+        value, invested = value @ membership, invested @ membership
+        return {
+            "date": dates.astype("datetime64[D]"),
+            "names": names,
+            "value": value,
+            "invested": invested,
+            "pnl": value - invested,
+        }
+
+    def _add(self, rows: list):
+        """Number the positions and ISINs of new transactions and add them to the pending ones."""
+        if not rows:
+            return
+        self.watermark = max(self.watermark, max(row[0] for row in rows))
+
+        columns = [
+            self.positions.setdefault((isin, account, broker), len(self.positions))
+            for _, isin, account, broker, *_ in rows
+        ]
+        new_keys = list(self.positions)[len(self._position_isin):]
+        self._position_isin = np.concatenate([
+            self._position_isin,
+            np.array([self.isins.setdefault(key[0], len(self.isins)) for key in new_keys], dtype=np.int64),
+        ])
+
+        # New positions and ISINs start without quantity, capital nor price
+        new_positions = len(self.positions) - len(self._quantity)
+        new_isins = len(self.isins) - len(self._close)
+        self._quantity = np.append(self._quantity, np.zeros(new_positions))
+        self._capital = np.append(self._capital, np.zeros(new_positions))
+        self._close = np.append(self._close, np.full(new_isins, np.nan))
+        self._trade_price = np.append(self._trade_price, np.full(new_isins, np.nan))
+        self.value = np.hstack([self.value, np.zeros((len(self.dates), new_positions))])
+        self.invested = np.hstack([self.invested, np.zeros((len(self.dates), new_positions))])
+
+        _, _, _, _, days, order_types, quantities, prices = zip(*rows)
+        sign = np.where(np.array(order_types, dtype=object) == "SELL", -1.0, 1.0)
+        quantities = np.asarray(quantities, dtype=np.float64) * sign
+        prices = np.asarray(prices, dtype=np.float64)
+        new = {
+            "day": np.asarray(days, dtype=np.float64),
+            "position": np.asarray(columns, dtype=np.float64),
+            "quantity": quantities,
+            "amount": quantities * prices,
+            "price": prices,
+        }
+        self._pending = {key: np.concatenate([self._pending[key], new[key]]) for key in self._pending}
+
+    def _extend(self, end_day: int) -> int:
+        """Value the trading days after the last valued day, up to `end_day`, and return their number."""
+        pending = self._pending
+        if self.last_day is None:
+            if not len(pending["day"]):
+                return 0
+            self.last_day = int(pending["day"].min()) - 1
+        if end_day <= self.last_day or not self.isins:
+            return 0
+
+        first = EPOCH + datetime.timedelta(days=self.last_day + 1)
+        last = EPOCH + datetime.timedelta(days=end_day)
+        with instrument.span("valuation.prices"):
+            dates, close = self.store.matrix(list(self.isins), first, last, field=self.field)
+        dates = dates.astype(np.int64)
+        self.last_day = end_day
+        if not len(dates):
+            return 0
+
+        # As-of join of the transactions dated up to the last new date: first date on or after their day
+        applied = pending["day"] <= dates[-1]
+        rows = np.searchsorted(dates, pending["day"][applied])
+        positions = pending["position"][applied].astype(np.int64)
+        isins = self._position_isin[positions]
+        shape = (len(dates), len(self.positions))
+
+        quantity = as_of_sum(rows, positions, pending["quantity"][applied], shape, self._quantity)
+        invested = as_of_sum(rows, positions, pending["amount"][applied], shape, self._capital)
+        trade_price = as_of_last(
+            rows, isins, pending["price"][applied], (len(dates), len(self.isins)), self._trade_price
+        )
+        close = forward_fill(close, self._close)
+
+        # Close price of each position's ISIN, or its last transaction price before the first close
+        price = np.where(np.isnan(close), trade_price, close)[:, self._position_isin]
+        value = np.where(np.abs(quantity) > EPSILON, quantity * price, 0.0)
+
+        self.dates = np.concatenate([self.dates, dates])
+        self.value = np.vstack([self.value, value])
+        self.invested = np.vstack([self.invested, invested])
+        self._quantity, self._capital = quantity[-1], invested[-1]
+        self._close, self._trade_price = close[-1], trade_price[-1]
+        self._pending = {key: values[~applied] for key, values in pending.items()}
+        return len(dates)
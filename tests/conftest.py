@@ -0,0 +1,37 @@
+"""Fixtures shared by the tests: small hand-written transaction databases"""
+
+import csv
+import pytest
+from src import database
+
+
+# Ids of the fixed rows created by src.database
+ISINS = {1: "LU0131510165", 5: "US0846707026", 6: "US5705351048"}
+PEA, CTO = 1, 3
+BOURSE_DIRECT, TRADE_REPUBLIC = 1, 2
+BUY, SELL = 1, 2
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """
+    Return a function loading transactions into a SQLite database of tmp_path.
+
+    Each call takes (isinId, brokerId, accountId, date, orderId, quantity, unit_price)
+    tuples, appends them to the CSV export (ids following the previous ones),
+    loads it with database.incremental_from_csv and returns the database path.
+    """
+    csv_file = tmp_path / "transaction.csv"
+    db_file = str(tmp_path / "database.db")
+    rows = []
+
+    def load(*transactions) -> str:
+        rows.extend((len(rows) + 1, *transaction) for transaction in transactions)
+        with open(csv_file, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(database.TRANSACTION_COLUMNS)
+            writer.writerows(rows)
+        database.incremental_from_csv(str(csv_file), db_file)
+        return db_file
+
+    return load
@@ -0,0 +1,68 @@
+"""Tests of the dictionary-encoded transaction container (src.compact)"""
+
+import numpy as np
+import pytest
+from src import compact, transform
+from src.compact import CompactTransactions
+
+
+def transactions(rows: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    isins = rng.choice(["LU0131510165", "US0846707026", "US5705351048"], rows).tolist()
+    quantity = rng.integers(1, 50, rows).astype(float)
+    unit_price = np.round(rng.uniform(10, 200, rows), 2)
+    return {
+        "transaction_date": [f"2024-01-{day:02d}" for day in rng.integers(1, 29, rows)],
+        "isin": isins,
+        "isin_name": [f"name of {isin}" for isin in isins],
+        "broker_name": rng.choice(["BourseDirect", "TradeRepublic"], rows).tolist(),
+        "account_name": rng.choice(["PEA", "PEA-PME", "CTO"], rows).tolist(),
+        "order_type": rng.choice(["BUY", "SELL"], rows, p=[0.8, 0.2]).tolist(),
+        "quantity": quantity.tolist(),
+        "unit_price": unit_price.tolist(),
+        "total_price": (quantity * unit_price).tolist(),
+    }
+
+
+def assert_same_groups(result: dict, expected: dict):
+    assert list(result) == list(expected)
+    for key, values in expected.items():
+        if isinstance(values[0], str):
+            assert result[key] == values
+        else:
+            assert result[key] == pytest.approx(values)
+
+
+@pytest.mark.parametrize("attributes", [["isin"], ["isin", "account_name"], ["account_name", "transaction_date"]])
+def test_group_by_same_as_transform(attributes):
+    data = transactions(500)
+    assert_same_groups(CompactTransactions.from_dict(data).group_by(attributes), transform.group_by(attributes, data))
+
+
+def test_group_by_numbered_with_distinct_rows(monkeypatch):
+    data = transactions(500)
+    expected = CompactTransactions.from_dict(data).group_by(["isin", "account_name", "transaction_date"])
+    monkeypatch.setattr(compact, "MAX_GROUP_NUMBER", 1)
+    assert_same_groups(
+        CompactTransactions.from_dict(data).group_by(["isin", "account_name", "transaction_date"]), expected
+    )
+
+
+def test_group_by_many_distinct_values():
+    # 2000 distinct values of six attributes: 2000**6 possible groups, beyond an int64
+    rows = 2_000
+    data = transactions(rows)
+    data.update({
+        "transaction_date": [str(np.datetime64("2000-01-01") + i) for i in range(rows)],
+        "isin": [f"ISIN{i:08d}" for i in range(rows)],
+        "isin_name": [f"name {i}" for i in range(rows)],
+        "broker_name": [f"broker {i}" for i in range(rows)],
+        "account_name": [f"account {i}" for i in range(rows)],
+        "unit_price": np.arange(1.0, rows + 1).tolist(),
+    })
+    data["total_price"] = (np.array(data["quantity"]) * np.array(data["unit_price"])).tolist()
+    attributes = ["transaction_date", "isin", "isin_name", "broker_name", "account_name", "unit_price"]
+
+    result = CompactTransactions.from_dict(data).group_by(attributes)
+    assert len(result["isin"]) == rows
+    assert_same_groups(result, transform.group_by(attributes, data))
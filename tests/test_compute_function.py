@@ -0,0 +1,67 @@
+"""Tests of the vectorized rolling variations (src.compute_function)"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.compute_function import rolling_variation
+
+
+def baseline_rolling_variation(lst: list, window_size: int) -> list:
+    """The pandas rolling apply rolling_variation replaced (one Python call per window)."""
+    series = pd.Series(lst, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rolling_variations = series.rolling(window=window_size).apply(lambda x: (x[-1] - x[0]) / x[0], raw=True)
+    return rolling_variations.tolist()[window_size - 1:]
+
+
+SERIES = {
+    "random": list(np.round(np.random.default_rng(0).uniform(1, 100, 40), 2)),
+    "nan": [10.0, 11.0, np.nan, 12.0, 13.0, 14.0, np.nan, np.nan, 15.0, 16.0, 17.0, 18.0],
+    "zero": [0.0, 5.0, 0.0, 0.0, 4.0, -2.0, 0.0, 3.0, 3.0, 0.0],
+    "zero and nan": [0.0, np.nan, 0.0, 2.0, 0.0, np.nan, 1.0, 0.0, 0.0, 5.0],
+    "short": [100.0, 110.0],
+    "single": [100.0],
+}
+
+
+@pytest.mark.parametrize("window_size", [1, 2, 3, 5, 20])
+@pytest.mark.parametrize("name", list(SERIES))
+def test_same_as_baseline(name, window_size):
+    values = SERIES[name]
+    result = rolling_variation(values, window_size)
+    assert isinstance(result, list)
+    np.testing.assert_array_equal(result, baseline_rolling_variation(values, window_size))
+
+
+@pytest.mark.parametrize("window_size", [1, 2, 4, 12])
+def test_each_column_same_as_baseline(window_size):
+    # One series per column, of the same length
+    columns = [SERIES["nan"], SERIES["random"][:12], SERIES["zero"] + [1.0, 2.0], SERIES["zero and nan"] + [0.0, 1.0]]
+    matrix = np.column_stack(columns)
+    result = rolling_variation(matrix, window_size)
+    assert result.shape == (max(len(matrix) - window_size + 1, 0), len(columns))
+    for i, column in enumerate(columns):
+        np.testing.assert_array_equal(result[:, i], baseline_rolling_variation(column, window_size))
+
+
+def test_single_series_array():
+    values = np.array(SERIES["random"])
+    result = rolling_variation(values, 3)
+    assert isinstance(result, np.ndarray)
+    np.testing.assert_array_equal(result, baseline_rolling_variation(SERIES["random"], 3))
+    np.testing.assert_array_equal(rolling_variation(values[:, None], 3)[:, 0], result)
+
+
+def test_zero_division():
+    values = np.array(SERIES["zero and nan"])
+    result = rolling_variation(values.tolist(), 2, zero_division=0.0)
+    # The windows starting at 0 without a NaN (0 / 0 included) get the zero_division value
+    has_nan = np.isnan(values[:-1]) | np.isnan(values[1:])
+    expected = np.where((values[:-1] == 0) & ~has_nan, 0.0, baseline_rolling_variation(values.tolist(), 2))
+    np.testing.assert_array_equal(result, expected)
+    assert result[7] == 0.0 and np.isnan(result[0]) and np.isnan(result[4])
+
+
+def test_window_size_too_small():
+    with pytest.raises(ValueError):
+        rolling_variation([1.0, 2.0], 0)
@@ -0,0 +1,64 @@
+"""Tests of the batched XIRR and time-weighted return functions (src.metric.compute_position_return)"""
+
+import numpy as np
+import pytest
+from src.metric.compute_position_return import CONVERGED, INVALID, NO_ROOT, twr_array, xirr_array
+from src.metric.compute_return import masked
+
+
+def test_xirr_of_two_flows():
+    # 1000 invested, 1100 received one year later
+    result = xirr_array([-1000.0, 1100.0], [0, 365], [0, 0])
+    assert result["status"].tolist() == [CONVERGED]
+    assert result["rate"][0] == pytest.approx(0.1, abs=1e-12)
+
+
+def test_xirr_of_three_flows():
+    amounts, days = np.array([-100.0, -100.0, 230.0]), np.array([0.0, 182.0, 365.0])
+    result = xirr_array(amounts, days, [0, 0, 0])
+    rate = result["rate"][0]
+    assert rate == pytest.approx(0.2029373549, abs=1e-9)
+    assert amounts @ (1 + rate) ** (-days / 365) == pytest.approx(0.0, abs=1e-7)
+    assert result["residual"][0] <= 1e-10
+
+
+def test_xirr_of_many_positions_at_once():
+    amounts = [-1000.0, 1100.0, -100.0, -100.0, 230.0, -50.0, 20.0]
+    days = [0, 365, 0, 182, 365, 10, 375]
+    positions = [0, 0, 1, 1, 1, 2, 2]
+    result = xirr_array(amounts, days, positions)
+
+    for i in range(3):
+        kept = np.array(positions) == i
+        alone = xirr_array(np.array(amounts)[kept], np.array(days)[kept], np.zeros(kept.sum(), dtype=int))
+        assert result["rate"][i] == pytest.approx(alone["rate"][0], abs=1e-12)
+    # 50 turned into 20 in a year
+    assert result["rate"][2] == pytest.approx(-0.6, abs=1e-12)
+
+
+def test_xirr_without_root():
+    # Only BUYs, and a position without any cash flow
+    result = xirr_array([-100.0, -50.0], [0, 30], [0, 0], n_positions=2)
+    assert result["status"].tolist() == [NO_ROOT, INVALID]
+    assert result["rate"].mask.tolist() == [True, True]
+    assert not result["converged"].any()
+
+
+def test_twr_against_hand_computation():
+    # Position 0: 1 at 10, 2 more at 12, all sold at 15: 12/10 * 15/12 - 1
+    # Position 1: short 2 at 10, still short, 8 at the end: 1 + (1 - 8/10) - 1
+    # Position 2: open without an end price
+    result = twr_array(
+        prices=[10.0, 12.0, 15.0, 10.0, 20.0],
+        holdings=[1.0, 3.0, 0.0, -2.0, 5.0],
+        positions=[0, 0, 0, 1, 2],
+        end_prices=[18.0, 8.0, np.nan],
+    )
+    assert result[:2].tolist() == pytest.approx([0.5, 0.2])
+    assert result.mask.tolist() == [False, False, True]
+
+
+def test_masked():
+    result = masked(np.array([1.0, 2.0, np.inf]), np.array([False, True, False]))
+    assert result.mask.tolist() == [False, True, True]
+    assert np.ma.filled(result, 0.0).tolist() == [1.0, 0.0, 0.0]
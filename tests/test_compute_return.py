@@ -0,0 +1,99 @@
+"""Tests of the array versions of the return functions (src.metric.compute_return)"""
+
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from src.metric.compute_return import (
+    annualized_return,
+    annualized_return_array,
+    cumulative_return,
+    cumulative_return_array,
+    required_annualized_return,
+    required_annualized_return_array,
+)
+
+
+def scalar_or_none(function, *args):
+    """Return the scalar function result, None where it fails or isn't a finite real number."""
+    try:
+        result = function(*args)
+    except ZeroDivisionError:
+        return None
+    if isinstance(result, complex) or not math.isfinite(result):
+        return None
+    return result
+
+
+def assert_same_as_scalar(result: np.ma.MaskedArray, function, valid, *columns):
+    """
+    Check each row of an array result against the scalar function: same value,
+    or masked where the inputs are outside the `valid` domain or the scalar function fails.
+    """
+    assert len(result) == len(columns[0])
+    for i, args in enumerate(zip(*columns)):
+        expected = scalar_or_none(function, *args) if valid(*args) else None
+        if expected is None:
+            assert result.mask[i] and math.isnan(result.data[i]), f"row {i} {args}"
+        else:
+            assert not np.ma.getmaskarray(result)[i], f"row {i} {args}"
+            assert result[i] == pytest.approx(expected, rel=1e-12), f"row {i} {args}"
+
+
+# Domains of the inputs (NaN compares False: invalid)
+def valid_prices(current, original):
+    return current >= 0 and original > 0
+
+
+def valid_holding(days, cum_return):
+    return days > 0 and cum_return >= -1
+
+
+def valid_target(current, required, years):
+    return current > 0 and required > 0 and years > 0
+
+
+def test_cumulative_return_array():
+    current = [110.0, 90.0, 0.0, 50.0, 50.0, math.nan, 10.0, -5.0]
+    original = [100.0, 100.0, 80.0, 0.0, -20.0, 10.0, math.nan, 10.0]
+    result = cumulative_return_array(current, original)
+    assert_same_as_scalar(result, cumulative_return, valid_prices, current, original)
+    # Zero original price, negative prices and NaN are masked
+    assert result.mask.tolist() == [False, False, False, True, True, True, True, True]
+
+
+def test_annualized_return_array():
+    days = [365.0, 730.0, 30.0, 0.0, -10.0, 100.0, 100.0, math.nan, 200.0]
+    cum_return = [0.1, 0.21, -0.5, 0.1, 0.1, -1.5, math.nan, 0.1, -1.0]
+    result = annualized_return_array(days, cum_return)
+    assert_same_as_scalar(result, annualized_return, valid_holding, days, cum_return)
+    assert result.mask.tolist() == [False, False, False, True, True, True, True, True, False]
+
+
+def test_required_annualized_return_array():
+    current = [100.0, 100.0, 50.0, 0.0, 100.0, -100.0, 100.0, math.nan]
+    required = [121.0, 80.0, 100.0, 100.0, 0.0, 100.0, 121.0, 121.0]
+    years = [2.0, 1.0, 0.5, 2.0, 2.0, 2.0, 0.0, 2.0]
+    result = required_annualized_return_array(current, required, years)
+    assert_same_as_scalar(result, required_annualized_return, valid_target, current, required, years)
+    assert result[0] == pytest.approx(0.1)
+    assert result.mask.tolist() == [False, False, False, True, True, True, True, True]
+
+
+def test_broadcasting_and_series():
+    days_held = pd.Series([30.0, 365.0, 1000.0])
+    result = annualized_return_array(days_held, 0.2)
+    assert_same_as_scalar(result, annualized_return, valid_holding, days_held.tolist(), [0.2] * 3)
+
+    # One horizon for every position
+    current = pd.Series([80.0, 100.0, 0.0])
+    result = required_annualized_return_array(current, 120.0, 5)
+    assert_same_as_scalar(result, required_annualized_return, valid_target, current.tolist(), [120.0] * 3, [5] * 3)
+
+
+def test_masked_cumulative_returns_stay_masked():
+    cum_return = cumulative_return_array([110.0, 50.0, 120.0], [100.0, 0.0, 100.0])
+    result = annualized_return_array([365.0, 365.0, 730.0], cum_return)
+    assert result.mask.tolist() == [False, True, False]
+    assert result[0] == pytest.approx(annualized_return(365.0, 0.1))
+    assert result[2] == pytest.approx(annualized_return(730.0, 0.2))
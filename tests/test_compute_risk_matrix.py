@@ -0,0 +1,91 @@
+"""Tests of the batched risk metrics (src.metric.compute_risk_matrix)"""
+
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from src.metric.compute_risk_adjusted_return import beta, jensen_alpha, sharpe_ratio, treynor_ratio
+from src.metric.compute_risk_matrix import risk_metrics
+
+
+def pct_change(values) -> list:
+    """The pandas rolling apply of the former rolling_variation, windows of 2."""
+    series = pd.Series(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return series.rolling(window=2).apply(lambda x: (x[-1] - x[0]) / x[0], raw=True).tolist()[1:]
+
+
+def baseline_metrics(security, benchmark, risk_free_rate) -> dict:
+    """The per-call formulas of compute_risk_adjusted_return, before the batched engine."""
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        pct_change_security, pct_change_benchmark = pct_change(security), pct_change(benchmark)
+        beta = np.cov(pct_change_benchmark, pct_change_security)[0, 1] / np.var(pct_change_benchmark)
+        mean_security, mean_benchmark = np.mean(security), np.mean(benchmark)
+        mean_risk_free_rate = np.mean(risk_free_rate)
+        excess_return = mean_security - mean_benchmark
+        return {
+            "beta": beta,
+            "sharpe_ratio": excess_return / np.std(security),
+            "treynor_ratio": excess_return / beta,
+            "jensen_alpha": mean_security - mean_risk_free_rate - beta * (mean_benchmark - mean_risk_free_rate),
+        }
+
+
+def returns(points: int, columns: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(5, 10, (points, columns))
+
+
+def assert_same_as_baseline(securities: np.ndarray, benchmarks: np.ndarray, risk_free_rate: np.ndarray):
+    result = risk_metrics(securities, benchmarks, risk_free_rate)
+    n, m = securities.shape[1], benchmarks.shape[1]
+    for name in ("beta", "sharpe_ratio", "treynor_ratio", "jensen_alpha"):
+        assert result[name].shape == (n, m)
+    for i in range(n):
+        for j in range(m):
+            expected = baseline_metrics(securities[:, i], benchmarks[:, j], risk_free_rate)
+            for name, value in expected.items():
+                np.testing.assert_allclose(
+                    result[name][i, j], value, rtol=1e-9, atol=1e-12, err_msg=f"{name} of ({i}, {j})"
+                )
+
+
+@pytest.mark.parametrize("points", [3, 10, 250])
+def test_every_pair_same_as_baseline(points):
+    assert_same_as_baseline(returns(points, 4, 0), returns(points, 3, 1), np.random.default_rng(2).normal(2, 1, points))
+
+
+def test_nan_and_zero_returns():
+    securities, benchmarks = returns(30, 4, 3), returns(30, 3, 4)
+    securities[5, 0] = np.nan
+    securities[[7, 8], 1] = 0.0  # 0 / 0 then x / 0
+    securities[:, 2] = 2.5  # zero variance
+    benchmarks[12, 0] = np.nan
+    benchmarks[20, 1] = 0.0
+    benchmarks[:, 2] = 1.0  # zero variance of the variations
+    assert_same_as_baseline(securities, benchmarks, np.full(30, 2.0))
+
+
+def test_two_points():
+    # One variation: the sample covariance divides by zero
+    assert_same_as_baseline(returns(2, 2, 5), returns(2, 1, 6), np.array([1.0, 2.0]))
+
+
+def test_single_security_and_benchmark():
+    security, benchmark, risk_free_rate = returns(50, 1, 7)[:, 0], returns(50, 1, 8)[:, 0], np.full(50, 1.5)
+    expected = baseline_metrics(security, benchmark, risk_free_rate)
+    # 1-D inputs, as lists like the scalar wrappers get them
+    result = risk_metrics(security.tolist(), benchmark.tolist(), risk_free_rate.tolist())
+    for name, value in expected.items():
+        assert result[name].shape == (1, 1)
+        assert result[name][0, 0] == pytest.approx(value, rel=1e-9)
+
+    assert beta(security.tolist(), benchmark.tolist()) == pytest.approx(expected["beta"], rel=1e-9)
+    assert sharpe_ratio(security, benchmark)["compute_sharpe_ratio"] == pytest.approx(expected["sharpe_ratio"])
+    assert treynor_ratio(security, benchmark)["compute_treynor_ratio"] == pytest.approx(expected["treynor_ratio"])
+    alpha = jensen_alpha(security, benchmark, risk_free_rate)["compute_alpha_ratio"]
+    assert alpha == pytest.approx(expected["jensen_alpha"])
+
+
+def test_jensen_alpha_needs_the_risk_free_rate():
+    assert "jensen_alpha" not in risk_metrics(returns(10, 2, 9), returns(10, 1, 10))
@@ -0,0 +1,63 @@
+"""Tests of the CSV loaders of the SQLite database (src.database)"""
+
+import csv
+import logging
+import sqlite3
+import pytest
+from src import database
+
+
+ROWS = [
+    (1, 5, 1, 1, "2024-01-02", 1, 10.0, 100.0),
+    (2, 6, 2, 3, "2024-01-03", 1, 5.0, 200.0),
+    (3, 5, 1, 1, "2024-01-04", 2, 4.0, 110.0),
+]
+
+
+def write_csv(path, rows: list) -> str:
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(database.TRANSACTION_COLUMNS)
+        writer.writerows(rows)
+    return str(path)
+
+
+def stored(db_file: str) -> list:
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute(
+            'SELECT id, isinId, brokerId, accountId, transaction_date, orderId, quantity, unit_price '
+            'FROM "transaction" ORDER BY id'
+        ).fetchall()
+
+
+def test_bulk_create_from_csv(tmp_path, caplog, capsys):
+    db_file = str(tmp_path / "database.db")
+    with caplog.at_level(logging.INFO, logger="src.database"):
+        result = database.bulk_create_from_csv(write_csv(tmp_path / "transaction.csv", ROWS), db_file, chunksize=2)
+
+    assert result["rows"] == 3
+    assert result["rows_per_sec"] == pytest.approx(3 / result["seconds"])
+    assert stored(db_file) == ROWS
+    assert "Inserted 3 rows" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_incremental_from_csv(tmp_path, caplog, capsys):
+    db_file = str(tmp_path / "database.db")
+    csv_file = write_csv(tmp_path / "transaction.csv", ROWS[:2])
+    with caplog.at_level(logging.INFO, logger="src.database"):
+        result = database.incremental_from_csv(csv_file, db_file)
+    assert (result["inserted"], result["updated"], result["skipped"], result["watermark"]) == (2, 0, 0, 2)
+    assert "Inserted 2, updated 0, skipped 0 rows" in caplog.text
+    assert capsys.readouterr().out == ""
+
+    # Same export: nothing written
+    result = database.incremental_from_csv(csv_file, db_file)
+    assert (result["inserted"], result["updated"], result["skipped"]) == (0, 0, 2)
+
+    # A larger export with a corrected row
+    changed = (2, 6, 2, 3, "2024-01-03", 1, 6.0, 200.0)
+    csv_file = write_csv(tmp_path / "transaction.csv", [ROWS[0], changed, ROWS[2]])
+    result = database.incremental_from_csv(csv_file, db_file, chunksize=2)
+    assert (result["inserted"], result["updated"], result["skipped"], result["watermark"]) == (1, 1, 1, 3)
+    assert stored(db_file) == [ROWS[0], changed, ROWS[2]]
@@ -0,0 +1,123 @@
+"""Tests of the extraction of the transactions from the database (src.extract)"""
+
+import math
+import shutil
+import sqlite3
+from pathlib import Path
+import numpy as np
+import pytest
+from src import extract, transform
+from tests.conftest import BOURSE_DIRECT, BUY, CTO, PEA, SELL, TRADE_REPUBLIC
+
+
+# Id of an ISIN far beyond the others: the joins must not allocate one slot per possible id
+LARGE_ID = 10**15
+
+
+def random_transactions(rows: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            int(rng.choice([1, 5, 6])),
+            int(rng.choice([BOURSE_DIRECT, TRADE_REPUBLIC])),
+            int(rng.choice([PEA, CTO])),
+            f"2024-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}",
+            int(rng.choice([BUY, SELL], p=[0.7, 0.3])),
+            float(rng.integers(1, 50)),
+            float(np.round(rng.uniform(10, 200), 2)),
+        )
+        for _ in range(rows)
+    ]
+
+
+def assert_same_groups(result: dict, expected: dict):
+    assert list(result) == list(expected)
+    for key, values in expected.items():
+        if values and isinstance(values[0], str):
+            assert result[key] == values
+        else:
+            assert result[key] == pytest.approx(values, nan_ok=True)
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 50, 1_000])
+@pytest.mark.parametrize("output", ["pandas", "dict"])
+def test_group_by_batches_same_as_group_by(ledger, batch_size, output):
+    db_file = ledger(*random_transactions(60))
+    attributes = ["isin", "account_name"]
+    batches = extract.iter_batches(db_file, batch_size=batch_size, output=output)
+    assert_same_groups(
+        transform.group_by_batches(attributes, batches),
+        transform.group_by(attributes, extract.all_attribute(db_file)),
+    )
+
+
+def test_iter_batches_raises_database_errors(tmp_path):
+    # The database of the repository predates the transaction_day column the query needs
+    db_file = str(tmp_path / "database.db")
+    shutil.copy(Path(__file__).resolve().parents[1] / "app" / "backend" / "database.db", db_file)
+    with pytest.raises(sqlite3.OperationalError):
+        transform.group_by_batches(["isin"], extract.iter_batches(db_file))
+
+
+@pytest.fixture
+def irregular_db(ledger) -> str:
+    """Transactions with a NULL quantity, a NULL price, a very large ISIN id and a dangling ISIN id."""
+    db_file = ledger(*random_transactions(20))
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute("INSERT INTO isin VALUES (?, 'XS0000000001', 'Large id bond', 'Bond')", (LARGE_ID,))
+        conn.executemany(
+            'INSERT INTO "transaction" (id, isinId, brokerId, accountId, transaction_date, orderId, quantity, '
+            "unit_price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (101, 1, BOURSE_DIRECT, PEA, "2024-02-01", BUY, None, 10.0),
+                (102, 5, TRADE_REPUBLIC, CTO, "2024-02-02", SELL, 3.0, None),
+                (103, LARGE_ID, BOURSE_DIRECT, PEA, "2024-02-03", BUY, 7.0, 99.5),
+                (104, 999, BOURSE_DIRECT, PEA, "2024-02-04", BUY, 1.0, 1.0),
+            ],
+        )
+    conn.close()
+    return db_file
+
+
+def sorted_rows(columns: dict) -> list:
+    """Rows of columnar output, NULL and NaN alike, in a canonical order (the joins may reorder them)."""
+    def cell(value):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return "NULL"
+        return value.item() if isinstance(value, np.generic) else value
+
+    columns = {key: [cell(value) for value in values] for key, values in columns.items()}
+    return list(columns), sorted(zip(*columns.values()), key=repr)
+
+
+@pytest.mark.parametrize("attribute", list(extract.ATTRIBUTE_DIMENSIONS))
+@pytest.mark.parametrize("output", ["numpy", "pandas"])
+def test_by_attribute_columns_same_as_dict(irregular_db, attribute, output):
+    expected = extract.by_attribute(irregular_db, attribute)
+    result = extract.by_attribute_columns(irregular_db, attribute, output=output)
+    if output == "pandas":
+        result = result.to_dict("list")
+    assert sorted_rows(result) == sorted_rows(expected)
+
+
+@pytest.mark.parametrize("output", ["numpy", "pandas", "compact"])
+def test_all_attribute_columns_same_as_dict(irregular_db, output):
+    expected = extract.all_attribute(irregular_db)
+    # The dangling ISIN id is dropped like by the inner join, the NULL numbers are kept
+    assert len(expected["isin"]) == 23 and "XS0000000001" in expected["isin"]
+    result = extract.all_attribute_columns(irregular_db, output=output)
+    if output == "pandas":
+        result = result.to_dict("list")
+    elif output == "compact":
+        result = result.to_dict()
+    assert sorted_rows(result) == sorted_rows(expected)
+    if output == "numpy":
+        assert all(result[key].dtype == np.float64 for key in extract.MEASURE_KEYS)
+
+
+def test_dimension_codes():
+    rows = [(7, "a"), (LARGE_ID, "b"), (2, "c")]
+    codes = extract._dimension_codes(rows, np.array([2, 7, LARGE_ID, 3, -1, LARGE_ID + 1, 0]))
+    assert codes.tolist() == [2, 0, 1, -1, -1, -1, -1]
+    assert extract._dimension_codes([], np.array([1, 2])).tolist() == [-1, -1]
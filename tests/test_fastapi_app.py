@@ -0,0 +1,211 @@
+"""Tests of the instrumentation of the FastAPI app (app.middleware.fastapi_app)"""
+
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+
+os.environ.setdefault("ROOT_DIR", str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.middleware import fastapi_app  # noqa: E402
+from src import instrument, price_cache  # noqa: E402
+from src.price_cache import PriceCache  # noqa: E402
+from src.price_provider import FakeProvider  # noqa: E402
+from tests.conftest import BOURSE_DIRECT, BUY, CTO, ISINS, PEA, SELL, TRADE_REPUBLIC  # noqa: E402
+
+
+@pytest.fixture
+def client() -> TestClient:
+    instrument.reset()
+    return TestClient(fastapi_app.app)
+
+
+def request_counts() -> dict:
+    counters = instrument._counters
+    return {dict(labels)["path"]: value for (name, labels), value in counters.items() if name == "http_requests"}
+
+
+def test_requests_are_counted_by_route(client):
+    client.get("/")
+    for path in ("/unknown", "/unknown/1", "/unknown/2"):
+        assert client.get(path).status_code == 404
+    assert request_counts() == {"/": 1, "unmatched": 3}
+
+
+def test_slow_requests_are_profiled_by_route(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(fastapi_app, "profiler", instrument.SlowRequestProfiler(str(tmp_path), threshold=0))
+    client.get("/")
+    client.get("/unknown/1")
+    names = sorted(path.name.split("_", 1)[1].rsplit("_", 1)[0] for path in tmp_path.iterdir())
+    assert names == ["GET", "GET_unmatched"]
+
+
+@pytest.mark.parametrize("slots", [1, 2])
+def test_streams_wait_for_a_free_slot(slots):
+    lock = threading.Lock()
+    streams = {"active": 0, "peak": 0}
+
+    def rows(name: str):
+        with lock:
+            streams["active"] += 1
+            streams["peak"] = max(streams["peak"], streams["active"])
+        try:
+            for i in range(3):
+                time.sleep(0.01)
+                yield name, i
+        finally:
+            with lock:
+                streams["active"] -= 1
+
+    async def consume_all() -> list:
+        semaphore = asyncio.Semaphore(slots)
+
+        async def consume(name: str) -> list:
+            chunks, _ = await fastapi_app.open_stream(executor, rows(name), iter, semaphore)
+            return [item async for item in chunks]
+
+        return await asyncio.gather(*(consume(name) for name in "abc"))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = asyncio.run(consume_all())
+    assert results == [[(name, i) for i in range(3)] for name in "abc"]
+    assert streams == {"active": 0, "peak": slots}
+
+
+@pytest.fixture
+def transactions_db(ledger, monkeypatch) -> str:
+    db_file = ledger(
+        (1, BOURSE_DIRECT, PEA, "2023-01-02", BUY, 10, 100.0),
+        (5, TRADE_REPUBLIC, CTO, "2023-01-03", BUY, 2, 50.0),
+        (1, BOURSE_DIRECT, PEA, "2023-02-01", SELL, 4, 110.0),
+        (6, TRADE_REPUBLIC, CTO, "2023-02-01", BUY, 1, 300.0),
+        (5, TRADE_REPUBLIC, CTO, "2023-03-15", SELL, 2, 60.0),
+    )
+    monkeypatch.setattr(fastapi_app, "db_file", db_file)
+    return db_file
+
+
+def listing(response) -> list:
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_transactions_are_streamed_as_ndjson(client, transactions_db):
+    rows = listing(client.get("/transactions"))
+    assert [row["id"] for row in rows] == [1, 2, 3, 4, 5]
+    assert rows[0]["isin"] == ISINS[1]
+    assert rows[0]["quantity"] == 10 and rows[0]["unit_price"] == 100.0
+    assert [row["transaction_date"] for row in rows] == sorted(row["transaction_date"] for row in rows)
+
+
+def test_transactions_are_filtered(client, transactions_db):
+    rows = listing(client.get("/transactions", params={"start_date": "2023-01-03", "end_date": "2023-02-01"}))
+    assert [row["id"] for row in rows] == [2, 3, 4]
+    rows = listing(client.get("/transactions", params={"isin": [ISINS[5], ISINS[6]]}))
+    assert [row["id"] for row in rows] == [2, 4, 5]
+    assert listing(client.get("/transactions", params={"start_date": "2024-01-01"})) == []
+
+
+def test_transactions_are_paginated_with_the_next_cursor(client, transactions_db):
+    pages, params = [], {"limit": 2}
+    while True:
+        response = client.get("/transactions", params=params)
+        pages.append([row["id"] for row in listing(response)])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["after"] = response.headers["X-Next-Cursor"]
+    assert pages == [[1, 2], [3, 4], [5]]
+
+
+def test_transactions_reject_a_malformed_cursor(client, transactions_db):
+    assert client.get("/transactions", params={"after": "2023-01-02"}).status_code == 400
+    assert client.get("/transactions", params={"after": "2023-13-02:1"}).status_code == 400
+    assert client.get("/transactions", params={"after": "2023-01-02:x"}).status_code == 400
+
+
+def test_transactions_migrate_the_database_first(client, tmp_path, monkeypatch):
+    # The database of the repository predates the transaction_day column
+    db_file = str(tmp_path / "database.db")
+    shutil.copy(Path(fastapi_app.ROOT_DIR) / "app" / "backend" / "database.db", db_file)
+    monkeypatch.setattr(fastapi_app, "db_file", db_file)
+    assert listing(client.get("/transactions", params={"limit": 1, "start_date": "2100-01-01"})) == []
+    assert listing(client.get("/transactions", params={"start_date": "2100-01-01"})) == []
+
+
+def test_transactions_database_errors_are_error_responses(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(fastapi_app, "db_file", str(tmp_path / "missing" / "database.db"))
+    response = TestClient(fastapi_app.app, raise_server_exceptions=False).get("/transactions")
+    assert response.status_code == 500
+
+
+@pytest.fixture
+def overview_db(ledger, monkeypatch):
+    """Return the function adding transactions to the database of the app, priced by a fake provider."""
+    db_file = ledger(
+        (5, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 10.0, 100.0),
+        (6, TRADE_REPUBLIC, CTO, "2024-01-03", BUY, 2.0, 50.0),
+    )
+    monkeypatch.setattr(fastapi_app, "db_file", db_file)
+    day = datetime.date(2024, 3, 15)
+    cache = PriceCache(FakeProvider({ISINS[5]: (day, 120.0), ISINS[6]: (day, 40.0)}))
+    monkeypatch.setattr(price_cache, "_default_cache", cache)
+    for cached in (fastapi_app._position_engine, fastapi_app.data_version):
+        cached.cache_clear()
+    fastapi_app.response_cache.clear()
+    yield ledger
+    fastapi_app.data_version().close()
+    for cached in (fastapi_app._position_engine, fastapi_app.data_version):
+        cached.cache_clear()
+    fastapi_app.response_cache.clear()
+    cache.close()
+
+
+def test_overview_not_modified(client, overview_db):
+    response = client.post("/overview", json={"attribute": "accountId"})
+    assert response.status_code == 200
+    rows = response.json()
+    assert rows["isin"] == [ISINS[5], ISINS[6]] and rows["last_price"] == [120.0, 40.0]
+
+    etag = response.headers["ETag"]
+    response = client.post("/overview", json={"attribute": "accountId"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_overview_changes_with_the_database(client, overview_db):
+    etag = client.post("/overview", json={"attribute": "isinId"}).headers["ETag"]
+    overview_db((5, BOURSE_DIRECT, PEA, "2024-02-01", SELL, 4.0, 130.0))
+
+    response = client.post("/overview", json={"attribute": "isinId"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["quantity"] == [6.0, 2.0]
+
+
+def test_overview_misses_compute_once(overview_db, monkeypatch):
+    calls = []
+    holdings = fastapi_app._holdings
+
+    def slow_holdings(attribute: str) -> dict:
+        calls.append(attribute)
+        time.sleep(0.05)
+        return holdings(attribute)
+
+    monkeypatch.setattr(fastapi_app, "_holdings", slow_holdings)
+
+    async def concurrent_requests() -> list:
+        request = fastapi_app.inputData(attribute="brokerId")
+        return await asyncio.gather(*(fastapi_app.overview(request, None) for _ in range(5)))
+
+    responses = asyncio.run(concurrent_requests())
+    assert calls == ["brokerId"]
+    assert len({response.body for response in responses}) == 1
+    assert fastapi_app.response_cache.stats()["size"] == 1
@@ -0,0 +1,105 @@
+"""Tests of the lazy DataFrame pipeline (src.pipeline)"""
+
+import datetime
+import math
+import time
+import pandas as pd
+import pytest
+from src import extract, transform
+from src.pipeline import Pipeline, StageMemo
+from src.price_cache import PriceCache
+from src.price_provider import FakeProvider
+from tests.conftest import BOURSE_DIRECT, BUY, CTO, PEA, SELL, TRADE_REPUBLIC
+
+
+TRANSACTIONS = [
+    (5, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 10.0, 100.0),
+    (5, BOURSE_DIRECT, PEA, "2024-01-03", SELL, 4.0, 110.0),
+    (5, TRADE_REPUBLIC, CTO, "2024-01-04", BUY, 2.0, 105.0),
+    (6, TRADE_REPUBLIC, CTO, "2024-01-05", BUY, 5.0, 200.0),
+    (1, BOURSE_DIRECT, PEA, "2024-01-08", BUY, 3.0, 50.0),
+]
+
+DAY = datetime.date(2024, 3, 15)
+
+
+@pytest.fixture
+def cache() -> PriceCache:
+    """Prices of two of the three ISINs of the transactions."""
+    cache = PriceCache(FakeProvider({"US0846707026": (DAY, 120.0), "US5705351048": (DAY, 180.0)}))
+    yield cache
+    cache.close()
+
+
+def overview(db_file: str, cache: PriceCache) -> Pipeline:
+    transactions = Pipeline.from_database(db_file)
+    prices = transactions.keep(["isin"]).unique().with_last_price(cache)
+    return transactions.group_by(["isin", "account_name"]).merge(prices).with_cumulative_return()
+
+
+def test_same_result_as_transform(ledger, cache):
+    db_file = ledger(*TRANSACTIONS)
+    transactions = extract.all_attribute(db_file)
+    isins = transform.remove_duplicate(transform.keep_attribute(transactions, ["isin"]))
+    grouped = transform.group_by(["isin", "account_name"], transactions)
+    expected = transform.add_cumulative_return(transform.merge_dictionary(grouped, transform.add_last_price(isins, cache)))
+
+    result = overview(db_file, cache).to_dict(StageMemo())
+    order = sorted(range(len(result["isin"])), key=lambda i: (result["isin"][i], result["account_name"][i]))
+    result = {key: [values[i] for i in order] for key, values in result.items()}
+    assert set(result) == set(expected)
+    assert result.pop("last_date") == expected.pop("last_date")
+    for key, values in expected.items():
+        assert result[key] == (values if isinstance(values[0], str) else pytest.approx(values, nan_ok=True))
+
+    # 10 bought at 100, 4 sold at 110 in the PEA
+    row = list(zip(result["isin"], result["account_name"])).index(("US0846707026", "PEA"))
+    assert (result["quantity"][row], result["total_price"][row]) == pytest.approx((6.0, 560.0))
+    assert math.isnan(result["last_price"][result["isin"].index("LU0131510165")])
+
+
+def test_stages_are_memoized(ledger, cache):
+    db_file = ledger(*TRANSACTIONS)
+    # Prices already cached: running the stages doesn't change the cache epoch
+    cache.get_many(["US0846707026", "US5705351048"])
+    memo = StageMemo()
+    first = overview(db_file, cache).run(memo)
+    misses = memo.stats()["misses"]
+
+    assert overview(db_file, cache).run(memo) is first
+    assert memo.stats()["misses"] == misses
+
+    # A new price invalidates the stages using it, not the grouped transactions
+    cache.invalidate("US0846707026")
+    overview(db_file, cache).run(memo)
+    assert memo.stats()["misses"] == misses + 3
+
+
+def test_memo_is_bounded_by_bytes():
+    frame = pd.DataFrame({"isin": [f"US{i:010d}" for i in range(1_000)], "quantity": 1.0})
+    size = int(frame.memory_usage(index=True, deep=True).sum())
+    memo = StageMemo(max_bytes=int(2.5 * size))
+    for key in "abc":
+        memo.put(key, frame.copy())
+    assert memo.stats() == {"hits": 0, "misses": 0, "evictions": 1, "size": 2, "bytes": 2 * size}
+    assert memo.get("a") is None and memo.get("c") is not None
+
+    # Larger than the whole memo: not kept, nothing evicted for it
+    memo.put("d", pd.concat([frame] * 3))
+    assert memo.get("d") is None and memo.stats()["size"] == 2
+
+
+def test_prices_are_looked_up_again_after_the_ttl(ledger, cache, monkeypatch):
+    db_file = ledger(*TRANSACTIONS)
+    cache.get_many(["US0846707026", "US5705351048"])
+    memo = StageMemo()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    first = overview(db_file, cache).run(memo)
+    assert overview(db_file, cache).run(memo) is first
+
+    # Same epoch, but the cached prices may have expired: the price stages run again
+    misses = memo.stats()["misses"]
+    monkeypatch.setattr(time, "time", lambda: now + cache.ttl)
+    overview(db_file, cache).run(memo)
+    assert memo.stats()["misses"] == misses + 3
@@ -0,0 +1,111 @@
+"""Tests of the pool of SQLite connections (src.pool)"""
+
+import os
+import sqlite3
+import threading
+import pytest
+from src.pool import ConnectionPool
+
+
+@pytest.fixture
+def db_file(tmp_path) -> str:
+    return make_database(str(tmp_path / "database.db"), 1)
+
+
+def make_database(path: str, value: int) -> str:
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE setting (value INTEGER)")
+        conn.execute("INSERT INTO setting VALUES (?)", (value,))
+    conn.close()
+    return path
+
+
+def read(pool: ConnectionPool) -> int:
+    with pool.connection() as conn:
+        return conn.execute("SELECT value FROM setting").fetchone()[0]
+
+
+def test_threads_get_their_connection_back(db_file):
+    pool = ConnectionPool(db_file, size=4)
+    connections = {}
+    barrier = threading.Barrier(2)
+
+    def use(name: str):
+        # Both threads hold a connection at the same time: two connections are opened
+        with pool.connection() as conn:
+            barrier.wait()
+            first = conn
+        barrier.wait()
+        for _ in range(3):
+            with pool.connection() as conn:
+                assert conn is first
+        connections[name] = first
+
+    threads = [threading.Thread(target=use, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert connections["a"] is not connections["b"]
+    stats = pool.stats()
+    assert (stats["open"], stats["idle"], stats["in_use"]) == (2, 2, 0)
+    assert (stats["requests"], stats["hits"], stats["thread_hits"]) == (8, 6, 6)
+    assert stats["hit_rate"] == pytest.approx(0.75)
+    pool.close()
+
+
+def test_read_only_connections_cant_write(db_file):
+    pool = ConnectionPool(db_file)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("INSERT INTO setting VALUES (2)")
+
+    writable = ConnectionPool(db_file, read_only=False)
+    with writable.connection() as conn:
+        conn.execute("INSERT INTO setting VALUES (2)")
+        conn.commit()
+    assert read(pool) == 1
+    pool.close()
+    writable.close()
+
+
+def test_waits_for_a_released_connection(db_file):
+    pool = ConnectionPool(db_file, size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(sqlite3.OperationalError, match="Timed out"):
+            pool.acquire()
+    assert read(pool) == 1
+    stats = pool.stats()
+    assert (stats["open"], stats["waits"]) == (1, 1)
+    assert stats["wait_time"] >= 0.05 and stats["avg_wait_time"] == stats["wait_time"]
+    pool.close()
+
+
+def test_close_keeps_the_connections_in_use(db_file):
+    pool = ConnectionPool(db_file)
+    idle = pool.acquire()
+    in_use = pool.acquire()
+    pool.release(idle)
+    pool.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        idle.execute("SELECT 1")
+    assert in_use.execute("SELECT value FROM setting").fetchone() == (1,)
+    pool.release(in_use)
+    assert pool.stats()["open"] == 1
+    pool.close()
+    assert pool.stats()["open"] == 0
+
+
+def test_replaced_file_is_reopened(db_file, tmp_path):
+    pool = ConnectionPool(db_file)
+    assert read(pool) == 1
+
+    # A rebuilt database moved over the old one
+    os.replace(make_database(str(tmp_path / "rebuilt.db"), 2), db_file)
+    assert read(pool) == 2
+    assert pool.stats()["reopened"] == 1
+    assert read(pool) == 2 and pool.stats()["reopened"] == 1
+    pool.close()
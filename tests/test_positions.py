@@ -0,0 +1,140 @@
+"""Tests of the incremental position and cost-basis engine (src.positions)"""
+
+import math
+import pytest
+from src import extract, transform
+from src.compact import CompactTransactions
+from src.positions import Position, PositionBook, PositionEngine
+from tests.conftest import BOURSE_DIRECT, BUY, CTO, PEA, SELL, TRADE_REPUBLIC
+
+
+# One position (US0846707026 in the PEA at BourseDirect) bought twice, sold, flipped short, then partly covered
+LEDGER = [
+    (5, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 10.0, 100.0),
+    (5, BOURSE_DIRECT, PEA, "2024-01-03", BUY, 10.0, 120.0),
+    (5, BOURSE_DIRECT, PEA, "2024-01-04", SELL, 15.0, 130.0),
+    (5, BOURSE_DIRECT, PEA, "2024-01-05", SELL, 10.0, 110.0),
+    (5, BOURSE_DIRECT, PEA, "2024-01-08", BUY, 2.0, 100.0),
+]
+
+# Signed (quantity, unit price) of the ledger
+TRADES = [(10.0, 100.0), (10.0, 120.0), (-15.0, 130.0), (-10.0, 110.0), (2.0, 100.0)]
+
+
+def test_average_cost():
+    position = Position()
+    expected = [
+        # quantity, cost basis, realized P&L
+        (10.0, 1000.0, 0.0),
+        (20.0, 2200.0, 0.0),  # average cost 110
+        (5.0, 550.0, 300.0),  # 15 sold at 130
+        (-5.0, -550.0, 300.0),  # 5 sold at their cost of 110, then short 5 at 110
+        (-3.0, -330.0, 320.0),  # 2 covered at 100
+    ]
+    for (quantity, unit_price), (held, cost_basis, realized_pnl) in zip(TRADES, expected):
+        position.apply_average(quantity, unit_price)
+        assert (position.quantity, position.cost_basis, position.realized_pnl) == pytest.approx(
+            (held, cost_basis, realized_pnl)
+        )
+    assert position.cost_price == pytest.approx(110.0)
+
+
+def test_fifo_lots():
+    position = Position()
+    expected = [
+        # quantity, cost basis, realized P&L, open lots
+        (10.0, 1000.0, 0.0, [[1, 10.0, 100.0]]),
+        (20.0, 2200.0, 0.0, [[1, 10.0, 100.0], [2, 10.0, 120.0]]),
+        (5.0, 600.0, 350.0, [[2, 5.0, 120.0]]),  # the 10 at 100 sold at 130, then 5 of the lot at 120
+        (-5.0, -550.0, 300.0, [[4, -5.0, 110.0]]),  # the last 5 at 120 sold at 110, then short 5
+        (-3.0, -330.0, 320.0, [[4, -3.0, 110.0]]),  # 2 covered at 100
+    ]
+    for transaction_id, ((quantity, unit_price), (held, cost_basis, realized_pnl, lots)) in enumerate(
+        zip(TRADES, expected), start=1
+    ):
+        position.apply_fifo(transaction_id, quantity, unit_price)
+        assert (position.quantity, position.cost_basis, position.realized_pnl) == pytest.approx(
+            (held, cost_basis, realized_pnl)
+        )
+        assert [list(lot) for lot in position.lots] == lots
+
+
+@pytest.mark.parametrize("method", ["average", "fifo"])
+def test_closed_position(method):
+    book = PositionBook(method)
+    book.apply([(1, 5, 1, 1, 0, "BUY", 3.0, 10.0), (2, 5, 1, 1, 1, "SELL", 3.0, 12.0)])
+    position = book.positions[(5, 1, 1)]
+    assert (position.quantity, position.cost_basis, position.realized_pnl) == pytest.approx((0.0, 0.0, 6.0))
+    assert not position.lots
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        PositionBook("lifo")
+
+
+@pytest.mark.parametrize("method", ["average", "fifo"])
+def test_engine_holdings(ledger, method):
+    engine = PositionEngine(ledger(*LEDGER), method)
+    assert engine.update()["applied"] == 5
+    result = engine.update()
+    assert (result["applied"], result["rebuilt"], result["watermark"]) == (0, False, 5)
+
+    holdings = engine.holdings()
+    assert holdings["isin"] == ["US0846707026"]
+    assert (holdings["account_name"], holdings["broker_name"]) == (["PEA"], ["BourseDirect"])
+    assert holdings["quantity"] == pytest.approx([-3.0])
+    assert holdings["total_price"] == pytest.approx([-330.0])
+    assert holdings["cost_price"] == pytest.approx([110.0])
+    assert holdings["realized_pnl"] == pytest.approx([320.0])
+
+
+@pytest.mark.parametrize("method", ["average", "fifo"])
+def test_appended_rows_equal_rebuild(ledger, method):
+    db_file = ledger(*LEDGER[:3], (6, TRADE_REPUBLIC, CTO, "2024-01-03", BUY, 4.0, 50.0))
+    engine = PositionEngine(db_file, method)
+    engine.update()
+
+    ledger(*LEDGER[3:], (6, TRADE_REPUBLIC, CTO, "2024-01-09", SELL, 1.0, 60.0))
+    result = engine.update()
+    assert (result["applied"], result["rebuilt"]) == (3, False)
+    incremental = engine.holdings(include_closed=True)
+
+    rebuilt = PositionEngine(db_file, method)
+    assert rebuilt.update(rebuild=True)["rebuilt"]
+    assert rebuilt.holdings(include_closed=True) == pytest.approx(incremental)
+    assert incremental["realized_pnl"] == pytest.approx([320.0, 10.0])
+
+
+@pytest.mark.parametrize("method", ["average", "fifo"])
+def test_backdated_row_rebuilds(ledger, method):
+    engine = PositionEngine(ledger(*LEDGER[:3]), method)
+    engine.update()
+
+    ledger((5, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 5.0, 90.0))
+    assert engine.update()["rebuilt"]
+    assert engine.holdings()["quantity"] == pytest.approx([10.0])
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_group_by_cost_price_of_closed_and_sold_positions(ledger, compact):
+    db_file = ledger(
+        # Closed: bought, then all sold
+        (1, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 10.0, 100.0),
+        (1, BOURSE_DIRECT, PEA, "2024-01-03", SELL, 10.0, 120.0),
+        # Partly sold at a gain larger than the cost of what is left
+        (5, BOURSE_DIRECT, PEA, "2024-01-02", BUY, 10.0, 50.0),
+        (5, BOURSE_DIRECT, PEA, "2024-01-03", SELL, 8.0, 200.0),
+        # Short
+        (6, TRADE_REPUBLIC, CTO, "2024-01-02", SELL, 5.0, 30.0),
+        (6, TRADE_REPUBLIC, CTO, "2024-01-03", BUY, 2.0, 20.0),
+    )
+    transactions = extract.all_attribute(db_file)
+    if compact:
+        transactions = CompactTransactions.from_dict(transactions)
+    grouped = transform.group_by(["isin"], transactions)
+
+    assert grouped["quantity"] == pytest.approx([0.0, 2.0, -3.0])
+    assert grouped["total_price"] == pytest.approx([-200.0, -1100.0, -110.0])
+    assert math.isnan(grouped["cost_price"][0])
+    assert grouped["cost_price"][1:] == pytest.approx([50.0, 30.0])
@@ -0,0 +1,77 @@
+"""Tests of the two-level price cache (src.price_cache)"""
+
+import datetime
+import sqlite3
+import pytest
+import config
+from src import price_cache
+from src.price_cache import PriceCache
+from src.price_provider import FakeProvider
+from src.quote_fetcher import QuoteFetcher
+
+
+DAY = datetime.date(2024, 3, 15)
+
+
+def disk_symbols(db_file: str) -> list:
+    with sqlite3.connect(db_file) as conn:
+        return [row[0] for row in conn.execute('SELECT symbol FROM "price" ORDER BY fetched_at')]
+
+
+def test_prices_persist_across_instances(tmp_path):
+    db_file = str(tmp_path / "price_cache.db")
+    provider = FakeProvider({"A": (DAY, 10.0), "B": (DAY, 20.0)})
+    cache = PriceCache(provider, db_file=db_file)
+    assert cache.get("A") == (DAY, 10.0)
+    cache.close()
+
+    restarted = PriceCache(provider, db_file=db_file)
+    assert restarted.get("A") == (DAY, 10.0)
+    assert restarted.stats()["disk_hits"] == 1
+    assert provider.calls == 1
+    restarted.close()
+
+
+def test_disk_eviction_keeps_the_newest_prices(tmp_path):
+    db_file = str(tmp_path / "price_cache.db")
+    cache = PriceCache(FakeProvider(default=1.0), db_file=db_file, ttl=0, stale_ttl=0, disk_maxsize=3)
+    for symbol in "ABCDE":
+        cache.get(symbol)
+    # Fetching a stored price again updates it without growing the table
+    cache.get("D")
+
+    assert disk_symbols(db_file) == ["C", "E", "D"]
+    assert cache.stats()["disk_evictions"] == 2
+    cache.close()
+
+    restarted = PriceCache(FakeProvider(default=1.0), db_file=db_file, disk_maxsize=3)
+    restarted.get("F")
+    assert disk_symbols(db_file) == ["E", "D", "F"]
+    restarted.close()
+
+
+def test_default_cache_is_persistent(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "data" / "price_cache.db")
+    monkeypatch.setattr(config, "PRICE_CACHE_DB", db_file)
+    monkeypatch.setattr(price_cache, "_default_cache", None)
+
+    cache = price_cache.default_cache()
+    assert cache.db_file == db_file
+    assert price_cache.default_cache() is cache
+    assert disk_symbols(db_file) == []
+    cache.close()
+
+
+
+@pytest.mark.parametrize("supports_batch, calls", [(True, 3), (False, 250)])
+def test_provider_calls_and_symbols(supports_batch, calls):
+    provider = FakeProvider({f"S{i}": 1.0 for i in range(240)}, supports_batch=supports_batch)
+    cache = PriceCache(provider, fetcher=QuoteFetcher(provider, batch_size=100))
+    prices, errors = cache.get_many([f"S{i}" for i in range(250)])
+    cache.get("S0")
+    cache.close()
+
+    assert (len(prices), len(errors)) == (240, 10)
+    stats = cache.stats()
+    assert (stats["provider_calls"], stats["provider_symbols"], stats["provider_errors"]) == (calls, 250, 10)
+    assert provider.calls == calls
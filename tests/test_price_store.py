@@ -0,0 +1,85 @@
+"""Tests of the local daily price store (src.price_store)"""
+
+import datetime
+import threading
+import numpy as np
+import pytest
+from src.price_provider import FakeProvider
+from src.price_store import PriceStore, to_day
+
+
+START = datetime.date(2024, 3, 4)
+END = datetime.date(2024, 3, 15)
+
+
+@pytest.fixture(params=[None, "America/New_York", "Asia/Tokyo"])
+def provider(request) -> FakeProvider:
+    """Naive dates, and exchange dates at midnight of a time zone like yfinance."""
+    return FakeProvider(timezone=request.param)
+
+
+def test_update_stores_exchange_dates(tmp_path, provider):
+    store = PriceStore(str(tmp_path), provider)
+    assert store.update("US0378331005", START, END) == 1
+
+    dates, ohlcv = store.load("US0378331005")
+    expected = np.arange(np.datetime64(START), np.datetime64(END) + 1)
+    expected = expected[np.is_busday(expected)]
+    assert np.array_equal(np.asarray(dates), expected.astype(np.int64))
+    assert ohlcv.shape == (len(expected), 5)
+    assert store.coverage("US0378331005") == [[to_day(START), to_day(END)]]
+
+
+def test_same_prices_whatever_the_time_zone(tmp_path, provider):
+    naive = PriceStore(str(tmp_path / "naive"), FakeProvider())
+    store = PriceStore(str(tmp_path / "store"), provider)
+
+    dates, close = store.matrix(["FR0000120271", "US0378331005"], START, END)
+    expected_dates, expected_close = naive.matrix(["FR0000120271", "US0378331005"], START, END)
+    assert np.array_equal(dates, expected_dates)
+    np.testing.assert_array_equal(close, expected_close)
+
+
+def test_only_missing_gaps_are_fetched(tmp_path, provider):
+    store = PriceStore(str(tmp_path), provider)
+    store.history("US0378331005", START, END)
+    calls = provider.calls
+
+    history = store.history("US0378331005", START + datetime.timedelta(days=2), END)
+    assert provider.calls == calls
+    assert history.index[0].date() == START + datetime.timedelta(days=2)
+    assert history.index.tz is None
+
+    store.history("US0378331005", START - datetime.timedelta(days=7), END)
+    assert provider.calls == calls + 1
+    assert store.coverage("US0378331005") == [[to_day(START) - 7, to_day(END)]]
+
+
+@pytest.mark.parametrize("symbol", ["", ".", "..", "../prices", "a/b", "a\0b"])
+def test_symbols_are_plain_directory_names(tmp_path, symbol):
+    store = PriceStore(str(tmp_path / "store"), FakeProvider())
+    with pytest.raises(ValueError):
+        store.update(symbol, START, END)
+    with pytest.raises(ValueError):
+        store.load(symbol)
+    assert list((tmp_path / "store").iterdir()) == []
+
+
+def test_load_never_mixes_two_writes(tmp_path):
+    store = PriceStore(str(tmp_path), FakeProvider())
+    done = threading.Event()
+
+    def write():
+        for size in range(1, 300):
+            store._write("US0378331005", np.arange(size), np.full((size, 5), float(size)), [])
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        while not done.is_set():
+            dates, ohlcv = store.load("US0378331005")
+            assert len(dates) == len(ohlcv)
+            assert not len(ohlcv) or ohlcv[0, 0] == len(ohlcv)
+    finally:
+        writer.join()
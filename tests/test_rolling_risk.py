@@ -0,0 +1,79 @@
+"""Tests of the rolling-window risk metrics (src.metric.compute_rolling_risk)"""
+
+import numpy as np
+import pytest
+from src.metric.compute_risk_matrix import risk_metrics
+from src.metric.compute_rolling_risk import RollingCovariance, RollingRiskMetrics
+
+
+METRICS = ["beta", "sharpe_ratio", "treynor_ratio", "jensen_alpha"]
+
+
+def returns(points: int, securities: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    return rng.normal(5, 10, (points, securities)), rng.normal(5, 10, points), rng.normal(2, 1, points)
+
+
+def assert_same_as_recomputed(securities, benchmark, risk_free_rate, window: int):
+    """Check the metrics of every tick against risk_metrics applied to the window."""
+    calculator = RollingRiskMetrics(window, securities.shape[1])
+    for t in range(len(benchmark)):
+        calculator.update(securities[t], benchmark[t], risk_free_rate[t])
+        # Beta needs at least 2 variations
+        if t < 2:
+            continue
+        first = max(0, t - window + 1)
+        expected = risk_metrics(securities[first:t + 1], benchmark[first:t + 1], risk_free_rate[first:t + 1])
+        actual = calculator.metrics()
+        for name in METRICS:
+            np.testing.assert_allclose(
+                actual[name], expected[name][:, 0], rtol=1e-7, atol=1e-9, err_msg=f"{name} at tick {t}"
+            )
+
+
+@pytest.mark.parametrize("window", [3, 10, 25, 200])
+def test_metrics_of_every_tick(window):
+    # 60 ticks: several resyncs of the moments for the small windows, none for the window longer than the series
+    assert_same_as_recomputed(*returns(60, 4), window)
+
+
+def test_nan_return_leaves_the_window():
+    securities, benchmark, risk_free_rate = returns(40, 3)
+    securities[12, 1] = np.nan
+    benchmark[23] = np.nan
+    assert_same_as_recomputed(securities, benchmark, risk_free_rate, 7)
+
+
+def test_zero_variance_windows():
+    securities, benchmark, risk_free_rate = returns(40, 3)
+    # Equal returns of a security, then of the benchmark, for longer than the window
+    securities[10:25, 0] = 0.5
+    benchmark[20:32] = 4.0
+    assert_same_as_recomputed(securities, benchmark, risk_free_rate, 6)
+
+
+def test_single_security_scalar_benchmark():
+    securities, benchmark, risk_free_rate = returns(30, 1)
+    assert_same_as_recomputed(securities, benchmark, risk_free_rate, 8)
+
+
+@pytest.mark.parametrize("window", [1, 5, 50])
+def test_covariance_of_every_tick(window):
+    rng = np.random.default_rng(1)
+    x, y = rng.normal(0, 1, (30, 2)), rng.normal(0, 1, (30, 2))
+    covariance = RollingCovariance(window, (2,))
+    for t in range(len(x)):
+        covariance.update(x[t], y[t])
+        first = max(0, t - window + 1)
+        np.testing.assert_allclose(covariance.mean_x, x[first:t + 1].mean(axis=0))
+        np.testing.assert_allclose(covariance.variance_x(), x[first:t + 1].var(axis=0), atol=1e-12)
+        np.testing.assert_allclose(covariance.variance_y(), y[first:t + 1].var(axis=0), atol=1e-12)
+        if t - first >= 1:
+            expected = [np.cov(x[first:t + 1, i], y[first:t + 1, i])[0, 1] for i in range(2)]
+            np.testing.assert_allclose(covariance.covariance(), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("window", [0, 1])
+def test_window_too_short(window):
+    with pytest.raises(ValueError):
+        RollingRiskMetrics(window)
@@ -0,0 +1,45 @@
+"""Tests of the multi-process universe screener (src.screener)"""
+
+import datetime
+import numpy as np
+import pytest
+from src.price_provider import FakeProvider
+from src.price_store import PriceStore
+from src.screener import METRICS, screen, screen_chunk, screen_store
+
+
+SYMBOLS = ["LU0131510165", "LU1964632324", "US0846707026", "US5705351048"]
+BENCHMARK = "FR0000120271"
+START, END = datetime.date(2023, 1, 2), datetime.date(2023, 12, 29)
+
+
+@pytest.fixture(params=[None, "America/New_York"])
+def store(request, tmp_path) -> PriceStore:
+    """Store of naive dates, and of exchange dates at midnight of a time zone like yfinance."""
+    return PriceStore(str(tmp_path), FakeProvider(timezone=request.param))
+
+
+def test_screen_store_matches_screen_chunk(store):
+    result = screen_store(store, SYMBOLS, BENCHMARK, START, END, workers=1)
+
+    dates, prices = store.matrix(SYMBOLS + [BENCHMARK], START, END, fill="ffill")
+    assert dates[0] == np.datetime64(START) and dates[-1] == np.datetime64(END)
+    expected = screen_chunk(prices[:, :-1], prices[:, -1], days_held=float((END - START).days))
+    order = [SYMBOLS.index(symbol) for symbol in result["symbol"]]
+    assert result["rank"] == [1, 2, 3, 4]
+    assert result["sharpe_ratio"] == sorted(result["sharpe_ratio"], reverse=True)
+    for key in METRICS:
+        np.testing.assert_allclose(result[key], expected[key][order])
+
+
+def test_processes_give_the_same_ranking(store):
+    single = screen_store(store, SYMBOLS, BENCHMARK, START, END, workers=1)
+    several = screen_store(store, SYMBOLS, BENCHMARK, START, END, workers=2, chunk_size=1)
+    assert several["symbol"] == single["symbol"]
+    for key in METRICS:
+        np.testing.assert_allclose(several[key], single[key])
+
+
+def test_screen_rejects_unknown_metric():
+    with pytest.raises(ValueError):
+        screen(np.ones((3, 2)), np.ones(3), rank_by="volume")
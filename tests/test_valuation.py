@@ -0,0 +1,99 @@
+"""Tests of the daily mark-to-market valuation engine (src.valuation)"""
+
+import datetime
+import numpy as np
+import pytest
+from src.price_provider import FakeProvider
+from src.price_store import PriceStore
+from src.valuation import ValuationEngine
+from tests.conftest import BOURSE_DIRECT, BUY, CTO, ISINS, PEA, SELL, TRADE_REPUBLIC
+
+
+END = datetime.date(2024, 3, 29)
+
+TRANSACTIONS = [
+    (5, BOURSE_DIRECT, PEA, "2024-03-04", BUY, 10.0, 100.0),
+    (6, TRADE_REPUBLIC, CTO, "2024-03-06", BUY, 5.0, 200.0),
+    (5, BOURSE_DIRECT, PEA, "2024-03-09", SELL, 4.0, 110.0),  # a Saturday: valued from Monday
+    (1, BOURSE_DIRECT, CTO, "2024-03-12", BUY, 3.0, 50.0),
+]
+
+
+@pytest.fixture(params=[None, "America/New_York"])
+def store(request, tmp_path) -> PriceStore:
+    """Store of naive dates, and of exchange dates at midnight of a time zone like yfinance."""
+    return PriceStore(str(tmp_path / "prices"), FakeProvider(timezone=request.param))
+
+
+def expected_series(store: PriceStore, transactions: list, end: datetime.date) -> tuple:
+    """Value and invested capital of the whole portfolio on each trading day, transaction by transaction."""
+    isins = sorted({ISINS[isin_id] for isin_id, *_ in transactions})
+    dates, close = store.matrix(isins, transactions[0][3], end, fill="ffill")
+    value, invested = np.zeros(len(dates)), np.zeros(len(dates))
+    for isin_id, _, _, day, order, quantity, price in transactions:
+        signed = quantity if order == BUY else -quantity
+        held = dates >= np.datetime64(day)
+        value += np.where(held, signed * close[:, isins.index(ISINS[isin_id])], 0.0)
+        invested += np.where(held, signed * price, 0.0)
+    return dates, value, invested
+
+
+def test_series_match_hand_computation(ledger, store):
+    engine = ValuationEngine(ledger(*TRANSACTIONS), store)
+    result = engine.update(END)
+    assert result["applied"] == len(TRANSACTIONS)
+
+    series = engine.series()
+    dates, value, invested = expected_series(store, TRANSACTIONS, END)
+    assert np.array_equal(series["date"], dates)
+    assert series["names"] == ["total"]
+    np.testing.assert_allclose(series["value"][:, 0], value)
+    np.testing.assert_allclose(series["invested"][:, 0], invested)
+    np.testing.assert_allclose(series["pnl"][:, 0], value - invested)
+    # 10 bought at 100, 4 sold at 110, 5 bought at 200 and 3 at 50
+    assert series["invested"][-1, 0] == pytest.approx(1000 - 440 + 1000 + 150)
+
+
+def test_series_by_account(ledger, store):
+    engine = ValuationEngine(ledger(*TRANSACTIONS), store)
+    engine.update(END)
+
+    total = engine.series()
+    by_account = engine.series("account_name")
+    assert by_account["names"] == ["CTO", "PEA"]
+    np.testing.assert_allclose(by_account["value"].sum(axis=1), total["value"][:, 0])
+    # The PEA only holds 6 US0846707026 after the SELL
+    dates, close = store.matrix([ISINS[5]], END, END)
+    assert by_account["value"][-1, 1] == pytest.approx(6 * close[0, 0])
+
+
+def test_incremental_update_equals_rebuild(ledger, store):
+    db_file = ledger(*TRANSACTIONS[:2])
+    engine = ValuationEngine(db_file, store)
+    engine.update(datetime.date(2024, 3, 8))
+
+    ledger(*TRANSACTIONS[2:])
+    result = engine.update(END)
+    assert result == {**result, "applied": 2, "rebuilt": False}
+
+    rebuilt = ValuationEngine(db_file, store)
+    rebuilt.update(END, rebuild=True)
+    for by in (None, "account_name", "broker_name"):
+        incremental, expected = engine.series(by), rebuilt.series(by)
+        assert incremental["names"] == expected["names"]
+        assert np.array_equal(incremental["date"], expected["date"])
+        np.testing.assert_allclose(incremental["value"], expected["value"])
+        np.testing.assert_allclose(incremental["invested"], expected["invested"])
+
+
+def test_backdated_transaction_rebuilds(ledger, store):
+    engine = ValuationEngine(ledger(*TRANSACTIONS), store)
+    engine.update(END)
+
+    backdated = (6, TRADE_REPUBLIC, CTO, "2024-03-05", BUY, 1.0, 190.0)
+    ledger(backdated)
+    assert engine.update(END)["rebuilt"]
+
+    dates, value, invested = expected_series(store, [TRANSACTIONS[0], backdated, *TRANSACTIONS[1:]], END)
+    np.testing.assert_allclose(engine.series()["value"][:, 0], value)
+    np.testing.assert_allclose(engine.series()["invested"][:, 0], invested)